@@ -13,28 +13,35 @@
 
 import os
 import sys
+import tempfile
 import bpy
 import bmesh
 import platform
 
 from dataclasses import dataclass
 from dataclasses import field
+from dataclasses import asdict
 from typing import List
 
-from io import StringIO
+from io import StringIO, BytesIO
 import struct
 
 import subprocess
 import threading
 from threading import Thread
 from queue import Queue, Empty
+from collections import Counter
 import string
 
 import uuid
+import json
+import time
 
 
 import importlib
 
+import numpy as np
+
 bl_info = {
     "name": "Blender Xatlas",
     "description": "Unwrap Objects with Xatlas, 'A cleaned up version of thekla_atlas'",
@@ -54,6 +61,14 @@ if type(__safe_path__) == list:
 
 sys.path.append(__safe_path__)
 
+from . import xatlas_protocol
+from . import mesh_data
+from . import xatlas_runner
+from . import unwrap_cache
+from . import xatlas_library
+from . import auto_options
+
+from bpy.app.handlers import persistent
 from bpy.utils import register_class, unregister_class
 from bpy.props import (
     StringProperty,
@@ -83,6 +98,14 @@ class PG_PackProperties(PropertyGroup):
         default=False,
     )
 
+    packTimeLimit: FloatProperty(
+        name="Pack Time Limit (s)",
+        description="Seconds Brute Force may spend placing charts, the charts left after that are placed with the random placement. 0 means no limit.",
+        default=0.0,
+        min=0.0,
+        max=86400.0,
+    )
+
     resolution: IntProperty(
         name="Texture Resolution (px)",
         description="Resolution of goal texture",
@@ -191,11 +214,262 @@ class PG_ChartProperties(PropertyGroup):
     )
 
 
+def get_option_arguments(options, overrides=None):
+    # every property is passed as -name value, bools as -name
+    # overrides has values to use instead of the ones of the properties
+    if overrides is None:
+        overrides = dict()
+    arguments = []
+    for argumentKey in options.__annotations__.keys():
+        attrib = overrides.get(argumentKey, getattr(options, argumentKey))
+        if type(attrib) == bool:
+            if attrib:
+                arguments.append("-" + argumentKey)
+        else:
+            arguments += ["-" + argumentKey, str(attrib)]
+    return arguments
+
+
+def get_xatlas_arguments(packOptions, chartOptions, sharedProperties, autoChoice=None):
+    # the options auto_options picked win over the ones of the panels
+    packOverrides = autoChoice.pack if autoChoice is not None else None
+    chartOverrides = autoChoice.chart if autoChoice is not None else None
+    arguments = get_option_arguments(packOptions, packOverrides)
+    arguments += get_option_arguments(chartOptions, chartOverrides)
+
+    # add pack only option
+    if sharedProperties.packOnly:
+        arguments.append("-packOnly")
+    if sharedProperties.chartImages != "NONE":
+        arguments.append("-chartImage")
+
+    arguments += ["-atlasLayout", sharedProperties.atlasLayout]
+
+    # how xatlas runs, the atlas doesn't change with them
+    if sharedProperties.threadCount:
+        arguments += ["-threads", str(sharedProperties.threadCount)]
+    if sharedProperties.cpuSet.strip():
+        arguments += ["-cpus", sharedProperties.cpuSet.replace(" ", "")]
+    return arguments
+
+
+def get_xatlas_job(meshDataList, arguments, useBinary, useWorker, progress=False):
+    # the (arguments, inputData) of one xatlas run
+    if useBinary and progress:
+        # PROG chunks for a RunControl
+        arguments = arguments + ["-progress"]
+    if useBinary and not useWorker:
+        arguments = arguments + ["-binary"]
+    if useBinary:
+        binaryFile = BytesIO()
+        # the worker reads the options of each job from the ARGS chunk
+        mesh_data.write_binary_meshes(
+            binaryFile, meshDataList, arguments if useWorker else None
+        )
+        return arguments, binaryFile.getvalue()
+    fakeFile = StringIO()
+    mesh_data.write_obj_text(fakeFile, meshDataList)
+    # print just for reference
+    # print(fakeFile.getvalue())
+    # The \n is needed to end the input properly
+    return arguments, bytes(fakeFile.getvalue() + "\n", "UTF-8")
+
+
+def get_cache_directory(preferences):
+    directory = bpy.path.abspath(preferences.cacheDirectory)
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), "blender_xatlas_cache")
+    return directory
+
+
+def get_unwrap_cache(context):
+    preferences = context.preferences.addons[addon_name].preferences
+    if not preferences.useCache:
+        return None
+    return unwrap_cache.UnwrapCache(
+        get_cache_directory(preferences), preferences.cacheSizeLimit * 1024 * 1024
+    )
+
+
+def get_chart_store(context):
+    # chart layouts of incremental unwraps, kept whether or not the cache is on
+    # and limited on their own, Clear Cache removes them too
+    preferences = context.preferences.addons[addon_name].preferences
+    return unwrap_cache.UnwrapCache(
+        os.path.join(get_cache_directory(preferences), "charts"),
+        preferences.cacheSizeLimit * 1024 * 1024,
+    )
+
+
+def load_chart_layouts(
+    context, meshDataList, chartOptions, xatlas_path, chartOverrides=None
+):
+    """Give every mesh that was unwrapped before, unchanged and with the same
+    chart options, its stored chart layout. Returns the keys to store new ones"""
+    chartStore = get_chart_store(context)
+    chartArguments = get_option_arguments(chartOptions, chartOverrides)
+    chartKeys = dict()
+    for meshData in meshDataList:
+        chartKeys[meshData.name] = unwrap_cache.job_key(
+            [meshData], chartArguments, xatlas_path
+        )
+        data = chartStore.get_bytes(chartKeys[meshData.name])
+        if data is not None and len(data) == len(meshData.positions) * 8:
+            meshData.charts = np.frombuffer(data, dtype=np.float32).reshape(-1, 2)
+    return chartStore, chartKeys
+
+
+def run_xatlas_jobs(
+    cache,
+    jobMeshes,
+    arguments,
+    useBinary,
+    useWorker,
+    jobCount,
+    targetCount=1,
+    control=None,
+    cacheStats=None,
+    library=None,
+    firstJob=0,
+    jobArguments=None,
+):
+    """Yield (meshData, result) for every mesh of every job and every target.
+    Jobs found in the unwrap cache don't run xatlas at all, with a library
+    the others run in this process. firstJob is for run_jobs, jobArguments
+    has the arguments each job gets on top of arguments.
+    Leaves bpy alone so it can run in the background, the cache hits and
+    misses are counted in cacheStats"""
+    if cacheStats is None:
+        cacheStats = Counter()
+    xatlas_path = xatlas_runner.get_xatlas_path()
+    if jobArguments is None:
+        jobArguments = [[]] * len(jobMeshes)
+    keys = dict()
+    pendingJobs = []
+    for jobIndex, meshes in enumerate(jobMeshes):
+        if cache is not None:
+            keys[jobIndex] = unwrap_cache.job_key(
+                meshes,
+                arguments + jobArguments[jobIndex] + ["-binary"] * useBinary,
+                xatlas_path,
+            )
+            cached = cache.get(keys[jobIndex])
+            if cached is not None and len(cached) == len(meshes) * targetCount:
+                cacheStats["hits"] += 1
+                # stored by target, then in input order
+                yield from zip(meshes * targetCount, cached)
+                continue
+            cacheStats["misses"] += 1
+        pendingJobs.append(jobIndex)
+
+    meshJobs = dict()
+    for jobIndex in pendingJobs:
+        for meshData in jobMeshes[jobIndex]:
+            meshJobs[meshData.name] = (jobIndex, meshData)
+    jobResults = {jobIndex: dict() for jobIndex in pendingJobs}
+    if library is not None:
+        # nothing to serialize, the library reads the arrays of the meshes
+        jobs = [
+            (arguments + jobArguments[jobIndex], jobMeshes[jobIndex])
+            for jobIndex in pendingJobs
+        ]
+    else:
+        jobs = [
+            get_xatlas_job(
+                jobMeshes[jobIndex],
+                arguments + jobArguments[jobIndex],
+                useBinary,
+                useWorker,
+                control is not None,
+            )
+            for jobIndex in pendingJobs
+        ]
+    for result in xatlas_runner.run_jobs(
+        xatlas_path, jobs, useBinary, useWorker, jobCount, control, library, firstJob
+    ):
+        jobIndex, meshData = meshJobs[result.name]
+        yield meshData, result
+        if cache is not None:
+            meshes = jobMeshes[jobIndex]
+            finished = jobResults[jobIndex]
+            finished[result.target, result.name] = result
+            if len(finished) == len(meshes) * targetCount:
+                cache.put(
+                    keys[jobIndex],
+                    [
+                        finished[target, meshData.name]
+                        for target in range(targetCount)
+                        for meshData in meshes
+                    ],
+                )
+
+
+def get_lightmap_targets(sharedProperties):
+    """(resolution, padding) of every lightmap target, none uses the pack options.
+    Raises ValueError when lightmapTargets can't be read"""
+    targets = []
+    for target in sharedProperties.lightmapTargets.replace(",", " ").split():
+        resolution, padding = target.split(":")
+        targets.append((int(resolution), int(padding)))
+    return targets
+
+
+def get_lightmap_uv_names(sharedProperties, uvName, targets):
+    # one uv layer for each target
+    if not targets:
+        return [uvName]
+    return [
+        sharedProperties.lightmapTargetPattern.format(
+            name=uvName, resolution=resolution, padding=padding
+        )
+        for resolution, padding in targets
+    ]
+
+
+def get_material_groups(sharedProperties):
+    # the material names of every group of materialGroups, in order
+    groups = []
+    for group in sharedProperties.materialGroups.split(";"):
+        names = [name.strip() for name in group.split(",") if name.strip()]
+        if names:
+            groups.append(names)
+    return groups
+
+
+# the items of selectedCollection, built again only after the collections
+# change (collection_names_changed) instead of on every redraw. Blender also
+# needs the strings of enum items kept alive
+collection_names = None
+
+
 def get_collectionNames(self, context):
-    colllectionNames = []
-    for collection in bpy.data.collections:
-        colllectionNames.append((collection.name, collection.name, ""))
-    return colllectionNames
+    global collection_names
+    if collection_names is None:
+        collection_names = [
+            (collection.name, collection.name, "")
+            for collection in bpy.data.collections
+        ]
+    return collection_names
+
+
+@persistent
+def collection_names_changed(scene, depsgraph):
+    # a collection was added, removed or renamed
+    global collection_names
+    if depsgraph.id_type_updated("COLLECTION"):
+        collection_names = None
+
+
+@persistent
+def collection_names_reset(*args):
+    # another file was loaded, or undo and redo brought back other collections
+    # without a depsgraph update of them
+    global collection_names
+    collection_names = None
+
+
+# every handler collection_names_reset goes on
+COLLECTION_RESET_HANDLERS = ("load_post", "undo_post", "redo_post")
 
 
 def gen_safe_name():
@@ -213,9 +487,18 @@ class PG_SharedProperties(PropertyGroup):
             ("SELECTED", "Selection", ""),
             ("ALL", "All", ""),
             ("COLLECTION", "Collection", ""),
+            ("COLLECTIONS", "Each Collection", "Unwrap every collection into its own atlas, reading the next ones while xatlas works on one"),
         ],
     )
 
+    pipelineDepth: IntProperty(
+        name="Queue Depth",
+        description="How many collections are read ahead and wait for xatlas while it unwraps one with Each Collection. Each of them keeps its meshes in memory until xatlas gets to it",
+        default=1,
+        min=1,
+        max=64,
+    )
+
     atlasLayout: EnumProperty(
         name="",
         description="How to Layout the atlases",
@@ -270,88 +553,191 @@ class PG_SharedProperties(PropertyGroup):
         default="UVMap_Lightmap",
     )
 
+    lightmapTargets: StringProperty(
+        name="Targets",
+        description="Pack the same charts at several resolutions, each into its own lightmap uv. A list of resolution:padding, like 256:2, 512:4, 1024:8. Leave empty to use the Pack Options",
+        default="",
+    )
+
+    lightmapTargetPattern: StringProperty(
+        name="Layer Names",
+        description="Name of the lightmap uv of each target. {name} is the lightmap uv name, {resolution} and {padding} come from the target",
+        default="{name}_{resolution}",
+    )
+
     packOnly: BoolProperty(
         name="Pack Only",
         description="Don't unwrap the meshes, only, pack them",
         default=False,
     )
 
+    selectedFacesOnly: BoolProperty(
+        name="Selected Faces Only",
+        description="Only unwrap the faces selected in edit mode and pack their new charts into the space left by the other faces, which keep their lightmap uvs. Needs a Resolution, always uses the binary transport",
+        default=False,
+    )
+
+    unwrapSharedMeshesOnce: BoolProperty(
+        name="Unwrap Shared Meshes Once",
+        description="Objects sharing a mesh keep sharing it and the mesh is only unwrapped once, sized by the first of its objects. When off every object gets its own copy of the mesh",
+        default=False,
+    )
+
     individualAtlasPerObject: BoolProperty(
         name="Individual Atlas Per Object",
         description="Each object will be unwrapped separately using the full atlas space. Useful for exporting to game engines.",
         default=False,
     )
 
+    materialAtlases: BoolProperty(
+        name="Atlas Per Material",
+        description="Give each material group its own atlas, packed at the same time as the others. Spread X and UDIM put every group on its own tiles, Overlap stacks them",
+        default=False,
+    )
 
-# end PropertyGroups---------------------------
+    materialGroups: StringProperty(
+        name="Material Groups",
+        description="Materials that share an atlas, groups split by ; and materials by , like Brick, Plaster; Glass. Every other material gets an atlas of its own",
+        default="",
+    )
 
+    materialTiles: IntProperty(
+        name="Tiles Per Material",
+        description="How many atlases each material group may fill before the next group starts, charts past them overlap the next group",
+        default=1,
+        min=1,
+        max=100,
+    )
 
-# begin operators------------------------------
-class Setup_Unwrap(bpy.types.Operator):
-    bl_idname = "object.setup_unwrap"
-    bl_label = "Select the objects to be unwrapped"
-    bl_options = {"REGISTER", "UNDO"}
+    incrementalUnwrap: BoolProperty(
+        name="Only Chart Changed Objects",
+        description="Reuse the charts of objects that haven't changed since their last unwrap and only pack them again. Always uses the binary transport",
+        default=False,
+    )
 
-    def execute(self, context):
-        sharedProperties = bpy.context.scene.shared_properties
-        # sharedProperties.unwrapSelection
+    parallelJobs: IntProperty(
+        name="Parallel Jobs",
+        description="How many objects (Individual Atlas Per Object) or material groups (Atlas Per Material) to unwrap at the same time, each in its own xatlas process",
+        default=1,
+        min=1,
+        max=256,
+    )
 
-        # save whatever mode the user was in
-        startingMode = bpy.context.object.mode
-        startingSelection = bpy.context.selected_objects
-        startingActiveObject = context.view_layer.objects.active
-        bpy.ops.object.mode_set(mode="OBJECT")
-
-        # get all the currently selected objects
-        selected_objects = None
-        if sharedProperties.unwrapSelection == "SELECTED":
-            selected_objects = bpy.context.selected_objects
-        elif sharedProperties.unwrapSelection == "ALL":
-            bpy.ops.object.select_all(action="DESELECT")
-            for object in bpy.context.scene.objects:
-                current_object = object
-                if current_object.type == "MESH":
-                    current_object.select_set(True)
-            selected_objects = bpy.context.selected_objects
-        elif sharedProperties.unwrapSelection == "COLLECTION":
-            bpy.ops.object.select_all(action="DESELECT")
-            for collection in bpy.data.collections:
-                # print(collection.name)
-                if collection.name == sharedProperties.selectedCollection:
-                    for current_object in collection.all_objects:
-                        if current_object.type == "MESH":
-                            current_object.select_set(True)
-            selected_objects = bpy.context.selected_objects
+    chartImages: EnumProperty(
+        name="Chart Images",
+        description="Keep the chart index image xatlas makes of every atlas, for bake masks and dilation. Always uses the binary transport",
+        items=[
+            ("NONE", "Off", "Don't keep the chart images"),
+            ("NPY", "NumPy Files", "Save a .npy file of the chart index and flag bits of every texel, np.load can memory map it"),
+            ("IMAGE", "Images", "Pack a float image into the file, the chart index in red (-1 for no chart), padding in green and bilinear in blue"),
+        ],
+    )
 
-        if sharedProperties.individualAtlasPerObject:
-            for obj in selected_objects:
-                bpy.ops.object.select_all(action="DESELECT")
-                obj.select_set(True)
-                context.view_layer.objects.active = obj
-                Unwrap_Lightmap_Group_Xatlas_2.execute(self, context)
-        else:
-            Unwrap_Lightmap_Group_Xatlas_2.execute(self, context)
+    chartImageDirectory: StringProperty(
+        name="Folder",
+        description="Where the .npy chart images are saved, named after the lightmap uv and atlas",
+        default="//xatlas_charts",
+        subtype="DIR_PATH",
+    )
+
+    batchMemoryLimit: IntProperty(
+        name="Batch Memory (MB)",
+        description="Split the objects into batches that each need about this much memory in xatlas and unwrap them one after the other, each into its own atlas. Spread X and UDIM give every batch its own tiles. 0 unwraps everything at once",
+        default=0,
+        min=0,
+        max=1024 * 1024,
+    )
 
-        # reset everything--------------------------------------------
-        bpy.ops.object.select_all(action="DESELECT")
-        for objects in startingSelection:
-            objects.select_set(True)
-        context.view_layer.objects.active = startingActiveObject
-        bpy.ops.object.mode_set(mode=startingMode)
-        # bpy.context.selected_objects = startingSelection
+    useBinaryTransport: BoolProperty(
+        name="Binary Transport",
+        description="Send meshes to xatlas as raw binary arrays instead of OBJ text. Much faster on large meshes",
+        default=False,
+    )
 
-        return {"FINISHED"}
+    useWorkerProcess: BoolProperty(
+        name="Keep xatlas Running",
+        description="Reuse one xatlas process for every unwrap instead of starting a new one each time. Always uses the binary transport",
+        default=False,
+    )
 
+    useInProcessLibrary: BoolProperty(
+        name="Run xatlas In Blender",
+        description="Run xatlas inside Blender from its shared library, without a process or copying the meshes. Falls back to the xatlas process when the library isn't there. Cancelling can take longer",
+        default=False,
+    )
 
-# Unwrap Lightmap Group Xatlas
-class Unwrap_Lightmap_Group_Xatlas_2(bpy.types.Operator):
-    bl_idname = "object.unwrap_lightmap_group_xatlas_2"
-    bl_label = "Unwrap Lightmap Group Xatlas"
-    bl_options = {"REGISTER", "UNDO"}
+    threadCount: IntProperty(
+        name="xatlas Threads",
+        description="How many threads each xatlas job runs on, 0 uses every core. Parallel jobs get this many each",
+        default=0,
+        min=0,
+        max=1024,
+    )
 
-    def execute(self, context):
-        # will attempt to run on all selected objects
+    cpuSet: StringProperty(
+        name="CPUs",
+        description="Pin the xatlas threads to these cpus, like 0-7,16. Leave empty to run on any. Not supported on macOS",
+        default="",
+    )
+
+    autoOptions: BoolProperty(
+        name="Auto Options",
+        description="Pick Brute Force, blockAlign and maxIterations from the size of the meshes so the unwrap fits in the Time Budget, lowering the resolution only when even the fastest options don't. Estimated from the calibration table made by benchmark.py --calibrate",
+        default=False,
+    )
+
+    autoTimeBudget: FloatProperty(
+        name="Time Budget (s)",
+        description="How long the unwrap may take with Auto Options",
+        default=60.0,
+        min=1.0,
+        max=86400.0,
+    )
+
+
+# end PropertyGroups---------------------------
+
+
+# begin operators------------------------------
+# the report of the last unwrap, a text datablock so it is saved with the file
+REPORT_TEXT_NAME = "xatlas_report.json"
+
+
+class UnwrapRun:
+    """One unwrap of the selected objects.
+    prepare, apply and finish need the main thread, the xatlas jobs in
+    between can run in the background (start_thread) for a modal operator"""
+
+    def __init__(self):
+        self.cacheStats = Counter()
+        self.unwrappedCount = 0
+        self.atlasStats = dict()  # id: AtlasStats of every atlas the results came from
+        self.queue = Queue()
+        self.control = xatlas_runner.RunControl()
+        self.timings = Counter()  # seconds of each stage, see get_report
+        self.jobMeshes = []
+        self.batched = False  # jobMeshes are batches to run one after the other
+        self.triangleCount = 0
+        self.vertexCount = 0
+        self.fixedTriangleCount = 0  # kept their lightmap uvs, Selected Faces Only
+        self.atlasLayout = "OVERLAP"
+        self.threadCount = 0
+        self.cpuSet = ""
+        self.autoChoice = None  # auto_options.AutoChoice with Auto Options
+        self.chartImages = "NONE"
+        self.chartImageNames = []  # of the images and .npy files saved
+        self.jobArguments = None  # extra arguments of each job, Atlas Per Material
+        self.meshGroups = dict()  # name: material group of the split meshes
+        self.materialGroups = []  # materials and firstAtlas of every group
+        self.materialTiles = 1
+        self.materialOverflow = False  # a group filled more than its tiles
+
+    def prepare(self, operator, context, objects=None):
+        """Set up the lightmap uvs and read the meshes of objects.
+        Returns the operator result when there is nothing to run"""
+        # will attempt to run on all selected objects unless told otherwise
         # it is up to something else to do that selecting
+        start = time.perf_counter()
 
         # get all the options for xatlas
         packOptions = bpy.context.scene.pack_tool
@@ -361,29 +747,65 @@ class Unwrap_Lightmap_Group_Xatlas_2(bpy.types.Operator):
         # sharedProperties.unwrapSelection
 
         # save whatever mode the user was in
-        startingMode = bpy.context.object.mode
-        selected_objects = bpy.context.selected_objects
+        self.startingMode = "OBJECT"
+        if bpy.context.object is not None:
+            self.startingMode = bpy.context.object.mode
+        selected_objects = objects
+        if selected_objects is None:
+            selected_objects = bpy.context.selected_objects
 
         # check something is actually selected
         # external function/operator will select them
         if len(selected_objects) == 0:
             print("Nothing Selected")
-            self.report({"WARNING"}, "Nothing Selected, please select Something")
+            operator.report({"WARNING"}, "Nothing Selected, please select Something")
             return {"FINISHED"}
 
+        try:
+            targets = get_lightmap_targets(sharedProperties)
+            get_lightmap_uv_names(sharedProperties, "", targets)
+        except (ValueError, KeyError, IndexError):
+            operator.report(
+                {"ERROR"},
+                "Lightmap targets should look like 256:2, 512:4 and the layer names can only use {name}, {resolution} and {padding}",
+            )
+            return {"CANCELLED"}
+        selectedFacesOnly = sharedProperties.selectedFacesOnly
+        if selectedFacesOnly and targets:
+            operator.report(
+                {"ERROR"},
+                "Selected Faces Only packs into the lightmap uv, it can't be used with lightmap targets",
+            )
+            return {"CANCELLED"}
+        materialAtlases = sharedProperties.materialAtlases
+        if selectedFacesOnly and materialAtlases:
+            operator.report(
+                {"ERROR"},
+                "Selected Faces Only packs around every kept face, it can't be used with Atlas Per Material",
+            )
+            return {"CANCELLED"}
+
         # store the names of objects to be lightmapped
         rename_dict = dict()
         safe_dict = dict()
+        lightmap_dict = dict()
+        # with Selected Faces Only these have no lightmap uvs to keep yet
+        new_lightmaps = set()
 
         # make sure all the objects have ligthmap uvs
+        sharedMeshes = set()
         for obj in selected_objects:
             if obj.type == "MESH":
+                if sharedProperties.unwrapSharedMeshesOnce:
+                    # the first user unwraps the mesh for all of them
+                    if obj.data.as_pointer() in sharedMeshes:
+                        continue
+                    sharedMeshes.add(obj.data.as_pointer())
+                elif obj.data.users > 1:
+                    obj.data = obj.data.copy()  # make single user copy
                 safe_name = gen_safe_name()
                 rename_dict[obj.name] = (obj.name, safe_name)
                 safe_dict[safe_name] = obj.name
-                context.view_layer.objects.active = obj
-                if obj.data.users > 1:
-                    obj.data = obj.data.copy()  # make single user copy
                 uv_layers = obj.data.uv_layers
 
                 # setup the lightmap uvs
@@ -394,315 +816,950 @@ class Unwrap_Lightmap_Group_Xatlas_2(bpy.types.Operator):
                     if sharedProperties.lightmapUVIndex < len(uv_layers):
                         uvName = uv_layers[sharedProperties.lightmapUVIndex].name
 
-                if not uvName in uv_layers:
-                    uvmap = uv_layers.new(name=uvName)
-                    uv_layers.active_index = len(uv_layers) - 1
-                else:
-                    for i in range(0, len(uv_layers)):
-                        if uv_layers[i].name == uvName:
-                            uv_layers.active_index = i
-                obj.select_set(True)
-
-        # save all the current edges
-        if sharedProperties.packOnly:
-            edgeDict = dict()
-            for obj in selected_objects:
-                if obj.type == "MESH":
-                    tempEdgeDict = dict()
-                    tempEdgeDict["object"] = obj.name
-                    tempEdgeDict["edges"] = []
-                    print(len(obj.data.edges))
-                    for i in range(0, len(obj.data.edges)):
-                        setEdge = obj.data.edges[i]
-                        tempEdgeDict["edges"].append(i)
-                    edgeDict[obj.name] = tempEdgeDict
-
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_all(action="SELECT")
-            bpy.ops.mesh.quads_convert_to_tris(
-                quad_method="FIXED", ngon_method="BEAUTY"
+                uvNames = get_lightmap_uv_names(sharedProperties, uvName, targets)
+                if not uvNames[0] in uv_layers:
+                    new_lightmaps.add(safe_name)
+                for uvName in uvNames:
+                    if not uvName in uv_layers:
+                        uvmap = uv_layers.new(name=uvName)
+                        uv_layers.active_index = len(uv_layers) - 1
+                    else:
+                        for i in range(0, len(uv_layers)):
+                            if uv_layers[i].name == uvName:
+                                uv_layers.active_index = i
+                lightmap_dict[safe_name] = uvNames
+        self.rename_dict = rename_dict
+        self.lightmap_dict = lightmap_dict
+
+        # xatlas works on the loop triangles and the results go back per loop,
+        # so the topology of the meshes is never touched
+        if context.mode != "OBJECT":
+            # edits made in edit mode aren't in the mesh data yet
+            bpy.ops.object.mode_set(mode="OBJECT")
+
+        # read the evaluated meshes straight into arrays
+        depsgraph = context.evaluated_depsgraph_get()
+        meshDataList = []
+        for obj in selected_objects:
+            if obj.name in rename_dict:
+                safe_name = rename_dict[obj.name][1]
+                keptUVName = None
+                if selectedFacesOnly and safe_name not in new_lightmaps:
+                    keptUVName = lightmap_dict[safe_name][0]
+                meshDataList.append(
+                    mesh_data.extract_mesh_data(
+                        obj,
+                        safe_name,
+                        depsgraph,
+                        sharedProperties,
+                        keptUVName,
+                        materialAtlases,
+                    )
+                )
+        texelsPerUnit = 0.0
+        if selectedFacesOnly:
+            status = self.keep_unselected_faces(operator, meshDataList, packOptions)
+            if status is not None:
+                return status
+            texelsPerUnit = mesh_data.fixed_texels_per_unit(
+                meshDataList, packOptions.resolution
             )
-        else:
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_all(action="SELECT")
-            bpy.ops.mesh.quads_convert_to_tris(
-                quad_method="FIXED", ngon_method="BEAUTY"
+            meshDataList = mesh_data.drop_unselected(
+                meshDataList, sharedProperties.individualAtlasPerObject
             )
+        # the mesh arrays of a batch are let go of once it is done
+        self.triangleCount = sum(
+            len(meshData.indices) // 3 for meshData in meshDataList
+        )
+        self.vertexCount = sum(len(meshData.positions) for meshData in meshDataList)
 
-        bpy.ops.object.mode_set(mode="OBJECT")
-
-        # Create a fake obj export to a string
-        # Will strip this down further later
-        fakeFile = StringIO()
-        bpy.ops.wm.obj_export(
-            rename_dict=rename_dict,
-            context=bpy.context,
-            filepath=fakeFile,
-            mainUVChoiceType=sharedProperties.mainUVChoiceType,
-            uvIndex=sharedProperties.mainUVIndex,
-            uvName=sharedProperties.mainUVName,
-            use_selection=True,
-            use_animation=False,
-            use_mesh_modifiers=True,
-            use_edges=True,
-            use_smooth_groups=False,
-            use_smooth_groups_bitflags=False,
-            use_normals=True,
-            use_uvs=True,
-            use_materials=False,
-            use_triangles=False,
-            use_nurbs=False,
-            use_vertex_groups=False,
-            use_blen_objects=True,
-            group_by_object=False,
-            group_by_material=False,
-            keep_vertex_order=True,
+        # one atlas for everything, one for each object or one for each batch
+        self.batched = False
+        if sharedProperties.individualAtlasPerObject:
+            self.jobMeshes = [[meshData] for meshData in meshDataList]
+        elif (
+            sharedProperties.batchMemoryLimit > 0
+            and not selectedFacesOnly
+            and not materialAtlases
+        ):
+            self.jobMeshes = mesh_data.split_batches(
+                meshDataList, sharedProperties.batchMemoryLimit * 1024 * 1024
+            )
+            self.batched = len(self.jobMeshes) > 1
+            print("Unwrapping in %d batches" % len(self.jobMeshes))
+        else:
+            self.jobMeshes = [meshDataList]
+        self.jobArguments = None
+        self.jobCount = 1 if self.batched else sharedProperties.parallelJobs
+        if materialAtlases:
+            self.split_materials(context, sharedProperties)
+            meshDataList = [
+                meshData for meshes in self.jobMeshes for meshData in meshes
+            ]
+        self.meshCount = len(meshDataList)
+
+        self.autoChoice = None
+        if sharedProperties.autoOptions:
+            self.autoChoice = choose_auto_options(
+                operator, context, self.jobMeshes, self.jobCount, targets
+            )
+        arguments = get_xatlas_arguments(
+            packOptions, chartOptions, sharedProperties, self.autoChoice
+        )
+        if self.fixedTriangleCount and packOptions.texelsPerUnit <= 0.0:
+            # the new charts get the texel density of the ones they go next to,
+            # at the resolution xatlas packs at
+            if self.autoChoice is not None:
+                texelsPerUnit *= self.autoChoice.resolution / packOptions.resolution
+            arguments += ["-texelsPerUnit", "%g" % texelsPerUnit]
+        print(arguments)
+
+        # only the objects that changed since their last unwrap get new charts
+        self.chartStore = None
+        incremental = (
+            sharedProperties.incrementalUnwrap and not sharedProperties.packOnly
+        )
+        if incremental:
+            self.chartStore, self.chartKeys = load_chart_layouts(
+                context,
+                meshDataList,
+                chartOptions,
+                xatlas_runner.get_xatlas_path(),
+                self.autoChoice.chart if self.autoChoice is not None else None,
+            )
+            arguments.append("-incremental")
+
+        # the charts are computed once and packed for each target
+        for resolution, padding in targets:
+            arguments += ["-target", str(resolution), str(padding)]
+        self.arguments = arguments
+        self.targetCount = max(1, len(targets))
+
+        self.useWorker = sharedProperties.useWorkerProcess
+        self.library = None
+        if sharedProperties.useInProcessLibrary:
+            self.library = xatlas_library.load_library()
+            if self.library is None:
+                print("No xatlas library, running the xatlas process instead")
+        self.useBinary = (
+            sharedProperties.useBinaryTransport
+            or self.useWorker
+            or incremental
+            or bool(targets)
+            or self.library is not None
+            or sharedProperties.chartImages != "NONE"
+            or selectedFacesOnly
         )
+        self.chartImages = sharedProperties.chartImages
+        self.chartImageDirectory = bpy.path.abspath(
+            sharedProperties.chartImageDirectory
+        )
+        self.individualAtlas = sharedProperties.individualAtlasPerObject
+        self.atlasLayout = sharedProperties.atlasLayout
+        self.threadCount = sharedProperties.threadCount
+        self.cpuSet = sharedProperties.cpuSet.strip()
+        self.cache = get_unwrap_cache(context)
+        self.timings["prepare"] = time.perf_counter() - start
+        return None
+
+    def split_materials(self, context, sharedProperties):
+        """Split every job into one for each material group, each packed into
+        its own atlas at materialTiles * group in the layout"""
+        groups = get_material_groups(sharedProperties)
+        groupIndices = {
+            name: index for index, group in enumerate(groups) for name in group
+        }
+        # the material of each slot, one more for the faces past the slots
+        slotMaterials = dict()
+        for meshes in self.jobMeshes:
+            for meshData in meshes:
+                obj = context.blend_data.objects[meshData.objectName]
+                slotMaterials[meshData.name] = [
+                    slot.material.name if slot.material is not None else ""
+                    for slot in obj.material_slots
+                ] + [""]
+        # the materials that aren't in a group get one each, after the others
+        usedMaterials = set()
+        for meshes in self.jobMeshes:
+            for meshData in meshes:
+                materials = slotMaterials[meshData.name]
+                slots = np.unique(np.minimum(meshData.materials, len(materials) - 1))
+                usedMaterials.update(materials[slot] for slot in slots.tolist())
+        for name in sorted(usedMaterials - set(groupIndices)):
+            groupIndices[name] = len(groups)
+            groups.append([name])
+
+        jobMeshes = dict()
+        for jobIndex, meshes in enumerate(self.jobMeshes):
+            for meshData in meshes:
+                materials = slotMaterials[meshData.name]
+                slotGroups = np.array(
+                    [groupIndices[name] for name in materials], dtype=np.int32
+                )
+                triangleGroups = slotGroups[
+                    np.minimum(meshData.materials, len(materials) - 1)
+                ]
+                for group, subMeshData in mesh_data.split_triangles(
+                    meshData, triangleGroups
+                ):
+                    jobMeshes.setdefault((jobIndex, group), []).append(subMeshData)
+                    self.lightmap_dict[subMeshData.name] = self.lightmap_dict[
+                        meshData.name
+                    ]
+                    self.meshGroups[subMeshData.name] = group
+        self.jobMeshes = list(jobMeshes.values())
+        self.materialTiles = sharedProperties.materialTiles
+        self.jobArguments = [
+            ["-firstAtlas", str(group * self.materialTiles)]
+            for jobIndex, group in jobMeshes
+        ]
+        self.materialGroups = [
+            {"materials": group, "firstAtlas": index * self.materialTiles}
+            for index, group in enumerate(groups)
+        ]
+        print("Unwrapping %d material groups" % len(groups))
+
+    def keep_unselected_faces(self, operator, meshDataList, packOptions):
+        """Count the triangles that keep their lightmap uvs, returns the
+        operator result when they can't"""
+        self.fixedTriangleCount = sum(
+            len(meshData.fixedUvs) // 3
+            for meshData in meshDataList
+            if meshData.fixedUvs is not None
+        )
+        if not any(len(meshData.indices) for meshData in meshDataList):
+            operator.report(
+                {"WARNING"}, "No faces selected, select the ones to unwrap in edit mode"
+            )
+            return {"CANCELLED"}
+        if self.fixedTriangleCount and packOptions.resolution <= 0:
+            operator.report(
+                {"ERROR"},
+                "Selected Faces Only needs a Resolution to pack the new charts around the other ones",
+            )
+            return {"CANCELLED"}
+        return None
+
+    def results(self):
+        # the unwrap stage is the wall time until the last result, applying
+        # the results overlaps it
+        start = time.perf_counter()
+        if self.batched:
+            yield from self.batch_results()
+        else:
+            yield from run_xatlas_jobs(
+                self.cache,
+                self.jobMeshes,
+                self.arguments,
+                self.useBinary,
+                self.useWorker,
+                self.jobCount,
+                self.targetCount,
+                self.control,
+                self.cacheStats,
+                self.library,
+                jobArguments=self.jobArguments,
+            )
+        self.timings["unwrap"] = time.perf_counter() - start
+
+    def batch_results(self):
+        """The results of the batches, one xatlas job after the other so only
+        one batch is in memory at a time. The atlases of each batch come after
+        the ones of the batches before it in the Spread X and UDIM layouts"""
+        self.control.jobCount = len(self.jobMeshes)
+        firstAtlas = 0
+        for batchIndex, batch in enumerate(self.jobMeshes):
+            if self.control.cancelled:
+                raise xatlas_runner.Cancelled()
+            atlasCount = 1
+            for meshData, result in run_xatlas_jobs(
+                self.cache,
+                [batch],
+                self.arguments + ["-firstAtlas", str(firstAtlas)],
+                self.useBinary,
+                self.useWorker,
+                1,
+                self.targetCount,
+                self.control,
+                self.cacheStats,
+                self.library,
+                batchIndex,
+            ):
+                # the targets are laid out the same, by the one with the most
+                if result.stats is not None:
+                    atlasCount = max(atlasCount, result.stats.atlasCount)
+                yield meshData, result
+            firstAtlas += atlasCount
+            # applying the results only needs the indices
+            for meshData in batch:
+                meshData.positions = meshData.normals = None
+                meshData.uvs = meshData.charts = None
+
+    def start_thread(self):
+        """Run xatlas in a thread, the queue gets every (meshData, result)
+        and then None, or the exception it stopped on"""
+
+        Thread(target=self.put_results, daemon=True).start()
+
+    def put_results(self):
+        try:
+            for item in self.results():
+                self.queue.put(item)
+        except Exception as error:
+            self.queue.put(error)
+            return
+        self.queue.put(None)
+
+    def run(self, context):
+        """Unwrap and apply the results in this thread after prepare. Like
+        UnwrapPipeline.run it returns the exception it stopped on, the mode
+        is restored and the report written either way"""
+        error = None
+        try:
+            for meshData, result in self.results():
+                self.apply(context, meshData, result)
+        except Exception as runError:
+            error = runError
+        self.finish(context, get_run_status(error))
+        return error
+
+    def apply_queued(self, context):
+        """Apply the results that arrived so far without waiting.
+        Returns (finished, the exception the thread stopped on)"""
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                return False, None
+            if item is None:
+                return True, None
+            if isinstance(item, Exception):
+                return True, item
+            self.apply(context, *item)
+
+    def apply(self, context, meshData, result):
+        # copy the uvs to the original objects
+        start = time.perf_counter()
+        obj = context.scene.objects.get(meshData.objectName)
+        if obj is None:
+            return  # deleted while xatlas was running
+        mesh_data.write_lightmap_uvs(
+            obj.data,
+            self.lightmap_dict[meshData.name][result.target],
+            mesh_data.get_triangle_loops(meshData),
+            np.frombuffer(result.uvs, dtype=np.float32).reshape(-1, 2),
+            np.frombuffer(result.indices, dtype=np.uint32),
+            keep=meshData.loops is not None,
+        )
+        if self.chartStore is not None and result.charts is not None:
+            self.chartStore.put_bytes(self.chartKeys[meshData.name], result.charts)
+        if result.stats is not None:
+            self.atlasStats[id(result.stats)] = result.stats
+            if (
+                meshData.name in self.meshGroups
+                and result.stats.atlasCount > self.materialTiles
+            ):
+                self.materialOverflow = True
+        if result.images is not None:
+            self.save_chart_images(context, meshData, result)
+        # the results of a job come one target after the other
+        if result.target == self.targetCount - 1:
+            self.unwrappedCount += 1
+        self.timings["apply"] += time.perf_counter() - start
+
+    def save_chart_images(self, context, meshData, result):
+        # once per atlas, named after the lightmap uv and its place in the layout
+        uvName = self.lightmap_dict[meshData.name][result.target]
+        for image in result.images:
+            name = "%s_%d" % (uvName, image.atlas)
+            if self.individualAtlas:
+                name = "%s_%s" % (meshData.objectName, name)
+            if name in self.chartImageNames:
+                continue
+            self.chartImageNames.append(name)
+            if self.chartImages == "NPY":
+                os.makedirs(self.chartImageDirectory, exist_ok=True)
+                np.save(
+                    os.path.join(self.chartImageDirectory, name + ".npy"),
+                    mesh_data.chart_image_array(image),
+                )
+            else:
+                mesh_data.write_chart_image(context.blend_data, name, image)
+
+    def finish(self, context, status="ok", writeReport=True):
+        """Restore the mode and write the report of the run, status says how
+        it ended"""
+        start = time.perf_counter()
+        preferences = context.preferences.addons[addon_name].preferences
+        preferences.cacheHits += self.cacheStats["hits"]
+        preferences.cacheMisses += self.cacheStats["misses"]
+
+        # the selection and active object were never changed
+        if context.object is not None and context.object.mode != self.startingMode:
+            bpy.ops.object.mode_set(mode=self.startingMode)
+        self.timings["finish"] = time.perf_counter() - start
+        if writeReport:
+            write_report(context, self.get_report(status))
+
+    def get_report(self, status="ok"):
+        """What the run did and how long each part of it took, as plain
+        values for JSON.
+        stages are wall times of this side, xatlas the stages the xatlas
+        processes reported, summed over the jobs. peakMemoryMB is the largest
+        peak resident memory of them, a worker reports its lifetime peak"""
+        xatlasTimings = Counter()
+        for jobTimings in self.control.jobTimings.values():
+            xatlasTimings.update(jobTimings)
+        atlases = [dict(vars(stats)) for stats in self.atlasStats.values()]
+        return {
+            "status": status,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "objects": self.unwrappedCount,
+            "triangles": self.triangleCount,
+            "vertices": self.vertexCount,
+            "stages": dict(self.timings),
+            "xatlas": dict(xatlasTimings),
+            "jobs": len(self.control.jobTimings),
+            "batches": len(self.jobMeshes) if self.batched else 0,
+            "fixedTriangles": self.fixedTriangleCount,
+            # the overlap layout puts every fixed uv in atlas 0, any other one
+            # has new charts over them
+            "fixedOverflow": bool(self.fixedTriangleCount)
+            and self.atlasLayout == "OVERLAP"
+            and any(atlas["atlasCount"] > 1 for atlas in atlases),
+            "materialGroups": list(self.materialGroups),
+            # the charts past the tiles of a group are on the next group's
+            "materialOverflow": self.materialOverflow,
+            "threads": self.threadCount,
+            "cpus": self.cpuSet,
+            "peakMemoryMB": max(self.control.jobPeakMemory.values(), default=0)
+            / (1024 * 1024),
+            "charts": sum(atlas["chartCount"] for atlas in atlases),
+            "timeLimitedCharts": sum(atlas["timeLimitedCharts"] for atlas in atlases),
+            "atlases": atlases,
+            "cacheHits": self.cacheStats["hits"],
+            "cacheMisses": self.cacheStats["misses"],
+            "chartImages": list(self.chartImageNames),
+            "auto": asdict(self.autoChoice) if self.autoChoice is not None else None,
+        }
+
+
+def is_unwrap_object(obj, viewLayerObjects):
+    """Whether obj is a mesh that can be unwrapped, only the visible objects of
+    the view layer can be selected and edited"""
+    return obj.type == "MESH" and obj.name in viewLayerObjects and obj.visible_get()
+
+
+def get_collection_groups(context):
+    """(name, mesh objects) of every collection of the scene that has any,
+    an object in more than one only goes with the first. The objects of the
+    scene collection itself come last"""
+    scene = context.scene
+    viewLayerObjects = context.view_layer.objects
+    taken = set()
+    groups = []
+    for collection in list(scene.collection.children_recursive) + [scene.collection]:
+        objects = []
+        for obj in collection.objects:
+            if obj.name not in taken and is_unwrap_object(obj, viewLayerObjects):
+                taken.add(obj.name)
+                objects.append(obj)
+        if objects:
+            groups.append((collection.name, objects))
+    return groups
+
+
+def get_run_status(error):
+    # the status of the report of a run that stopped on error
+    if isinstance(error, xatlas_runner.Cancelled):
+        return "cancelled"
+    if error is not None:
+        return "failed: %s" % error
+    return "ok"
+
+
+class PipelineControl:
+    # the RunControl of an UnwrapPipeline, for the modal operator
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.cancelled = False
+
+    @property
+    def stage(self):
+        runs = self.pipeline.runs
+        return runs[0][1].control.stage if runs else ""
+
+    def cancel(self):
+        self.cancelled = True
+        for name, unwrapRun in self.pipeline.runs:
+            unwrapRun.control.cancel()
+
+    def progress(self):
+        pipeline = self.pipeline
+        done = len(pipeline.reports)
+        done += sum(unwrapRun.control.progress() for name, unwrapRun in pipeline.runs)
+        return done / max(1, len(pipeline.objectGroups))
+
+
+# the keys of the UnwrapRun reports that add up in the one of a pipeline
+SUMMED_REPORT_KEYS = (
+    "objects",
+    "triangles",
+    "vertices",
+    "jobs",
+    "fixedTriangles",
+    "charts",
+    "timeLimitedCharts",
+    "cacheHits",
+    "cacheMisses",
+)
 
-        # print just for reference
-        # print(fakeFile.getvalue())
-
-        # get the path to xatlas
-        file_path = os.path.dirname(os.path.abspath(__file__))
-        if platform.system() == "Windows":
-            xatlas_path = os.path.join(file_path, "xatlas", "xatlas-blender.exe")
-        elif platform.system() == "Linux":
-            xatlas_path = os.path.join(file_path, "xatlas", "xatlas-blender")
-            # need to set permissions for the process on linux
-            subprocess.Popen('chmod u+x "' + xatlas_path + '"', shell=True)
-        elif platform.system() == "Darwin":
-            xatlas_path = os.path.join(file_path, "xatlas", "xatlas-blender")
-            # need to set permissions for the process on osx
-            subprocess.Popen('chmod u+x "' + xatlas_path + '"', shell=True)
-        # setup the arguments to be passed to xatlas-------------------
-        arguments_string = ""
-        for argumentKey in packOptions.__annotations__.keys():
-            key_string = str(argumentKey)
-            if argumentKey is not None:
-                print(getattr(packOptions, key_string))
-                attrib = getattr(packOptions, key_string)
-                if type(attrib) == bool:
-                    if attrib == True:
-                        arguments_string = arguments_string + " -" + str(argumentKey)
-                else:
-                    arguments_string = (
-                        arguments_string + " -" + str(argumentKey) + " " + str(attrib)
-                    )
 
-        for argumentKey in chartOptions.__annotations__.keys():
-            if argumentKey is not None:
-                key_string = str(argumentKey)
-                print(getattr(chartOptions, key_string))
-                attrib = getattr(chartOptions, key_string)
-                if type(attrib) == bool:
-                    if attrib == True:
-                        arguments_string = arguments_string + " -" + str(argumentKey)
+class UnwrapPipeline:
+    """Unwrap of several groups of objects, the collections of a level, each
+    into atlases of its own. xatlas runs one group at a time in a thread
+    while the main thread reads the meshes of the next groups, up to
+    queueDepth of them ahead, and applies the results of the one before.
+    Used like an UnwrapRun, apply_queued also reads the next group"""
+
+    def __init__(self, objectGroups, queueDepth=1):
+        self.objectGroups = list(objectGroups)  # (name, objects)
+        self.queueDepth = max(1, queueDepth)
+        self.nextGroup = 0
+        self.readyRuns = Queue()  # prepared runs for the xatlas thread, None ends it
+        self.runs = []  # (name, UnwrapRun) prepared and not finished, in order
+        self.reports = []  # of the finished groups, in order
+        self.control = PipelineControl(self)
+        self.operator = None
+        self.error = None  # the first one a group stopped on
+        self.meshCount = 0  # of the groups prepared so far
+        self.finishedCount = 0  # unwrapped objects of the finished groups
+        self.start = time.perf_counter()
+
+    @property
+    def unwrappedCount(self):
+        running = sum(unwrapRun.unwrappedCount for name, unwrapRun in self.runs)
+        return self.finishedCount + running
+
+    def prepare(self, operator, context):
+        """Read the first group, returns the operator result when there is
+        nothing to run"""
+        self.operator = operator
+        if not self.objectGroups:
+            operator.report({"WARNING"}, "No collection has a mesh to unwrap")
+            return {"FINISHED"}
+        if context.mode != "OBJECT":
+            # so no run puts back edit mode while the next ones are applied,
+            # the caller puts back the mode once they are all done
+            bpy.ops.object.mode_set(mode="OBJECT")
+        while not self.runs and self.nextGroup < len(self.objectGroups):
+            status = self.prepare_next(context)
+            if status is not None and "CANCELLED" in status:
+                return status
+        if not self.runs:
+            return {"FINISHED"}
+        return None
+
+    def prepare_next(self, context):
+        name, objects = self.objectGroups[self.nextGroup]
+        self.nextGroup += 1
+        unwrapRun = UnwrapRun()
+        status = unwrapRun.prepare(self.operator, context, objects)
+        if status is not None:
+            self.reports.append({"collection": name, "status": "not run"})
+            if "CANCELLED" in status:
+                # the options are wrong for every group
+                self.nextGroup = len(self.objectGroups)
+            return status
+        print("Prepared collection %s" % name)
+        self.meshCount += unwrapRun.meshCount
+        self.runs.append((name, unwrapRun))
+        self.readyRuns.put(unwrapRun)
+        return None
+
+    def start_thread(self):
+        """Run xatlas on the prepared groups one after the other, each one's
+        queue gets its results like with UnwrapRun.start_thread"""
+
+        def run():
+            for unwrapRun in iter(self.readyRuns.get, None):
+                if self.control.cancelled:
+                    unwrapRun.queue.put(xatlas_runner.Cancelled())
                 else:
-                    arguments_string = (
-                        arguments_string + " -" + str(argumentKey) + " " + str(attrib)
-                    )
+                    unwrapRun.put_results()
+
+        Thread(target=run, daemon=True).start()
+
+    def apply_queued(self, context):
+        """Apply the results that arrived so far, finish the groups that are
+        done and read the next group when fewer than queueDepth wait for
+        xatlas. Returns (finished, the first exception a group stopped on)"""
+        while self.runs:
+            name, unwrapRun = self.runs[0]
+            finished, error = unwrapRun.apply_queued(context)
+            if not finished:
+                break
+            self.runs.pop(0)
+            self.finish_run(context, name, unwrapRun, error)
+        if (
+            not self.control.cancelled
+            and self.nextGroup < len(self.objectGroups)
+            and self.readyRuns.qsize() < self.queueDepth
+        ):
+            self.prepare_next(context)
+        if self.runs or (
+            not self.control.cancelled and self.nextGroup < len(self.objectGroups)
+        ):
+            return False, None
+        self.readyRuns.put(None)
+        return True, self.error
+
+    def finish_run(self, context, name, unwrapRun, error):
+        status = get_run_status(error)
+        if error is not None and self.error is None:
+            self.error = error
+        unwrapRun.finish(context, status, writeReport=False)
+        self.finishedCount += unwrapRun.unwrappedCount
+        self.reports.append(dict(unwrapRun.get_report(status), collection=name))
+
+    def run(self, context):
+        """Unwrap every group without a modal operator after prepare,
+        returns the first exception a group stopped on"""
+        self.start_thread()
+        while True:
+            finished, error = self.apply_queued(context)
+            if finished:
+                break
+            time.sleep(0.01)
+        self.finish(context, get_run_status(error))
+        return error
+
+    def finish(self, context, status="ok"):
+        write_report(context, self.get_report(status))
+
+    def get_report(self, status="ok"):
+        """The reports of the groups added up, each of them is in collections.
+        The pipeline stage is the wall time of all of them"""
+        stages = Counter()
+        xatlasTimings = Counter()
+        for groupReport in self.reports:
+            stages.update(groupReport.get("stages", dict()))
+            xatlasTimings.update(groupReport.get("xatlas", dict()))
+        stages["pipeline"] = time.perf_counter() - self.start
+        report = {
+            "status": status,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "stages": dict(stages),
+            "xatlas": dict(xatlasTimings),
+            "queueDepth": self.queueDepth,
+            "peakMemoryMB": max(
+                (groupReport.get("peakMemoryMB", 0.0) for groupReport in self.reports),
+                default=0.0,
+            ),
+            "atlases": [
+                atlas
+                for groupReport in self.reports
+                for atlas in groupReport.get("atlases", [])
+            ],
+            "collections": list(self.reports),
+        }
+        for key in SUMMED_REPORT_KEYS:
+            report[key] = sum(groupReport.get(key, 0) for groupReport in self.reports)
+        return report
+
+
+def choose_auto_options(operator, context, jobMeshes, jobCount, targets):
+    """The auto_options.AutoChoice for the meshes of the jobs, jobCount of
+    them running at a time, with the options of the scene. None when there
+    is no calibration table to go by"""
+    preferences = context.preferences.addons[addon_name].preferences
+    packOptions = context.scene.pack_tool
+    sharedProperties = context.scene.shared_properties
+    try:
+        calibration = auto_options.load_calibration(
+            bpy.path.abspath(preferences.calibrationPath)
+        )
+    except (OSError, ValueError, KeyError) as error:
+        operator.report(
+            {"WARNING"},
+            "Could not read the Auto Options calibration, using the panel options: %s"
+            % error,
+        )
+        return None
+    jobStats = [auto_options.get_mesh_stats(meshes) for meshes in jobMeshes]
+    autoChoice = auto_options.choose_options(
+        calibration,
+        jobStats,
+        sharedProperties.autoTimeBudget,
+        packOptions.resolution,
+        packOptions.texelsPerUnit,
+        jobCount,
+        sharedProperties.packOnly,
+        [resolution for resolution, padding in targets],
+        # the Threads option is for each job, the cpus are shared by them
+        sharedProperties.threadCount,
+        os.cpu_count() or 0,
+    )
+    print(
+        "Auto Options: %s at %d, about %.1fs of %.1fs"
+        % (
+            autoChoice.tier,
+            autoChoice.resolution,
+            autoChoice.seconds,
+            autoChoice.budget,
+        )
+    )
+    if not autoChoice.fits:
+        operator.report(
+            {"WARNING"},
+            "Even the fastest options are estimated at %.0fs, over the %.0fs budget"
+            % (autoChoice.seconds, autoChoice.budget),
+        )
+    return autoChoice
 
-        # add pack only option
-        if sharedProperties.packOnly:
-            arguments_string = arguments_string + " -packOnly"
 
-        arguments_string = (
-            arguments_string + " -atlasLayout" + " " + sharedProperties.atlasLayout
-        )
+def write_report(context, report):
+    text = context.blend_data.texts.get(REPORT_TEXT_NAME)
+    if text is None:
+        text = context.blend_data.texts.new(REPORT_TEXT_NAME)
+    text.clear()
+    text.write(json.dumps(report, indent=2))
 
-        print(arguments_string)
-        # END setup the arguments to be passed to xatlas-------------------
 
-        # RUN xatlas process
-        xatlas_process = subprocess.Popen(
-            r'"{}"'.format(xatlas_path) + " " + arguments_string,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            shell=True,
-        )
+def read_report(context):
+    # the last report or None, the text can be edited or broken by the user
+    text = context.blend_data.texts.get(REPORT_TEXT_NAME)
+    if text is None:
+        return None
+    try:
+        return json.loads(text.as_string())
+    except ValueError:
+        return None
 
-        # shove the fake file in stdin
-        stdin = xatlas_process.stdin
-        value = bytes(
-            fakeFile.getvalue() + "\n", "UTF-8"
-        )  # The \n is needed to end the input properly
-        stdin.write(value)
-        stdin.flush()
 
-        # Get the output from xatlas
-        outObj = ""
-        while True:
-            output = xatlas_process.stdout.readline()
-            if not output:
-                break
-            outObj = outObj + (output.decode().strip() + "\n")
+class Setup_Unwrap(bpy.types.Operator):
+    bl_idname = "object.setup_unwrap"
+    bl_label = "Select the objects to be unwrapped"
+    bl_description = "Unwrap the objects, Esc cancels"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def gather_objects(self, context):
+        """The mesh objects to unwrap, read from the object lists so the
+        selection is left as it is"""
+        sharedProperties = context.scene.shared_properties
+        if sharedProperties.unwrapSelection == "ALL":
+            objects = context.scene.objects
+        elif sharedProperties.unwrapSelection == "COLLECTION":
+            collection = context.blend_data.collections.get(
+                sharedProperties.selectedCollection
+            )
+            objects = collection.all_objects if collection is not None else []
+        else:
+            objects = context.selected_objects
+        viewLayerObjects = context.view_layer.objects
+        return [obj for obj in objects if is_unwrap_object(obj, viewLayerObjects)]
+
+    def prepare_run(self, context):
+        """The UnwrapRun of the objects to unwrap, or the UnwrapPipeline of
+        the collections, and what its prepare returned"""
+        sharedProperties = context.scene.shared_properties
+        # save whatever mode the user was in
+        self.startingMode = "OBJECT"
+        if context.object is not None:
+            self.startingMode = context.object.mode
+        if sharedProperties.unwrapSelection == "COLLECTIONS":
+            unwrapRun = UnwrapPipeline(
+                get_collection_groups(context), sharedProperties.pipelineDepth
+            )
+            return unwrapRun, unwrapRun.prepare(self, context)
+        unwrapRun = UnwrapRun()
+        return unwrapRun, unwrapRun.prepare(self, context, self.gather_objects(context))
 
-        # the objects after xatlas processing
-        # print(outObj)
+    def restore_mode(self, context):
+        if context.object is not None and context.object.mode != self.startingMode:
+            bpy.ops.object.mode_set(mode=self.startingMode)
 
-        # Setup for reading the output
-        @dataclass
-        class uvObject:
-            obName: string = ""
-            uvArray: List[float] = field(default_factory=list)
-            faceArray: List[int] = field(default_factory=list)
+    def execute(self, context):
+        unwrapRun, status = self.prepare_run(context)
+        if status is not None:
+            self.restore_mode(context)
+            return status
+        # with individualAtlasPerObject every object becomes its own xatlas job
+        error = unwrapRun.run(context)
+        if error is not None:
+            self.report({"ERROR"}, "xatlas failed: %s" % error)
+        self.restore_mode(context)
+        return {"FINISHED"}
 
-        convertedObjects = []
-        uvArrayComplete = []
+    # from the ui the unwrap runs in the background, the results are
+    # applied on a timer while the progress bar follows xatlas
+    def invoke(self, context, event):
+        self.unwrapRun, status = self.prepare_run(context)
+        if status is not None:
+            self.restore_mode(context)
+            return status
+        self.unwrapRun.start_thread()
+
+        windowManager = context.window_manager
+        windowManager.progress_begin(0, 100)
+        self.timer = windowManager.event_timer_add(0.1, window=context.window)
+        windowManager.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        control = self.unwrapRun.control
+        if event.type == "ESC" and event.value == "PRESS":
+            # the thread stops once xatlas has, the next timer finishes up
+            control.cancel()
+            context.workspace.status_text_set("Xatlas: cancelling...")
+            return {"RUNNING_MODAL"}
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        finished, error = self.unwrapRun.apply_queued(context)
+        if finished:
+            return self.finish_modal(context, error)
+        progress = control.progress() * 100
+        context.window_manager.progress_update(progress)
+        if not control.cancelled:
+            context.workspace.status_text_set(
+                "Xatlas: %s %d%%, %d of %d objects, Esc to cancel"
+                % (
+                    control.stage or "Unwrapping",
+                    progress,
+                    self.unwrapRun.unwrappedCount,
+                    self.unwrapRun.meshCount,
+                )
+            )
+        return {"RUNNING_MODAL"}
+
+    def finish_modal(self, context, error):
+        windowManager = context.window_manager
+        windowManager.event_timer_remove(self.timer)
+        windowManager.progress_end()
+        context.workspace.status_text_set(None)
+
+        self.unwrapRun.finish(context, get_run_status(error))
+        self.restore_mode(context)
+
+        if isinstance(error, xatlas_runner.Cancelled):
+            self.report(
+                {"WARNING"},
+                "Unwrap cancelled, %d of %d objects were unwrapped"
+                % (self.unwrapRun.unwrappedCount, self.unwrapRun.meshCount),
+            )
+        elif error is not None:
+            self.report({"ERROR"}, "xatlas failed: %s" % error)
+        else:
+            print("Finished Xatlas----------------------------------------")
+        # finished even when cancelled, so the objects that got their uvs can be undone
+        return {"FINISHED"}
 
-        # search through the out put for STARTOBJ
-        # then start reading the objects
-        obTest = None
-        startRead = False
-        for line in outObj.splitlines():
 
-            line_split = line.split()
+# Unwrap Lightmap Group Xatlas
+class Unwrap_Lightmap_Group_Xatlas_2(bpy.types.Operator):
+    bl_idname = "object.unwrap_lightmap_group_xatlas_2"
+    bl_label = "Unwrap Lightmap Group Xatlas"
+    bl_options = {"REGISTER", "UNDO"}
 
-            if not line_split:
-                continue
+    def execute(self, context):
+        unwrapRun = UnwrapRun()
+        status = unwrapRun.prepare(self, context)
+        if status is not None:
+            return status
 
-            line_start = line_split[0]  # we compare with this a _lot_
-            # print(line_start)
-            if line_start == "STARTOBJ":
-                print(
-                    "Start reading the objects----------------------------------------"
-                )
-                startRead = True
-                # obTest = uvObject()
-
-            if startRead:
-                # if it's a new obj
-                if line_start == "o":
-                    # if there is already an object append it
-                    if obTest is not None:
-                        convertedObjects.append(obTest)
-
-                    obTest = uvObject()  # create new uv object
-                    obTest.obName = line_split[1]
-
-                if obTest is not None:
-                    # the uv coords
-                    if line_start == "vt":
-                        newUv = [float(line_split[1]), float(line_split[2])]
-                        obTest.uvArray.append(newUv)
-                        uvArrayComplete.append(newUv)
-
-                    # the face coords index
-                    # faces are 1 indexed
-                    if line_start == "f":
-                        # vert/uv/normal
-                        # only need the uvs
-                        newFace = [
-                            int(line_split[1].split("/")[1]),
-                            int(line_split[2].split("/")[1]),
-                            int(line_split[3].split("/")[1]),
-                        ]
-                        obTest.faceArray.append(newFace)
-
-        # append the final object
-        convertedObjects.append(obTest)
-        # print(convertedObjects)
-
-        # apply the output-------------------------------------------------------------
-        # copy the uvs to the original objects
-        # objIndex = 0
+        # RUN xatlas process
+        # and apply the output as each object arrives------------------------------
         print("Applying the UVs----------------------------------------")
-        # print(convertedObjects)
-        for importObject in convertedObjects:
-            bpy.ops.object.select_all(action="DESELECT")
-
-            obTest = importObject
-            obTest.obName = safe_dict[
-                obTest.obName
-            ]  # probably shouldn't just replace it
-            bpy.context.scene.objects[obTest.obName].select_set(True)
-            context.view_layer.objects.active = bpy.context.scene.objects[obTest.obName]
-            bpy.ops.object.mode_set(mode="OBJECT")
+        error = unwrapRun.run(context)
+        if error is not None:
+            self.report({"ERROR"}, "xatlas failed: %s" % error)
+            return {"FINISHED"}
 
-            obj = bpy.context.active_object
-            me = obj.data
-            # convert to bmesh to create the new uvs
-            bm = bmesh.new()
-            bm.from_mesh(me)
+        print("Finished Xatlas----------------------------------------")
+        return {"FINISHED"}
 
-            uv_layer = bm.loops.layers.uv.verify()
 
-            nFaces = len(bm.faces)
-            # need to ensure lookup table for some reason?
-            if hasattr(bm.faces, "ensure_lookup_table"):
-                bm.faces.ensure_lookup_table()
+class Clear_Unwrap_Cache(bpy.types.Operator):
+    bl_idname = "object.clear_xatlas_cache"
+    bl_label = "Clear Cache"
+    bl_description = "Delete every cached unwrap and stored chart layout and reset the hit and miss counters"
 
-            # loop through the faces
-            for faceIndex in range(nFaces):
-                faceGroup = obTest.faceArray[faceIndex]
+    def execute(self, context):
+        preferences = context.preferences.addons[addon_name].preferences
+        cache = get_unwrap_cache(context)
+        if cache is not None:
+            cache.clear()
+        get_chart_store(context).clear()
+        preferences.cacheHits = 0
+        preferences.cacheMisses = 0
+        return {"FINISHED"}
 
-                bm.faces[faceIndex].loops[0][uv_layer].uv = (
-                    uvArrayComplete[faceGroup[0] - 1][0],
-                    uvArrayComplete[faceGroup[0] - 1][1],
-                )
 
-                bm.faces[faceIndex].loops[1][uv_layer].uv = (
-                    uvArrayComplete[faceGroup[1] - 1][0],
-                    uvArrayComplete[faceGroup[1] - 1][1],
-                )
+# end operators------------------------------
 
-                bm.faces[faceIndex].loops[2][uv_layer].uv = (
-                    uvArrayComplete[faceGroup[2] - 1][0],
-                    uvArrayComplete[faceGroup[2] - 1][1],
-                )
 
-                # objIndex = objIndex + 3
+# begin preferences------------------------------
+class XatlasPreferences(AddonPreferences):
+    bl_idname = addon_name
 
-            # print(objIndex)
-            # assign the mesh back to the original mesh
-            bm.to_mesh(me)
-        # END apply the output-------------------------------------------------------------
+    useCache: BoolProperty(
+        name="Cache Unwraps",
+        description="Keep xatlas results on disk and reuse them when the same meshes are unwrapped with the same options",
+        default=False,
+    )
 
-        # Start setting the quads back again-------------------------------------------------------------
-        if sharedProperties.packOnly:
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_all(action="DESELECT")
-            bpy.ops.object.mode_set(mode="OBJECT")
+    cacheDirectory: StringProperty(
+        name="Cache Directory",
+        description="Where the cached unwraps are kept, a folder in the system temp directory when empty. The chart layouts of Only Chart Changed Objects are kept in its charts folder even when Cache Unwraps is off",
+        default="",
+        subtype="DIR_PATH",
+    )
 
-            for edges in edgeDict:
-                edgeList = edgeDict[edges]
-                currentObject = bpy.context.scene.objects[edgeList["object"]]
-                bm = bmesh.new()
-                bm.from_mesh(currentObject.data)
-                if hasattr(bm.edges, "ensure_lookup_table"):
-                    bm.edges.ensure_lookup_table()
-
-                # assume that all the triangulated edges come after the original edges
-                newEdges = []
-                for edge in range(len(edgeList["edges"]), len(bm.edges)):
-                    newEdge = bm.edges[edge]
-                    newEdge.select = True
-                    newEdges.append(newEdge)
-
-                bmesh.ops.dissolve_edges(
-                    bm, edges=newEdges, use_verts=False, use_face_split=False
-                )
-                bpy.ops.object.mode_set(mode="OBJECT")
-                bm.to_mesh(currentObject.data)
-                bm.free()
-                bpy.ops.object.mode_set(mode="EDIT")
+    cacheSizeLimit: IntProperty(
+        name="Cache Size Limit (MB)",
+        description="The least recently used unwraps are removed once the cache grows past this. The stored chart layouts have a limit of the same size of their own",
+        default=1024,
+        min=1,
+    )
 
-        # End setting the quads back again-------------------------------------------------------------
+    cacheHits: IntProperty(
+        name="Cache Hits",
+        description="Atlases taken from the cache",
+        default=0,
+        min=0,
+    )
 
-        # select the original objects that were selected
-        for objectName in rename_dict:
-            if objectName[0] in bpy.context.scene.objects:
-                current_object = bpy.context.scene.objects[objectName[0]]
-                current_object.select_set(True)
-                context.view_layer.objects.active = current_object
+    cacheMisses: IntProperty(
+        name="Cache Misses",
+        description="Atlases that had to be unwrapped by xatlas",
+        default=0,
+        min=0,
+    )
 
-        bpy.ops.object.mode_set(mode=startingMode)
+    calibrationPath: StringProperty(
+        name="Auto Options Calibration",
+        description="Calibration table for Auto Options, made by benchmark.py --calibrate on this kind of machine. The one that comes with the addon when empty",
+        default="",
+        subtype="FILE_PATH",
+    )
 
-        print("Finished Xatlas----------------------------------------")
-        return {"FINISHED"}
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "useCache")
+        # also where the chart layouts go, so it stays enabled without the cache
+        box = layout.box()
+        box.prop(self, "cacheDirectory")
+        box.prop(self, "cacheSizeLimit")
+        row = box.row()
+        row.label(text="Hits: %d" % self.cacheHits)
+        row.label(text="Misses: %d" % self.cacheMisses)
+        row.operator("object.clear_xatlas_cache")
+        layout.prop(self, "calibrationPath")
 
 
-# end operators------------------------------
+# end preferences------------------------------
 
 
 # begin panels------------------------------
@@ -747,8 +1804,11 @@ class OBJECT_PT_pack_panel(Panel):
         # add the pack options
         box = layout.box()
         # label = box.label(text="Pack Options")
+        autoOptions = scene.shared_properties.autoOptions
         for tool in packtool.__annotations__.keys():
-            box.prop(packtool, tool)
+            row = box.row()
+            row.enabled = not (autoOptions and tool in auto_options.TUNED_OPTIONS)
+            row.prop(packtool, tool)
 
 
 class OBJECT_PT_chart_panel(Panel):
@@ -772,8 +1832,11 @@ class OBJECT_PT_chart_panel(Panel):
 
         # add the chart options
         box = layout.box()
+        autoOptions = scene.shared_properties.autoOptions
         for tool in mytool.__annotations__.keys():
-            box.prop(mytool, tool)
+            row = box.row()
+            row.enabled = not (autoOptions and tool in auto_options.TUNED_OPTIONS)
+            row.prop(mytool, tool)
 
 
 class OBJECT_PT_run_panel(Panel):
@@ -802,6 +1865,8 @@ class OBJECT_PT_run_panel(Panel):
         row.prop(scene.shared_properties, "unwrapSelection")
         if scene.shared_properties.unwrapSelection == "COLLECTION":
             box.prop(scene.shared_properties, "selectedCollection")
+        elif scene.shared_properties.unwrapSelection == "COLLECTIONS":
+            box.prop(scene.shared_properties, "pipelineDepth")
 
         box = layout.box()
         row = box.row()
@@ -811,6 +1876,10 @@ class OBJECT_PT_run_panel(Panel):
             box.prop(scene.shared_properties, "lightmapUVName")
         elif scene.shared_properties.lightmapUVChoiceType == "INDEX":
             box.prop(scene.shared_properties, "lightmapUVIndex")
+        box.prop(scene.shared_properties, "lightmapTargets")
+        row = box.row()
+        row.enabled = scene.shared_properties.lightmapTargets.strip() != ""
+        row.prop(scene.shared_properties, "lightmapTargetPattern")
 
         box = layout.box()
         row = box.row()
@@ -834,7 +1903,165 @@ class OBJECT_PT_run_panel(Panel):
         row = box.row()
         row.prop(scene.shared_properties, "packOnly")
         row = box.row()
+        row.prop(scene.shared_properties, "selectedFacesOnly")
+        row = box.row()
         row.prop(scene.shared_properties, "individualAtlasPerObject")
+        row = box.row()
+        row.prop(scene.shared_properties, "incrementalUnwrap")
+        row = box.row()
+        row.prop(scene.shared_properties, "unwrapSharedMeshesOnce")
+        row = box.row()
+        row.prop(scene.shared_properties, "materialAtlases")
+        if scene.shared_properties.materialAtlases:
+            box.prop(scene.shared_properties, "materialGroups")
+            box.prop(scene.shared_properties, "materialTiles")
+        row = box.row()
+        row.enabled = (
+            scene.shared_properties.individualAtlasPerObject
+            or scene.shared_properties.materialAtlases
+        )
+        row.prop(scene.shared_properties, "parallelJobs")
+        row = box.row()
+        row.enabled = not (
+            scene.shared_properties.individualAtlasPerObject
+            or scene.shared_properties.materialAtlases
+        )
+        row.prop(scene.shared_properties, "batchMemoryLimit")
+        row = box.row()
+        row.prop(scene.shared_properties, "chartImages")
+        if scene.shared_properties.chartImages == "NPY":
+            box.prop(scene.shared_properties, "chartImageDirectory")
+        row = box.row()
+        row.prop(scene.shared_properties, "useBinaryTransport")
+        row = box.row()
+        row.prop(scene.shared_properties, "useWorkerProcess")
+        row = box.row()
+        row.prop(scene.shared_properties, "useInProcessLibrary")
+        row = box.row()
+        row.prop(scene.shared_properties, "threadCount")
+        row = box.row()
+        row.prop(scene.shared_properties, "cpuSet")
+        row = box.row()
+        row.prop(scene.shared_properties, "autoOptions")
+        row = box.row()
+        row.enabled = scene.shared_properties.autoOptions
+        row.prop(scene.shared_properties, "autoTimeBudget")
+
+
+class OBJECT_PT_report_panel(Panel):
+    bl_idname = "OBJECT_PT_report_panel"
+    bl_label = "Last Run"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_category = "Xatlas"
+    bl_parent_id = "OBJECT_PT_run_panel"
+    bl_options = {"DEFAULT_CLOSED"}
+    bl_context = ""
+
+    @classmethod
+    def poll(self, context):
+        return context.object is not None
+
+    def draw(self, context):
+        layout = self.layout
+        report = read_report(context)
+        if report is None:
+            layout.label(text="Nothing unwrapped yet")
+            return
+
+        box = layout.box()
+        box.label(text="%s, %s" % (report.get("time", ""), report.get("status", "")))
+        box.label(
+            text="%d objects, %d triangles, %d vertices"
+            % (
+                report.get("objects", 0),
+                report.get("triangles", 0),
+                report.get("vertices", 0),
+            )
+        )
+        box.label(
+            text="Cache: %d hits, %d misses"
+            % (report.get("cacheHits", 0), report.get("cacheMisses", 0))
+        )
+        autoChoice = report.get("auto")
+        if autoChoice:
+            box.label(
+                text="Auto: %s at %d, estimated %.1fs of %.1fs"
+                % (
+                    autoChoice["tier"],
+                    autoChoice["resolution"],
+                    autoChoice["seconds"],
+                    autoChoice["budget"],
+                )
+            )
+
+        collections = report.get("collections")
+        if collections:
+            box.label(
+                text="%d collections, queue depth %d"
+                % (len(collections), report.get("queueDepth", 1))
+            )
+
+        box = layout.box()
+        for stage, seconds in report.get("stages", dict()).items():
+            box.label(text="%s: %.3fs" % (stage, seconds))
+        xatlasTimings = report.get("xatlas", dict())
+        if xatlasTimings:
+            box = layout.box()
+            box.label(
+                text="xatlas, %d jobs on %s threads, peak %.1f MB"
+                % (
+                    report.get("jobs", 0),
+                    report.get("threads") or "all",
+                    report.get("peakMemoryMB", 0.0),
+                )
+            )
+            for stage, seconds in xatlasTimings.items():
+                box.label(text="%s: %.3fs" % (stage, seconds))
+
+        atlases = report.get("atlases", [])
+        if atlases:
+            box = layout.box()
+            box.label(text="%d charts" % report.get("charts", 0))
+            if report.get("timeLimitedCharts"):
+                box.label(
+                    text="%d placed without Brute Force after the Pack Time Limit"
+                    % report["timeLimitedCharts"],
+                    icon="ERROR",
+                )
+            if report.get("fixedTriangles"):
+                box.label(
+                    text="%d triangles kept their lightmap uvs"
+                    % report["fixedTriangles"]
+                )
+            if report.get("materialGroups"):
+                box.label(
+                    text="%d material atlases" % len(report["materialGroups"])
+                )
+            if report.get("materialOverflow"):
+                box.label(
+                    text="A material group filled more than its tiles",
+                    icon="ERROR",
+                )
+            if report.get("fixedOverflow"):
+                box.label(
+                    text="Charts that didn't fit around them are on top of them",
+                    icon="ERROR",
+                )
+            for atlas in atlases:
+                box.label(
+                    text="%d x %d, %d atlases: %s"
+                    % (
+                        atlas["width"],
+                        atlas["height"],
+                        atlas["atlasCount"],
+                        ", ".join(
+                            "%.1f%%" % (utilization * 100.0)
+                            for utilization in atlas["utilization"]
+                        ),
+                    )
+                )
+        layout.label(text="Full report in the %s text" % REPORT_TEXT_NAME)
 
 
 # end panels------------------------------
@@ -848,10 +2075,13 @@ classes = (
     PG_ChartProperties,
     Setup_Unwrap,
     Unwrap_Lightmap_Group_Xatlas_2,
+    Clear_Unwrap_Cache,
+    XatlasPreferences,
     OBJECT_PT_xatlas_panel,
     OBJECT_PT_pack_panel,
     OBJECT_PT_chart_panel,
     OBJECT_PT_run_panel,
+    OBJECT_PT_report_panel,
 )
 
 
@@ -864,11 +2094,18 @@ def register():
     bpy.types.Scene.pack_tool = PointerProperty(type=PG_PackProperties)
     bpy.types.Scene.chart_tool = PointerProperty(type=PG_ChartProperties)
     bpy.types.Scene.shared_properties = PointerProperty(type=PG_SharedProperties)
+    bpy.app.handlers.depsgraph_update_post.append(collection_names_changed)
+    for handlers in COLLECTION_RESET_HANDLERS:
+        getattr(bpy.app.handlers, handlers).append(collection_names_reset)
 
     #
 
 
 def unregister():
+    xatlas_runner.stop_workers()
+    bpy.app.handlers.depsgraph_update_post.remove(collection_names_changed)
+    for handlers in COLLECTION_RESET_HANDLERS:
+        getattr(bpy.app.handlers, handlers).remove(collection_names_reset)
     #
     for cls in reversed(classes):
         unregister_class(cls)
@@ -0,0 +1,321 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Auto options: the pack and chart options that fit a time budget
+# The calibration table (auto_calibration.json, regenerated with
+# benchmark.py --calibrate) lists option tiers from the best to the fastest
+# with how long each took on the benchmark scenes, fitted per tier as
+#   seconds = base + triangle * triangles + object * objects
+#             + squaredTriangle * (sum of the squared triangles of each object)
+# once for charting (everything but packing) and once for packing, the
+# squared term is for charting a single mesh growing faster than its size.
+# Packing
+# also grows with the atlas, so its fit is scaled by
+#   (resolution / table resolution) ** resolutionExponent
+# with the exponent of the tier, measured by packing at half the resolution.
+# xatlas charts on all of its threads but packs on one, so the charting
+# fit is scaled by the threads the table was timed with over the threads
+# each job gets on this machine: the -threads of the jobs when set, else
+# the cpus shared by the jobs running at once.
+# choose_options takes the best tier that fits the budget and only lowers
+# the resolution when not even the fastest one does.
+# No bpy here, the benchmark uses it too.
+
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+
+CALIBRATION_VERSION = 1
+CALIBRATION_FILE_NAME = "auto_calibration.json"
+
+# best to fastest, every tier sets all the options auto changes so the
+# ones from the panel never leak into it
+TIERS = [
+    {
+        "name": "bruteForce",
+        "pack": {"bruteForce": True, "blockAlign": False},
+        "chart": {"maxIterations": 4},
+    },
+    {
+        "name": "quality",
+        "pack": {"bruteForce": False, "blockAlign": False},
+        "chart": {"maxIterations": 2},
+    },
+    {
+        "name": "default",
+        "pack": {"bruteForce": False, "blockAlign": False},
+        "chart": {"maxIterations": 1},
+    },
+    {
+        "name": "fast",
+        "pack": {"bruteForce": False, "blockAlign": True},
+        "chart": {"maxIterations": 1},
+    },
+]
+
+# the options the tiers set, the panel ones are not used with auto
+TUNED_OPTIONS = {
+    key for tier in TIERS for key in list(tier["pack"]) + list(tier["chart"])
+}
+
+# xatlas packs to about this when neither resolution nor texelsPerUnit is set
+DEFAULT_RESOLUTION = 1024
+MIN_RESOLUTION = 256
+
+
+@dataclass
+class MeshStats:
+    triangles: int = 0
+    squaredTriangles: float = 0.0  # sum of the squared triangle count of each object
+    objects: int = 0
+    area: float = 0.0  # world space surface area
+
+
+@dataclass
+class AutoChoice:
+    tier: str
+    pack: Dict[str, object]  # PG_PackProperties values to use instead
+    chart: Dict[str, object]  # PG_ChartProperties values to use instead
+    resolution: int  # the atlas size the estimate is for
+    seconds: float  # estimated
+    budget: float
+    fits: bool = True  # False when even the fastest tier is over the budget
+
+
+def get_mesh_stats(meshDataList):
+    """MeshStats of the MeshData that go into one atlas"""
+    stats = MeshStats(objects=len(meshDataList))
+    for meshData in meshDataList:
+        corners = np.asarray(meshData.positions, dtype=np.float64)[
+            np.asarray(meshData.indices, dtype=np.int64).reshape(-1, 3)
+        ]
+        normals = np.cross(
+            corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]
+        )
+        stats.triangles += len(corners)
+        stats.squaredTriangles += float(len(corners)) ** 2
+        stats.area += float(np.linalg.norm(normals, axis=1).sum()) * 0.5
+    return stats
+
+
+def get_calibration_path():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(directory, CALIBRATION_FILE_NAME)
+
+
+def load_calibration(path=None):
+    """The calibration table at path, the addon's one by default.
+    Raises ValueError when it is from another version"""
+    if not path:
+        path = get_calibration_path()
+    with open(path, encoding="utf-8") as calibrationFile:
+        calibration = json.load(calibrationFile)
+    if calibration.get("version") != CALIBRATION_VERSION:
+        raise ValueError(
+            "%s is version %s, expected %d"
+            % (path, calibration.get("version"), CALIBRATION_VERSION)
+        )
+    return calibration
+
+
+def effective_resolution(stats, resolution, texelsPerUnit):
+    """About how large xatlas makes the atlas. With only texelsPerUnit it
+    follows the surface area, like the estimate of xatlas' packCharts that
+    assumes 75% utilization"""
+    if resolution > 0:
+        return resolution
+    if texelsPerUnit > 0:
+        side = math.sqrt(max(1.0, stats.area * texelsPerUnit**2 / 0.75))
+        return 1 << max(0, math.ceil(math.log2(side)))
+    return DEFAULT_RESOLUTION
+
+
+# the terms of a fit and what they are multiplied by
+FIT_TERMS = ("base", "triangle", "squaredTriangle", "object")
+
+
+def fit_features(stats):
+    return [1.0, stats.triangles, stats.squaredTriangles, stats.objects]
+
+
+def evaluate_fit(fit, stats):
+    seconds = sum(
+        fit.get(term, 0.0) * feature
+        for term, feature in zip(FIT_TERMS, fit_features(stats))
+    )
+    return max(0.0, seconds)
+
+
+def chart_thread_scale(calibration, threads, cpus, jobCount):
+    """How much longer charting takes than in the table with threads for
+    each job, or jobCount jobs sharing cpus when threads is 0. 1 when both
+    are unknown. Tables from before the machine had "threads" were timed on
+    all of its cpus"""
+    jobThreads = threads or cpus / max(1, jobCount)
+    if not jobThreads:
+        return 1.0
+    machine = calibration.get("machine", dict())
+    tableThreads = machine.get("threads") or machine.get("cpus") or 1
+    return tableThreads / max(1.0, jobThreads)
+
+
+def estimate_seconds(
+    calibration,
+    tier,
+    jobStats,
+    resolution,
+    texelsPerUnit=0.0,
+    jobCount=1,
+    packOnly=False,
+    targets=(),
+    threads=0,
+    cpus=0,
+):
+    """Seconds to unwrap every MeshStats of jobStats (one per atlas) with
+    tier, jobCount of them at a time, see chart_thread_scale for threads and
+    cpus. With targets, the resolutions of the lightmap targets, the charts
+    are packed once for each of them instead"""
+    jobCount = max(1, min(jobCount, len(jobStats)))
+    chartScale = chart_thread_scale(calibration, threads, cpus, jobCount)
+    seconds = 0.0
+    for stats in jobStats:
+        for packResolution in targets or [resolution]:
+            scale = (
+                effective_resolution(stats, packResolution, texelsPerUnit)
+                / calibration["resolution"]
+            ) ** tier["resolutionExponent"]
+            seconds += evaluate_fit(tier["pack"], stats) * scale
+        if not packOnly:
+            seconds += evaluate_fit(tier["chart"], stats) * chartScale
+    return seconds / jobCount
+
+
+def choose_options(
+    calibration,
+    jobStats,
+    budget,
+    resolution,
+    texelsPerUnit=0.0,
+    jobCount=1,
+    packOnly=False,
+    targets=(),
+    threads=0,
+    cpus=0,
+):
+    """The AutoChoice of the best tier that is estimated to fit in budget
+    seconds. When none does the resolution is halved (down to MIN_RESOLUTION)
+    with the fastest tier until it does, and left when that never happens.
+    The resolutions of targets and texelsPerUnit atlases are never changed"""
+    tiers = calibration["tiers"]
+
+    def estimate(tier, tierResolution):
+        return estimate_seconds(
+            calibration,
+            tier,
+            jobStats,
+            tierResolution,
+            texelsPerUnit,
+            jobCount,
+            packOnly,
+            targets,
+            threads,
+            cpus,
+        )
+
+    def choice(tier, tierResolution, seconds):
+        pack = dict(tier["options"]["pack"])
+        if tierResolution != resolution:
+            pack["resolution"] = tierResolution
+        return AutoChoice(
+            tier["name"],
+            pack,
+            dict(tier["options"]["chart"]),
+            tierResolution,
+            seconds,
+            budget,
+            seconds <= budget,
+        )
+
+    for tier in tiers:
+        seconds = estimate(tier, resolution)
+        if seconds <= budget:
+            return choice(tier, resolution, seconds)
+
+    fastest = tiers[-1]
+    tierResolution = resolution
+    while not targets and tierResolution > MIN_RESOLUTION:
+        tierResolution = max(MIN_RESOLUTION, tierResolution // 2)
+        seconds = estimate(fastest, tierResolution)
+        if seconds <= budget:
+            return choice(fastest, tierResolution, seconds)
+    # a smaller atlas doesn't get it under the budget, so it isn't worth it
+    return choice(fastest, resolution, estimate(fastest, resolution))
+
+
+def option_arguments(values):
+    # -name value of the options in values, bools as -name like the addon
+    arguments = []
+    for key, value in values.items():
+        if type(value) == bool:
+            if value:
+                arguments.append("-" + key)
+        else:
+            arguments += ["-" + key, str(value)]
+    return arguments
+
+
+def fit_stage(cases, stage):
+    """The FIT_TERMS of stage, least squares over the cases (MeshStats,
+    seconds by stage) without negative terms"""
+    matrix = np.array([fit_features(stats) for stats, stages in cases])
+    seconds = np.array([stages[stage] for stats, stages in cases])
+    # the columns are scaled so the tiny per triangle terms aren't lost
+    scale = np.maximum(matrix.max(axis=0), 1.0)
+    keep = np.ones(len(FIT_TERMS), dtype=bool)
+    terms = np.zeros(len(FIT_TERMS))
+    # drop the negative terms and fit the rest again until none are left
+    while keep.any():
+        terms[:] = 0.0
+        terms[keep] = (
+            np.linalg.lstsq(matrix[:, keep] / scale[keep], seconds, rcond=None)[0]
+            / scale[keep]
+        )
+        if (terms >= 0.0).all():
+            break
+        keep &= terms > 0.0
+    return {term: float(max(0.0, value)) for term, value in zip(FIT_TERMS, terms)}
+
+
+def make_calibration(tierCases, resolution, machine=None):
+    """The calibration table of tierCases, a list of (tier, cases,
+    resolutionExponent) with the cases of fit_stage timed at resolution and
+    split into "pack" and "chart" stages"""
+    return {
+        "version": CALIBRATION_VERSION,
+        "machine": machine or dict(),
+        "resolution": resolution,
+        "tiers": [
+            {
+                "name": tier["name"],
+                "options": {"pack": tier["pack"], "chart": tier["chart"]},
+                "pack": fit_stage(cases, "pack"),
+                "chart": fit_stage(cases, "chart"),
+                "resolutionExponent": resolutionExponent,
+            }
+            for tier, cases, resolutionExponent in tierCases
+        ],
+    }
@@ -0,0 +1,309 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Headless batch unwrapping of .blend files
+#   python batch.py config.json
+# starts a background Blender for each file, at most "processes" at once.
+# Each of them runs this file again (blender_main) with the addon enabled,
+# unwraps the file, saves it and writes a JSON report of it. The reports
+# are collected into one, see load_config for the options.
+# The driver side only uses the standard library, bpy is imported by the
+# Blender side.
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONFIG = {
+    "blender": "blender",
+    "addon": "blender_xatlas",  # module name of the enabled addon
+    "processes": 1,
+    "timeout": None,  # seconds for each file
+    "output": None,  # directory for the unwrapped files, None saves in place
+    "report": "xatlas_report.json",
+    "collections": [],  # only unwrap the meshes of these, all meshes when empty
+    # unwrap each collection into its own atlas, pipelined (UnwrapPipeline)
+    "perCollection": False,
+    "pack": {},  # PG_PackProperties
+    "chart": {},  # PG_ChartProperties
+    "shared": {},  # PG_SharedProperties
+}
+
+# keys a file entry can override
+FILE_KEYS = ("collections", "perCollection", "pack", "chart", "shared", "timeout")
+
+
+def load_config(path):
+    """The config with defaults filled in and "files" expanded to a list of jobs.
+    Files are paths or glob patterns relative to the config, or objects with
+    a "path" and any of FILE_KEYS to override for that file, options are
+    merged with the ones of the config"""
+    with open(path, encoding="utf-8") as configFile:
+        config = dict(DEFAULT_CONFIG, **json.load(configFile))
+    baseDirectory = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value):
+        if value is None:
+            return None
+        return os.path.join(baseDirectory, os.path.expanduser(value))
+
+    config["output"] = resolve(config["output"])
+    config["report"] = resolve(config["report"])
+    jobs = []
+    for entry in config.get("files", []):
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        paths = sorted(glob.glob(resolve(entry["path"]))) or [resolve(entry["path"])]
+        for blendPath in paths:
+            job = {key: config[key] for key in FILE_KEYS}
+            for key in FILE_KEYS:
+                if isinstance(entry.get(key), dict):
+                    job[key] = dict(job[key], **entry[key])
+                elif key in entry:
+                    job[key] = entry[key]
+            job["path"] = os.path.normpath(blendPath)
+            job["output"] = blendPath
+            if config["output"] is not None:
+                job["output"] = os.path.join(
+                    config["output"], os.path.basename(blendPath)
+                )
+            jobs.append(job)
+    config["jobs"] = jobs
+    return config
+
+
+def run_blender(config, job):
+    """Unwrap one file in its own Blender, returns its report"""
+    start = time.perf_counter()
+    report = {"file": job["path"], "output": job["output"], "status": "failed"}
+    with tempfile.TemporaryDirectory(prefix="xatlas_batch_") as directory:
+        jobPath = os.path.join(directory, "job.json")
+        reportPath = os.path.join(directory, "report.json")
+        with open(jobPath, "w", encoding="utf-8") as jobFile:
+            json.dump(dict(job, addon=config["addon"]), jobFile)
+        command = [
+            config["blender"],
+            "--background",
+            job["path"],
+            "--python-exit-code",
+            "1",
+            "--python",
+            os.path.abspath(__file__),
+            "--",
+            "--job",
+            jobPath,
+            "--report",
+            reportPath,
+        ]
+        try:
+            process = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=job["timeout"],
+            )
+        except subprocess.TimeoutExpired:
+            report["error"] = "timed out after %g seconds" % job["timeout"]
+        except OSError as error:
+            report["error"] = "could not start Blender: %s" % error
+        else:
+            if os.path.exists(reportPath):
+                with open(reportPath, encoding="utf-8") as reportFile:
+                    report = json.load(reportFile)
+            if process.returncode != 0 and report.get("status") == "ok":
+                report["status"] = "failed"
+            if report.get("status") != "ok" and "error" not in report:
+                # Blender died before it could say why, keep the end of its log
+                log = process.stdout.decode("utf-8", "replace")
+                report["error"] = "Blender exited with %d" % process.returncode
+                report["log"] = log[-4000:]
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def run_batch(config):
+    """Unwrap every job of config, returns the combined report"""
+    start = time.perf_counter()
+    if config["output"] is not None:
+        os.makedirs(config["output"], exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, config["processes"])) as executor:
+        reports = list(
+            executor.map(lambda job: run_blender(config, job), config["jobs"])
+        )
+    for report in reports:
+        print("%s: %s (%.1fs)" % (report["file"], report["status"], report["seconds"]))
+    return {
+        "files": reports,
+        "failed": sum(report["status"] != "ok" for report in reports),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Unwrap .blend files with xatlas")
+    parser.add_argument("config", help="JSON file with the files and options")
+    arguments = parser.parse_args(argv)
+    config = load_config(arguments.config)
+    report = run_batch(config)
+    with open(config["report"], "w", encoding="utf-8") as reportFile:
+        json.dump(report, reportFile, indent=2)
+    print("%d files, %d failed" % (len(report["files"]), report["failed"]))
+    return 1 if report["failed"] else 0
+
+
+# Blender side------------------------------
+
+
+class BatchReporter:
+    # stands in for the operator that UnwrapRun.prepare reports to
+    def __init__(self):
+        self.messages = []
+
+    def report(self, type, message):
+        self.messages.append("%s: %s" % ("/".join(sorted(type)), message))
+
+
+def set_properties(propertyGroup, values):
+    for key, value in values.items():
+        if key not in propertyGroup.__annotations__:
+            raise KeyError("%s has no option %s" % (type(propertyGroup).__name__, key))
+        setattr(propertyGroup, key, value)
+
+
+def get_batch_objects(addon, context, collectionNames):
+    """The mesh objects to unwrap, see is_unwrap_object"""
+    viewLayerObjects = context.view_layer.objects
+    if collectionNames:
+        objects = []
+        for collectionName in collectionNames:
+            collection = context.blend_data.collections.get(collectionName)
+            if collection is None:
+                raise KeyError("no collection named %s" % collectionName)
+            objects += [obj for obj in collection.all_objects if obj not in objects]
+    else:
+        objects = context.scene.objects
+    return [obj for obj in objects if addon.is_unwrap_object(obj, viewLayerObjects)]
+
+
+def get_batch_groups(addon, context, collectionNames):
+    """(name, mesh objects) of every collection to unwrap on its own, the
+    ones of the scene when collectionNames is empty"""
+    if not collectionNames:
+        return addon.get_collection_groups(context)
+    groups = []
+    taken = set()
+    for collectionName in collectionNames:
+        objects = [
+            obj
+            for obj in get_batch_objects(addon, context, [collectionName])
+            if obj.name not in taken
+        ]
+        taken.update(obj.name for obj in objects)
+        if objects:
+            groups.append((collectionName, objects))
+    return groups
+
+
+def unwrap_blend(addon, job):
+    """Unwrap and save the open file, returns its report"""
+    import bpy
+
+    context = bpy.context
+    timings = dict()
+    start = time.perf_counter()
+    scene = context.scene
+    set_properties(scene.pack_tool, job["pack"])
+    set_properties(scene.chart_tool, job["chart"])
+    # the atlas stats only come back over the binary transport
+    sharedOptions = dict({"useBinaryTransport": True}, **job["shared"])
+    set_properties(scene.shared_properties, sharedOptions)
+
+    reporter = BatchReporter()
+    if job["perCollection"]:
+        groups = get_batch_groups(addon, context, job["collections"])
+        unwrapRun = addon.UnwrapPipeline(groups, scene.shared_properties.pipelineDepth)
+        status = unwrapRun.prepare(reporter, context)
+    else:
+        objects = get_batch_objects(addon, context, job["collections"])
+        unwrapRun = addon.UnwrapRun()
+        status = unwrapRun.prepare(reporter, context, objects)
+    timings["prepare"] = time.perf_counter() - start
+    if status is not None and "CANCELLED" in status:
+        raise RuntimeError("; ".join(reporter.messages))
+
+    lap = time.perf_counter()
+    if status is None and job["perCollection"]:
+        # the next collections are read while xatlas unwraps the first
+        error = unwrapRun.run(context)
+        if error is not None:
+            raise error
+    elif status is None:
+        for meshData, result in unwrapRun.results():
+            unwrapRun.apply(context, meshData, result)
+        unwrapRun.finish(context)
+    timings["unwrap"] = time.perf_counter() - lap
+
+    lap = time.perf_counter()
+    bpy.ops.wm.save_as_mainfile(filepath=job["output"])
+    timings["save"] = time.perf_counter() - lap
+
+    runReport = unwrapRun.get_report()
+    return {
+        "objects": unwrapRun.unwrappedCount,
+        "charts": runReport["charts"],
+        "atlases": runReport["atlases"],
+        "cacheHits": runReport["cacheHits"],
+        "cacheMisses": runReport["cacheMisses"],
+        "messages": reporter.messages,
+        "timings": timings,
+        "run": runReport,
+    }
+
+
+def blender_main(argv):
+    import addon_utils
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--job", required=True)
+    parser.add_argument("--report", required=True)
+    arguments = parser.parse_args(argv)
+    with open(arguments.job, encoding="utf-8") as jobFile:
+        job = json.load(jobFile)
+
+    report = {"file": job["path"], "output": job["output"], "status": "ok"}
+    try:
+        addon = addon_utils.enable(job["addon"], default_set=False)
+        if addon is None:
+            raise RuntimeError("could not enable the addon %s" % job["addon"])
+        report.update(unwrap_blend(addon, job))
+    except Exception as error:
+        report["status"] = "failed"
+        report["error"] = "%s: %s" % (type(error).__name__, error)
+    with open(arguments.report, "w", encoding="utf-8") as reportFile:
+        json.dump(report, reportFile, indent=2)
+    return report["status"] == "ok"
+
+
+if __name__ == "__main__":
+    if "--" in sys.argv:
+        # run by Blender, everything after -- is for this script
+        if not blender_main(sys.argv[sys.argv.index("--") + 1 :]):
+            sys.exit(1)
+    else:
+        sys.exit(main())
@@ -0,0 +1,503 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Benchmarks of xatlas-blender on generated meshes, runs without Blender
+#   python benchmark.py -o results.json
+#   python benchmark.py --scenes 1M 5M --presets default bruteForce -o big.json
+#   python benchmark.py --compare baseline.json -o results.json
+#   python benchmark.py --compare baseline.json --input results.json
+#   python benchmark.py --library xatlas/libxatlas-blender-lib.so -o library.json
+#   python benchmark.py --threads 1 2 4 8 --cpus 0-7 -o threads.json
+#   python benchmark.py --calibrate
+# Every scene is unwrapped with every preset and thread count over the
+# binary transport, or in this process with --library.
+# The stages are:
+#   serialize      writing the input stream (mesh_data.write_binary_meshes),
+#                  0 with --library
+#   process        starting xatlas and moving the data through the pipes,
+#                  the wall time of the run minus the stages xatlas reports
+#   read           xatlas parsing the input
+#   addMeshes, computeCharts, packCharts, write    as reported by xatlas
+#   apply          turning the results into loop uvs, write_lightmap_uvs
+#                  without the final foreach_set that only Blender has
+# --compare flags every scene/preset that got slower than the baseline by
+# more than --threshold, or lost utilization, and exits with 1 if any did.
+# --calibrate times every auto_options tier on the scenes instead and
+# writes the calibration table of the Auto options, the addon's
+# auto_calibration.json when no path is given.
+
+import argparse
+import importlib
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import types
+from io import BytesIO
+
+import numpy as np
+
+RESULTS_VERSION = 1
+
+BASE_ARGUMENTS = ["-resolution", "1024", "-padding", "2"]
+
+PRESETS = {
+    "default": [],
+    "bruteForce": ["-bruteForce"],
+    "blockAlign": ["-blockAlign"],
+    "packOnly": ["-packOnly"],
+}
+
+DEFAULT_SCENES = ("1k", "10k", "100k", "objects_500")
+
+# a stage has to get this many seconds slower to count as a regression
+MIN_REGRESSION_SECONDS = 0.05
+
+# the auto options tiers are timed at this resolution and half of it
+CALIBRATION_RESOLUTION = 1024
+
+
+def load_modules():
+    """mesh_data, xatlas_protocol, xatlas_runner, xatlas_library and
+    auto_options without running the addon __init__, which needs bpy"""
+    package = __package__
+    if not package:
+        package = "_blender_xatlas"
+        if package not in sys.modules:
+            module = types.ModuleType(package)
+            module.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+            sys.modules[package] = module
+    return [
+        importlib.import_module(package + "." + name)
+        for name in (
+            "mesh_data",
+            "xatlas_protocol",
+            "xatlas_runner",
+            "xatlas_library",
+            "auto_options",
+        )
+    ]
+
+
+(
+    mesh_data,
+    xatlas_protocol,
+    xatlas_runner,
+    xatlas_library,
+    auto_options,
+) = load_modules()
+
+
+def bumpy_sphere(name, triangles, offset=(0.0, 0.0, 0.0), radius=1.0):
+    """A MeshData of about triangles triangles, a sphere with the poles cut
+    off and bumps that give xatlas a few charts to find"""
+    rings = max(2, int(round(math.sqrt(triangles / 4.0))))
+    segments = rings * 2
+    u, v = np.meshgrid(
+        np.linspace(0.0, 1.0, segments + 1, dtype=np.float32),
+        np.linspace(0.05, 0.95, rings + 1, dtype=np.float32),
+    )
+    theta = u * (2.0 * math.pi)
+    phi = v * math.pi
+    bump = radius * (1.0 + 0.15 * np.sin(5.0 * theta) * np.sin(4.0 * phi))
+    vertices = np.stack(
+        (
+            bump * np.sin(phi) * np.cos(theta),
+            bump * np.sin(phi) * np.sin(theta),
+            bump * np.cos(phi),
+        ),
+        axis=-1,
+    ).reshape(-1, 3)
+    vertexUvs = np.stack((u, v), axis=-1).reshape(-1, 2)
+
+    # two triangles for each quad of the grid
+    first = (
+        np.arange(rings)[:, None] * (segments + 1) + np.arange(segments)[None, :]
+    ).ravel()
+    quads = np.stack(
+        (first, first + 1, first + segments + 2, first + segments + 1), axis=-1
+    )
+    corners = quads[:, [0, 1, 2, 0, 2, 3]].ravel()
+
+    # one vertex per loop, like mesh_data.read_mesh_arrays
+    positions = vertices[corners] + np.array(offset, dtype=np.float32)
+    normals = vertices[corners] / np.linalg.norm(vertices[corners], axis=1)[:, None]
+    return mesh_data.MeshData(
+        name,
+        name,
+        positions.astype(np.float32),
+        normals.astype(np.float32),
+        vertexUvs[corners].astype(np.float32),
+        np.arange(len(corners), dtype=np.uint32),
+    )
+
+
+def many_objects(count, triangles):
+    # small objects in a grid, like a scene full of props
+    side = int(math.ceil(math.sqrt(count)))
+    return [
+        bumpy_sphere(
+            "object%d" % i, triangles, (3.0 * (i % side), 3.0 * (i // side), 0.0), 0.5
+        )
+        for i in range(count)
+    ]
+
+
+SCENES = {
+    "1k": lambda: [bumpy_sphere("sphere", 1000)],
+    "10k": lambda: [bumpy_sphere("sphere", 10000)],
+    "100k": lambda: [bumpy_sphere("sphere", 100000)],
+    "1M": lambda: [bumpy_sphere("sphere", 1000000)],
+    "5M": lambda: [bumpy_sphere("sphere", 5000000)],
+    "objects_500": lambda: many_objects(500, 200),
+    "objects_5000": lambda: many_objects(5000, 200),
+}
+
+
+class BenchmarkMesh:
+    # what write_lightmap_uvs needs of a Blender mesh
+    class UvData:
+        def foreach_set(self, attribute, values):
+            self.values = values
+
+    def __init__(self, loopCount):
+        self.loops = range(loopCount)
+        self.uv_layers = {"lightmap": types.SimpleNamespace(data=self.UvData())}
+
+
+def run_case(xatlas_path, meshes, arguments, library=None):
+    """Stage timings and atlas stats of one unwrap of meshes"""
+    stages = dict()
+    start = time.perf_counter()
+    if library is None:
+        inputStream = BytesIO()
+        mesh_data.write_binary_meshes(inputStream, meshes)
+        inputData = inputStream.getvalue()
+    stages["serialize"] = time.perf_counter() - start
+
+    control = xatlas_runner.RunControl()
+    start = time.perf_counter()
+    if library is None:
+        results = list(
+            xatlas_runner.run_xatlas(
+                xatlas_path, ["-binary"] + arguments, inputData, True, control
+            )
+        )
+    else:
+        results = list(library.run(meshes, arguments, control))
+    wallTime = time.perf_counter() - start
+    xatlasTimings = control.jobTimings.get(0, dict())
+    stages["process"] = wallTime - sum(xatlasTimings.values())
+    stages.update(xatlasTimings)
+
+    start = time.perf_counter()
+    for meshData, result in zip(meshes, results):
+        mesh_data.write_lightmap_uvs(
+            BenchmarkMesh(len(meshData.positions)),
+            "lightmap",
+            meshData.indices,
+            np.frombuffer(result.uvs, dtype=np.float32).reshape(-1, 2),
+            np.frombuffer(result.indices, dtype=np.uint32),
+        )
+    stages["apply"] = time.perf_counter() - start
+
+    stats = results[0].stats if results else None
+    return {
+        "stages": stages,
+        "total": sum(stages.values()),
+        "charts": stats.chartCount if stats else 0,
+        "atlases": stats.atlasCount if stats else 0,
+        "utilization": stats.utilization if stats else [],
+    }
+
+
+def median_case(runs):
+    # the median of every stage, the atlas is the same for every run
+    case = dict(runs[0])
+    case["stages"] = {
+        stage: statistics.median(run["stages"][stage] for run in runs)
+        for stage in runs[0]["stages"]
+    }
+    case["total"] = statistics.median(run["total"] for run in runs)
+    return case
+
+
+def run_benchmarks(
+    xatlas_path,
+    sceneNames,
+    presetNames,
+    repeat,
+    library=None,
+    threadCounts=(0,),
+    cpus="",
+):
+    """threadCounts are the -threads to run every case with, 0 is xatlas'
+    default of one per hardware thread. cpus is a -cpus list or empty"""
+    results = []
+    for sceneName in sceneNames:
+        meshes = SCENES[sceneName]()
+        triangles = sum(len(meshData.indices) // 3 for meshData in meshes)
+        for presetName in presetNames:
+            for threadCount in threadCounts:
+                arguments = BASE_ARGUMENTS + PRESETS[presetName]
+                if threadCount:
+                    arguments = arguments + ["-threads", str(threadCount)]
+                if cpus:
+                    arguments = arguments + ["-cpus", cpus]
+                runs = [
+                    run_case(xatlas_path, meshes, arguments, library)
+                    for i in range(repeat)
+                ]
+                case = dict(
+                    scene=sceneName,
+                    preset=presetName,
+                    threads=threadCount,
+                    triangles=triangles,
+                    objects=len(meshes),
+                    **median_case(runs),
+                )
+                print(
+                    "%-14s %-11s %3s %8.3fs  %s"
+                    % (
+                        sceneName,
+                        presetName,
+                        threadCount or "all",
+                        case["total"],
+                        " ".join(
+                            "%s %.3f" % (stage, seconds)
+                            for stage, seconds in case["stages"].items()
+                        ),
+                    )
+                )
+                results.append(case)
+    return results
+
+
+def run_calibration(
+    xatlas_path, sceneNames, repeat, library=None, machine=None, threadCount=0
+):
+    """The auto_options calibration table of every tier on the scenes"""
+    scenes = [(sceneName, SCENES[sceneName]()) for sceneName in sceneNames]
+    tierCases = []
+    for tier in auto_options.TIERS:
+        cases = []
+        # summed over the scenes, to see how packing grows with the resolution
+        packSeconds = [0.0, 0.0]
+        for sceneName, meshes in scenes:
+            stats = auto_options.get_mesh_stats(meshes)
+            for half, resolution in enumerate(
+                (CALIBRATION_RESOLUTION, CALIBRATION_RESOLUTION // 2)
+            ):
+                arguments = ["-resolution", str(resolution), "-padding", "2"]
+                arguments += auto_options.option_arguments(tier["pack"])
+                arguments += auto_options.option_arguments(tier["chart"])
+                if threadCount:
+                    arguments += ["-threads", str(threadCount)]
+                case = median_case(
+                    [
+                        run_case(xatlas_path, meshes, arguments, library)
+                        for i in range(repeat)
+                    ]
+                )
+                packSeconds[half] += case["stages"]["packCharts"]
+                if resolution == CALIBRATION_RESOLUTION:
+                    stages = {
+                        "pack": case["stages"]["packCharts"],
+                        "chart": case["total"] - case["stages"]["packCharts"],
+                    }
+                    cases.append((stats, stages))
+                print(
+                    "%-11s %-14s %5d %8.3fs  packCharts %.3f"
+                    % (
+                        tier["name"],
+                        sceneName,
+                        resolution,
+                        case["total"],
+                        case["stages"]["packCharts"],
+                    )
+                )
+        resolutionExponent = 1.0
+        if packSeconds[0] > 0.0 and packSeconds[1] > 0.0:
+            # between flat and a brute force search of every texel
+            resolutionExponent = min(
+                3.0, max(0.0, math.log2(packSeconds[0] / packSeconds[1]))
+            )
+        tierCases.append((tier, cases, resolutionExponent))
+    return auto_options.make_calibration(
+        tierCases, CALIBRATION_RESOLUTION, machine
+    )
+
+
+def get_machine():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def case_key(case):
+    # results from before the thread counts ran with the default
+    return case["scene"], case["preset"], case.get("threads", 0)
+
+
+def compare_results(baseline, current, threshold):
+    """Messages for every case of current that regressed against baseline"""
+    baselineCases = {case_key(case): case for case in baseline["results"]}
+    regressions = []
+    for case in current["results"]:
+        key = case_key(case)
+        if key not in baselineCases:
+            continue
+        old = baselineCases[key]
+
+        def slower(oldSeconds, newSeconds):
+            return (
+                newSeconds > oldSeconds * (1.0 + threshold)
+                and newSeconds - oldSeconds > MIN_REGRESSION_SECONDS
+            )
+
+        if slower(old["total"], case["total"]):
+            stages = [
+                "%s %.3f -> %.3fs" % (stage, old["stages"][stage], seconds)
+                for stage, seconds in case["stages"].items()
+                if stage in old["stages"] and slower(old["stages"][stage], seconds)
+            ]
+            message = "%s/%s/%d %.3f -> %.3fs" % (key + (old["total"], case["total"]))
+            if stages:
+                message += " (%s)" % ", ".join(stages)
+            regressions.append(message)
+        oldUtilization = statistics.fmean(old["utilization"] or [0.0])
+        newUtilization = statistics.fmean(case["utilization"] or [0.0])
+        if newUtilization < oldUtilization - 0.01:
+            regressions.append(
+                "%s/%s/%d utilization %.1f%% -> %.1f%%"
+                % (key + (oldUtilization * 100.0, newUtilization * 100.0))
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark xatlas-blender")
+    parser.add_argument(
+        "--scenes",
+        nargs="+",
+        default=list(DEFAULT_SCENES),
+        choices=list(SCENES),
+        help="default: %s" % " ".join(DEFAULT_SCENES),
+    )
+    parser.add_argument(
+        "--presets", nargs="+", default=list(PRESETS), choices=list(PRESETS)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--threads",
+        nargs="+",
+        type=int,
+        default=[0],
+        help="xatlas thread counts to run every case with, 0 is all cores",
+    )
+    parser.add_argument("--cpus", default="", help="pin xatlas to these cpus, 0-3,8")
+    parser.add_argument("--xatlas", help="xatlas-blender to run, the addon's one")
+    parser.add_argument("--library", help="run xatlas in process from this library")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--log", help="keep the xatlas log in this file")
+    parser.add_argument("--input", help="compare these results instead of running")
+    parser.add_argument("--compare", help="baseline results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="how much slower counts as a regression, 0.1 is 10%%",
+    )
+    parser.add_argument(
+        "--calibrate",
+        nargs="?",
+        const=auto_options.get_calibration_path(),
+        help="write the Auto options calibration table, the addon's by default",
+    )
+    arguments = parser.parse_args(argv)
+
+    xatlas_runner.logFile = open(arguments.log or os.devnull, "w", encoding="utf-8")
+
+    if arguments.calibrate:
+        xatlas_path = arguments.xatlas or xatlas_runner.get_xatlas_path()
+        library = None
+        if arguments.library:
+            library = xatlas_library.load_library(arguments.library)
+            if library is None:
+                parser.error("could not load %s" % arguments.library)
+            library.set_log(arguments.log or os.devnull)
+        calibration = run_calibration(
+            xatlas_path,
+            arguments.scenes,
+            arguments.repeat,
+            library,
+            # the threads xatlas charted on, to scale the fits on other machines
+            dict(get_machine(), threads=arguments.threads[0] or os.cpu_count()),
+            arguments.threads[0],
+        )
+        with open(arguments.calibrate, "w", encoding="utf-8") as calibrationFile:
+            json.dump(calibration, calibrationFile, indent=2)
+        print("Wrote %s" % arguments.calibrate)
+        return 0
+
+    if arguments.input:
+        with open(arguments.input, encoding="utf-8") as resultsFile:
+            current = json.load(resultsFile)
+    else:
+        xatlas_path = arguments.xatlas or xatlas_runner.get_xatlas_path()
+        library = None
+        if arguments.library:
+            library = xatlas_library.load_library(arguments.library)
+            if library is None:
+                parser.error("could not load %s" % arguments.library)
+            library.set_log(arguments.log or os.devnull)
+            xatlas_path = arguments.library
+        current = {
+            "version": RESULTS_VERSION,
+            "machine": get_machine(),
+            "xatlas": xatlas_path,
+            "arguments": BASE_ARGUMENTS,
+            "cpuSet": arguments.cpus,
+            "results": run_benchmarks(
+                xatlas_path,
+                arguments.scenes,
+                arguments.presets,
+                arguments.repeat,
+                library,
+                arguments.threads,
+                arguments.cpus,
+            ),
+        }
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as resultsFile:
+            json.dump(current, resultsFile, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare, encoding="utf-8") as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = compare_results(baseline, current, arguments.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        print("%d regressions" % len(regressions))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
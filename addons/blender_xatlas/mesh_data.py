@@ -0,0 +1,363 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Mesh extraction for xatlas
+# Every loop (face corner) becomes one xatlas vertex, so positions, normals
+# and uvs are per loop and the triangle indices are plain loop indices.
+# xatlas merges colocal positions itself, and the results map straight
+# back onto the loops of the mesh.
+# Positions are in world space so objects sharing an atlas get the same
+# texel density, like the obj export did.
+# With Selected Faces Only just the loops of the selected faces are sent,
+# loops maps them back, and the other triangles only send their lightmap uvs
+# (fixedUvs) so the new charts are packed around them.
+# Atlas Per Material cuts the meshes up the same way, one MeshData for the
+# triangles of each material group.
+
+import dataclasses
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from . import xatlas_protocol
+
+# peak memory of an xatlas job, measured on the benchmark.py scenes: a fixed
+# part plus one for each triangle, which also covers the arrays sent to xatlas
+# and the results read back
+JOB_BASE_BYTES = 32 * 1024 * 1024
+JOB_BYTES_PER_TRIANGLE = 700
+
+
+@dataclass
+class MeshData:
+    name: str  # name sent to xatlas
+    objectName: str
+    positions: np.ndarray  # float32, (loops, 3), world space
+    normals: np.ndarray  # float32, (loops, 3), world space
+    uvs: Optional[np.ndarray]  # float32, (loops, 2), main uv if there is one
+    indices: np.ndarray  # uint32, (triangles * 3), loop index of each corner
+    # float32, (loops, 2), chart layout from an earlier incremental unwrap
+    charts: Optional[np.ndarray] = None
+    # uint32, (vertices,), the loop of each vertex when only some were read
+    loops: Optional[np.ndarray] = None
+    # float32, (fixed triangles * 3, 2), lightmap uvs of the triangles that keep them
+    fixedUvs: Optional[np.ndarray] = None
+    fixedAreas: Tuple[float, float] = (0.0, 0.0)  # uv and world space, of fixedUvs
+    # int32, (triangles,), material slot of each triangle when they were read
+    materials: Optional[np.ndarray] = None
+
+
+def get_main_uv_layer(mesh, sharedProperties):
+    uv_layers = mesh.uv_layers
+    if sharedProperties.mainUVChoiceType == "NAME":
+        return uv_layers.get(sharedProperties.mainUVName)
+    elif sharedProperties.mainUVChoiceType == "INDEX":
+        if sharedProperties.mainUVIndex < len(uv_layers):
+            return uv_layers[sharedProperties.mainUVIndex]
+    return None
+
+
+def read_mesh_arrays(mesh, mainUVLayer, matrix):
+    loopCount = len(mesh.loops)
+
+    vertexCo = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", vertexCo)
+    loopVertices = np.empty(loopCount, dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loopVertices)
+    positions = vertexCo.reshape(-1, 3)[loopVertices]
+
+    normals = np.empty(loopCount * 3, dtype=np.float32)
+    if hasattr(mesh, "corner_normals"):
+        mesh.corner_normals.foreach_get("vector", normals)
+    else:
+        mesh.calc_normals_split()
+        mesh.loops.foreach_get("normal", normals)
+
+    uvs = None
+    if mainUVLayer is not None:
+        uvs = np.empty(loopCount * 2, dtype=np.float32)
+        mainUVLayer.data.foreach_get("uv", uvs)
+        uvs = uvs.reshape(-1, 2)
+
+    mesh.calc_loop_triangles()
+    indices = np.empty(len(mesh.loop_triangles) * 3, dtype=np.uint32)
+    mesh.loop_triangles.foreach_get("loops", indices)
+
+    # to world space, normals by the inverse transpose
+    matrix = np.array(matrix, dtype=np.float32)
+    positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
+    normals = normals.reshape(-1, 3) @ np.linalg.pinv(matrix[:3, :3])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= np.where(lengths > 0.0, lengths, 1.0)
+
+    return (
+        positions.astype(np.float32),
+        normals.astype(np.float32),
+        uvs,
+        indices,
+    )
+
+
+def read_selected_triangles(mesh, polygonSelect):
+    """Whether each loop triangle of mesh (calc_loop_triangles done) is part
+    of a selected face, polygonSelect being the select of every polygon"""
+    polygons = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get("polygon_index", polygons)
+    return polygonSelect[polygons]
+
+
+def extract_mesh_data(
+    obj, name, depsgraph, sharedProperties, lightmapUVName=None, readMaterials=False
+):
+    """Read the evaluated (modifiers applied) geometry of obj.
+    Falls back to the base mesh when the modifiers change the topology,
+    since the results have to map back onto the original loops and faces.
+    With lightmapUVName only the faces selected in edit mode are kept, the
+    others keep their uvs of that layer, see keep_selected_triangles.
+    readMaterials fills in the materials of the MeshData"""
+    objEval = obj.evaluated_get(depsgraph)
+    mesh = objEval.to_mesh()
+    try:
+        if (
+            mesh is None
+            or len(mesh.loops) != len(obj.data.loops)
+            or len(mesh.polygons) != len(obj.data.polygons)
+        ):
+            mesh = obj.data
+        arrays = read_mesh_arrays(
+            mesh, get_main_uv_layer(mesh, sharedProperties), obj.matrix_world
+        )
+        meshData = MeshData(name, obj.name, *arrays)
+        if readMaterials:
+            meshData.materials = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+            mesh.loop_triangles.foreach_get("material_index", meshData.materials)
+        if lightmapUVName is not None:
+            polygonSelect = np.empty(len(obj.data.polygons), dtype=bool)
+            obj.data.polygons.foreach_get("select", polygonSelect)
+            lightmapUvs = np.empty(len(obj.data.loops) * 2, dtype=np.float32)
+            obj.data.uv_layers[lightmapUVName].data.foreach_get("uv", lightmapUvs)
+            keep_selected_triangles(
+                meshData,
+                read_selected_triangles(mesh, polygonSelect),
+                lightmapUvs.reshape(-1, 2),
+            )
+    finally:
+        objEval.to_mesh_clear()
+    return meshData
+
+
+def keep_selected_triangles(meshData, selected, lightmapUvs):
+    """Cut meshData down to the loops of its selected triangles (bool per
+    triangle). The others go to fixedUvs with their lightmapUvs (per loop)"""
+    triangles = meshData.indices.reshape(-1, 3)
+    fixedUvs = lightmapUvs[triangles[~selected]]
+    edges = (fixedUvs[:, 1:] - fixedUvs[:, :1]).astype(np.float64)
+    uvArea = np.abs(
+        edges[:, 0, 0] * edges[:, 1, 1] - edges[:, 0, 1] * edges[:, 1, 0]
+    ).sum()
+    meshData.fixedAreas = (float(uvArea) * 0.5, triangle_area(meshData, ~selected))
+    if len(fixedUvs):
+        meshData.fixedUvs = np.ascontiguousarray(
+            fixedUvs.reshape(-1, 2), dtype=np.float32
+        )
+    cut_triangles(meshData, selected)
+
+
+def cut_triangles(meshData, triangles):
+    """Leave only the triangles (bool per triangle) in meshData and only the
+    vertices they use, loops keeps track of which loop each vertex is"""
+    loops, indices = np.unique(
+        meshData.indices.reshape(-1, 3)[triangles], return_inverse=True
+    )
+    meshData.indices = indices.reshape(-1).astype(np.uint32)
+    if meshData.materials is not None:
+        meshData.materials = meshData.materials[triangles]
+    for field in ("positions", "normals", "uvs", "charts"):
+        values = getattr(meshData, field)
+        if values is not None:
+            setattr(meshData, field, values[loops])
+    if meshData.loops is not None:
+        loops = meshData.loops[loops]
+    meshData.loops = loops.astype(np.uint32)
+
+
+def split_triangles(meshData, triangleGroups):
+    """A (group, MeshData) for every group in triangleGroups (one per
+    triangle) with its triangles, named after meshData and the group"""
+    subMeshes = []
+    for group in np.unique(triangleGroups).tolist():
+        subMeshData = dataclasses.replace(
+            meshData, name="%s_%d" % (meshData.name, group)
+        )
+        cut_triangles(subMeshData, triangleGroups == group)
+        subMeshes.append((group, subMeshData))
+    return subMeshes
+
+
+def drop_unselected(meshDataList, individualAtlas):
+    """The MeshData of meshDataList that have selected triangles. Unless
+    each gets its own atlas the fixedUvs of the others still take space in
+    the shared one, so they go to the first that stays"""
+    selected = [meshData for meshData in meshDataList if len(meshData.indices)]
+    if individualAtlas or not selected:
+        return selected
+    fixedUvs = [
+        meshData.fixedUvs for meshData in meshDataList if meshData.fixedUvs is not None
+    ]
+    if fixedUvs:
+        selected[0].fixedUvs = np.concatenate(fixedUvs)
+        for meshData in selected[1:]:
+            meshData.fixedUvs = None
+    return selected
+
+
+def triangle_area(meshData, triangles=slice(None)):
+    # world space surface area of the triangles of meshData
+    corners = np.asarray(meshData.positions, dtype=np.float64)[
+        np.asarray(meshData.indices, dtype=np.int64).reshape(-1, 3)[triangles]
+    ]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    return float(np.linalg.norm(normals, axis=1).sum()) * 0.5
+
+
+def fixed_texels_per_unit(meshDataList, resolution):
+    """The texel density of the fixed uvs at resolution, to pack the new
+    charts at the same one. 0 when there is nothing to measure it on"""
+    uvArea = sum(meshData.fixedAreas[0] for meshData in meshDataList)
+    worldArea = sum(meshData.fixedAreas[1] for meshData in meshDataList)
+    if uvArea <= 0.0 or worldArea <= 0.0:
+        return 0.0
+    return math.sqrt(uvArea / worldArea) * resolution
+
+
+def split_batches(meshDataList, memoryLimit):
+    """meshDataList split in order into lists that are each estimated to need
+    at most memoryLimit bytes in one xatlas job. A mesh that doesn't fit on its
+    own gets a batch to itself"""
+    batches = []
+    batchBytes = 0
+    for meshData in meshDataList:
+        meshBytes = len(meshData.indices) // 3 * JOB_BYTES_PER_TRIANGLE
+        if not batches or batchBytes + meshBytes > memoryLimit:
+            batches.append([])
+            batchBytes = JOB_BASE_BYTES
+        batches[-1].append(meshData)
+        batchBytes += meshBytes
+    return batches
+
+
+def get_triangle_loops(meshData):
+    # the loop of every triangle corner of meshData
+    if meshData.loops is None:
+        return meshData.indices
+    return meshData.loops[meshData.indices]
+
+
+def write_lightmap_uvs(mesh, uvName, triangleLoops, uvs, indices, keep=False):
+    """Write xatlas output to a uv layer with a single foreach_set.
+    triangleLoops are the loops of the MeshData triangles the output was made
+    from, uvs[indices] are the new uvs of those triangle corners. With keep
+    the other loops keep their uvs, else they are zeroed"""
+    uvLayer = mesh.uv_layers[uvName]
+    loopUvs = np.zeros((len(mesh.loops), 2), dtype=np.float32)
+    if keep:
+        uvLayer.data.foreach_get("uv", loopUvs.ravel())
+    loopUvs[triangleLoops] = uvs[indices]
+    uvLayer.data.foreach_set("uv", loopUvs.ravel())
+
+
+def chart_image_array(image):
+    """The texels of an xatlas_protocol.AtlasImage as a (height, width) uint32
+    array, row 0 at v = 0"""
+    return np.frombuffer(image.texels, dtype=np.uint32).reshape(
+        image.height, image.width
+    )
+
+
+def chart_image_pixels(image):
+    """Float RGBA pixels of an AtlasImage for a Blender image, which also
+    starts at v = 0: the chart index in red (-1 where there is no chart) and 1
+    in green for padding and in blue for bilinear texels"""
+    texels = chart_image_array(image).ravel()
+    hasChart = (texels & xatlas_protocol.IMAGE_HAS_CHART_INDEX_BIT) != 0
+    pixels = np.ones((len(texels), 4), dtype=np.float32)
+    pixels[:, 0] = np.where(
+        hasChart, texels & xatlas_protocol.IMAGE_CHART_INDEX_MASK, -1
+    )
+    pixels[:, 1] = (texels & xatlas_protocol.IMAGE_IS_PADDING_BIT) != 0
+    pixels[:, 2] = (texels & xatlas_protocol.IMAGE_IS_BILINEAR_BIT) != 0
+    return pixels.ravel()
+
+
+def write_chart_image(blendData, name, image):
+    """Put the AtlasImage into the float image datablock name, packed into
+    the .blend so it is saved with it"""
+    blendImage = blendData.images.get(name)
+    if blendImage is not None and tuple(blendImage.size) != (
+        image.width,
+        image.height,
+    ):
+        blendData.images.remove(blendImage)
+        blendImage = None
+    if blendImage is None:
+        blendImage = blendData.images.new(
+            name, image.width, image.height, alpha=True, float_buffer=True
+        )
+    blendImage.colorspace_settings.is_data = True
+    blendImage.pixels.foreach_set(chart_image_pixels(image))
+    blendImage.file_format = "OPEN_EXR"
+    blendImage.pack()
+    return blendImage
+
+
+def write_binary_meshes(stream, meshDataList, arguments=None):
+    xatlas_protocol.write_header(stream)
+    if arguments:
+        xatlas_protocol.write_arguments(stream, arguments)
+    for meshData in meshDataList:
+        xatlas_protocol.write_mesh(
+            stream,
+            meshData.name,
+            np.ascontiguousarray(meshData.positions),
+            meshData.indices,
+            np.ascontiguousarray(meshData.normals),
+            None if meshData.uvs is None else np.ascontiguousarray(meshData.uvs),
+            None if meshData.charts is None else np.ascontiguousarray(meshData.charts),
+            meshData.fixedUvs,
+        )
+    xatlas_protocol.write_end(stream)
+
+
+def write_obj_text(stream, meshDataList):
+    # text fallback, the same data as write_binary_meshes but as OBJ
+    firstVertex = firstUv = 1  # obj is 1 indexed
+    for meshData in meshDataList:
+        stream.write("o " + meshData.name + "\n")
+        np.savetxt(stream, meshData.positions, fmt="v %.9g %.9g %.9g")
+        np.savetxt(stream, meshData.normals, fmt="vn %.9g %.9g %.9g")
+        faces = meshData.indices.reshape(-1, 3).astype(np.int64)
+        if meshData.uvs is not None:
+            np.savetxt(stream, meshData.uvs, fmt="vt %.9g %.9g")
+            # v/vt/vn
+            faces = np.stack(
+                (faces + firstVertex, faces + firstUv, faces + firstVertex), axis=2
+            )
+            np.savetxt(stream, faces.reshape(-1, 9), fmt="f" + " %d/%d/%d" * 3)
+            firstUv += len(meshData.uvs)
+        else:
+            # v//vn
+            faces = np.stack((faces + firstVertex, faces + firstVertex), axis=2)
+            np.savetxt(stream, faces.reshape(-1, 6), fmt="f" + " %d//%d" * 3)
+        firstVertex += len(meshData.positions)
@@ -0,0 +1,152 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# On disk cache of xatlas results
+# A job (one atlas) is keyed on the hash of everything sent to xatlas:
+# the extracted arrays of its meshes and the arguments.
+# Each entry is the binary output stream of the job, the results are
+# matched to the meshes by order since the names change every run.
+# File modification times are the LRU order, a hit touches its file.
+# The chart layouts of incremental unwraps are kept the same way, as raw
+# bytes keyed on a single mesh and the chart options.
+
+import hashlib
+import os
+from io import BytesIO
+
+from . import xatlas_protocol
+
+CACHE_VERSION = b"1"
+CACHE_EXTENSION = ".xab"
+
+# options that only change how xatlas runs, each takes one value
+SCHEDULING_ARGUMENTS = ("-threads", "-cpus")
+
+
+def result_arguments(arguments):
+    # arguments without the ones that don't change the results
+    kept = []
+    skip = False
+    for argument in arguments:
+        if skip:
+            skip = False
+        elif argument in SCHEDULING_ARGUMENTS:
+            skip = True
+        else:
+            kept.append(argument)
+    return kept
+
+
+def job_key(meshDataList, arguments, xatlas_path):
+    digest = hashlib.blake2b(CACHE_VERSION, digest_size=20)
+    # a rebuilt xatlas can give different results
+    xatlasStat = os.stat(xatlas_path)
+    digest.update(
+        ("%d %d\n" % (xatlasStat.st_size, xatlasStat.st_mtime_ns)).encode()
+    )
+    digest.update("\0".join(result_arguments(arguments)).encode("utf-8"))
+    for meshData in meshDataList:
+        arrays = (
+            meshData.positions,
+            meshData.normals,
+            meshData.uvs,
+            meshData.indices,
+            meshData.charts,
+            meshData.fixedUvs,
+        )
+        for values in arrays:
+            if values is None:
+                digest.update(b"\0none")
+                continue
+            digest.update(("\0%s %s" % (values.dtype.str, values.shape)).encode())
+            digest.update(memoryview(values.copy(order="C")).cast("B"))
+    return digest.hexdigest()
+
+
+class UnwrapCache:
+    def __init__(self, directory, sizeLimit):
+        self.directory = directory
+        self.sizeLimit = sizeLimit  # bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def get_bytes(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cacheFile:
+                data = cacheFile.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put_bytes(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # written next to the entry and renamed so a reader never sees half of it
+        tempPath = "%s.%d.tmp" % (path, os.getpid())
+        with open(tempPath, "wb") as cacheFile:
+            cacheFile.write(data)
+        os.replace(tempPath, path)
+        self.evict()
+
+    def get(self, key):
+        """The MeshResults stored for key, or None"""
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        try:
+            return list(xatlas_protocol.iter_mesh_results(BytesIO(data)))
+        except xatlas_protocol.ProtocolError:
+            return None
+
+    def put(self, key, results):
+        stream = BytesIO()
+        xatlas_protocol.write_mesh_results(stream, results)
+        self.put_bytes(key, stream.getbuffer())
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as scan:
+                return [
+                    entry
+                    for entry in scan
+                    if entry.name.endswith(CACHE_EXTENSION) and entry.is_file()
+                ]
+        except FileNotFoundError:
+            return []
+
+    def size(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits sizeLimit"""
+        entries = [(entry.stat(), entry.path) for entry in self._entries()]
+        totalSize = sum(entryStat.st_size for entryStat, path in entries)
+        entries.sort(key=lambda entry: entry[0].st_mtime_ns)
+        for entryStat, path in entries:
+            if totalSize <= self.sizeLimit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            totalSize -= entryStat.st_size
+
+    def clear(self):
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,330 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# xatlas in the Blender process, xatlas-blender built as a shared library
+# (see xatlas-blender.h) and loaded with ctypes.
+# A job is the same as one of the executable, but there is no process to
+# start and nothing is serialized: xatlas reads the MeshData arrays where
+# they are and the uvs are computed straight from the vertices of the packed
+# atlas while xatlas still has it. ctypes lets go of the GIL during a job.
+# A cancel only stops a job at its next progress update, there is no
+# process that can be killed, which is one reason the executable stays the
+# default.
+
+import ctypes
+import os
+import platform
+
+import numpy as np
+
+from . import xatlas_protocol
+
+# XAB_VERSION of xatlas-blender.h this was written against
+LIBRARY_VERSION = 4
+
+ERROR_SIZE = 1024
+
+
+class XabMesh(ctypes.Structure):
+    _fields_ = [
+        ("name", ctypes.c_char_p),
+        ("vertexCount", ctypes.c_uint32),
+        ("indexCount", ctypes.c_uint32),
+        ("positions", ctypes.c_void_p),
+        ("normals", ctypes.c_void_p),
+        ("uvs", ctypes.c_void_p),
+        ("charts", ctypes.c_void_p),
+        ("indices", ctypes.c_void_p),
+        ("fixedTriangleCount", ctypes.c_uint32),
+        ("fixedUvs", ctypes.c_void_p),
+    ]
+
+
+class XabTimings(ctypes.Structure):
+    _fields_ = [
+        ("read", ctypes.c_double),
+        ("addMeshes", ctypes.c_double),
+        ("computeCharts", ctypes.c_double),
+        ("packCharts", ctypes.c_double),
+        ("write", ctypes.c_double),
+    ]
+
+
+# xatlas::Mesh and xatlas::Atlas of xatlas.h
+class XatlasMesh(ctypes.Structure):
+    _fields_ = [
+        ("chartArray", ctypes.c_void_p),
+        ("indexArray", ctypes.c_void_p),
+        ("vertexArray", ctypes.c_void_p),
+        ("chartCount", ctypes.c_uint32),
+        ("indexCount", ctypes.c_uint32),
+        ("vertexCount", ctypes.c_uint32),
+    ]
+
+
+class XatlasAtlas(ctypes.Structure):
+    _fields_ = [
+        ("image", ctypes.c_void_p),
+        ("meshes", ctypes.POINTER(XatlasMesh)),
+        ("width", ctypes.c_uint32),
+        ("height", ctypes.c_uint32),
+        ("atlasCount", ctypes.c_uint32),
+        ("chartCount", ctypes.c_uint32),
+        ("meshCount", ctypes.c_uint32),
+        ("utilization", ctypes.POINTER(ctypes.c_float)),
+        ("texelsPerUnit", ctypes.c_float),
+        ("timeLimitedChartCount", ctypes.c_uint32),
+    ]
+
+
+# xatlas::Vertex
+VERTEX_DTYPE = np.dtype(
+    [
+        ("atlasIndex", "<i4"),
+        ("chartIndex", "<i4"),
+        ("uv", "<f4", (2,)),
+        ("xref", "<u4"),
+    ]
+)
+
+# AtlasLayout of xatlas-blender.cpp
+ATLAS_LAYOUT_SPREADX = 1
+ATLAS_LAYOUT_UDIM = 2
+
+ProgressFunc = ctypes.CFUNCTYPE(
+    ctypes.c_bool, ctypes.c_uint32, ctypes.c_uint32, ctypes.c_void_p
+)
+AtlasFunc = ctypes.CFUNCTYPE(
+    None,
+    ctypes.c_uint32,
+    ctypes.c_uint32,
+    ctypes.c_uint32,
+    ctypes.POINTER(XatlasAtlas),
+    ctypes.POINTER(ctypes.POINTER(ctypes.c_float)),
+    ctypes.c_void_p,
+)
+
+
+def get_library_path():
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xatlas")
+    if platform.system() == "Windows":
+        return os.path.join(directory, "xatlas-blender-lib.dll")
+    if platform.system() == "Darwin":
+        return os.path.join(directory, "libxatlas-blender-lib.dylib")
+    return os.path.join(directory, "libxatlas-blender-lib.so")
+
+
+def view_array(address, dtype, count):
+    """count values of dtype at address, without copying them"""
+    dtype = np.dtype(dtype)
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    buffer = (ctypes.c_uint8 * (count * dtype.itemsize)).from_address(address)
+    return np.frombuffer(buffer, dtype=dtype)
+
+
+def atlas_uvs(atlas, vertices, atlasLayout, firstAtlas=0):
+    """Normalized uvs of the vertices of one mesh with the atlas layout
+    applied, like WriteBinaryMeshes computes them"""
+    uvs = vertices["uv"] / np.array([atlas.width, atlas.height], dtype=np.float32)
+    if atlasLayout == ATLAS_LAYOUT_SPREADX:
+        uvs[:, 0] += np.maximum(vertices["atlasIndex"], 0) + firstAtlas
+    elif atlasLayout == ATLAS_LAYOUT_UDIM:
+        atlasIndex = np.maximum(vertices["atlasIndex"], 0) + firstAtlas
+        uvs[:, 0] += atlasIndex % 10
+        uvs[:, 1] += atlasIndex // 10
+    return uvs
+
+
+def get_mesh_array(values, dtype, shape):
+    # a C contiguous array MeshDecl can read, only copied when it isn't one
+    if values is None:
+        return None
+    return np.ascontiguousarray(values, dtype=dtype).reshape(shape)
+
+
+class XatlasLibrary:
+    def __init__(self, path):
+        self.path = path
+        self.dll = ctypes.CDLL(path)
+        self.dll.xabVersion.restype = ctypes.c_uint32
+        self.dll.xabVersion.argtypes = []
+        version = self.dll.xabVersion()
+        if version != LIBRARY_VERSION:
+            raise OSError(
+                "%s is version %d, expected %d" % (path, version, LIBRARY_VERSION)
+            )
+        self.dll.xabSetLog.restype = ctypes.c_bool
+        self.dll.xabSetLog.argtypes = [ctypes.c_char_p]
+        self.dll.xabRunJob.restype = ctypes.c_bool
+        self.dll.xabRunJob.argtypes = [
+            ctypes.POINTER(ctypes.c_char_p),
+            ctypes.c_uint32,
+            ctypes.POINTER(XabMesh),
+            ctypes.c_uint32,
+            ProgressFunc,
+            AtlasFunc,
+            ctypes.c_void_p,
+            ctypes.POINTER(XabTimings),
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+
+    def set_log(self, path):
+        """Append the xatlas log to the file at path, stderr when None"""
+        if path is not None:
+            path = os.fsencode(path)
+        if not self.dll.xabSetLog(path):
+            raise OSError("could not open the xatlas log %s" % path)
+
+    def run(self, meshDataList, arguments, control=None, jobIndex=0):
+        """Like xatlas_runner.run_xatlas with the binary transport, yields
+        the MeshResults of meshDataList once the job is done.
+        arguments are the xatlas options, -binary and friends are not needed"""
+        # keeps the arrays xatlas reads alive until it is done
+        meshArrays = []
+        meshes = (XabMesh * len(meshDataList))()
+        for mesh, meshData in zip(meshes, meshDataList):
+            positions = get_mesh_array(meshData.positions, np.float32, (-1, 3))
+            normals = get_mesh_array(meshData.normals, np.float32, (-1, 3))
+            uvs = get_mesh_array(meshData.uvs, np.float32, (-1, 2))
+            charts = get_mesh_array(meshData.charts, np.float32, (-1, 2))
+            indices = get_mesh_array(meshData.indices, np.uint32, -1)
+            fixedUvs = get_mesh_array(meshData.fixedUvs, np.float32, (-1, 2))
+            name = meshData.name.encode("utf-8")
+            meshArrays.append(
+                (name, positions, normals, uvs, charts, indices, fixedUvs)
+            )
+            mesh.name = name
+            mesh.vertexCount = len(positions)
+            mesh.indexCount = len(indices)
+            mesh.positions = positions.ctypes.data
+            mesh.indices = indices.ctypes.data
+            optionalArrays = (("normals", normals), ("uvs", uvs), ("charts", charts))
+            for field, values in optionalArrays:
+                if values is not None:
+                    setattr(mesh, field, values.ctypes.data)
+            if fixedUvs is not None:
+                mesh.fixedTriangleCount = len(fixedUvs) // 3
+                mesh.fixedUvs = fixedUvs.ctypes.data
+
+        results = []
+        callbackErrors = []
+
+        def on_progress(category, progress, userData):
+            if control is None:
+                return True
+            control.update(jobIndex, category, progress)
+            return not control.cancelled
+
+        def on_atlas(target, atlasLayout, firstAtlas, atlasPointer, charts, userData):
+            # exceptions can't get through xatlas, they are raised after it
+            try:
+                atlas = atlasPointer.contents
+                stats = xatlas_protocol.AtlasStats(
+                    atlas.chartCount,
+                    atlas.atlasCount,
+                    atlas.width,
+                    atlas.height,
+                    atlas.utilization[: atlas.atlasCount],
+                    atlas.timeLimitedChartCount,
+                )
+                images = None
+                if atlas.image:
+                    # only there with -chartImage
+                    texelCount = atlas.width * atlas.height
+                    images = [
+                        xatlas_protocol.AtlasImage(
+                            firstAtlas + i,
+                            atlas.width,
+                            atlas.height,
+                            view_array(
+                                atlas.image + i * texelCount * 4, np.uint32, texelCount
+                            ).copy(),
+                        )
+                        for i in range(atlas.atlasCount)
+                    ]
+                for i, meshData in enumerate(meshDataList):
+                    mesh = atlas.meshes[i]
+                    vertices = view_array(
+                        mesh.vertexArray, VERTEX_DTYPE, mesh.vertexCount
+                    )
+                    # the atlas is gone after the call, so the results are copies
+                    result = xatlas_protocol.MeshResult(
+                        meshData.name,
+                        atlas_uvs(atlas, vertices, atlasLayout, firstAtlas),
+                        vertices["xref"].copy(),
+                        view_array(
+                            mesh.indexArray, np.uint32, mesh.indexCount
+                        ).copy(),
+                        target=target,
+                        stats=stats,
+                        images=images,
+                    )
+                    if charts[i]:
+                        result.charts = view_array(
+                            ctypes.addressof(charts[i].contents),
+                            np.float32,
+                            len(meshArrays[i][1]) * 2,
+                        ).copy()
+                    results.append(result)
+            except Exception as error:
+                callbackErrors.append(error)
+
+        encodedArguments = [argument.encode("utf-8") for argument in arguments]
+        timings = XabTimings()
+        error = ctypes.create_string_buffer(ERROR_SIZE)
+        succeeded = self.dll.xabRunJob(
+            (ctypes.c_char_p * len(encodedArguments))(*encodedArguments),
+            len(encodedArguments),
+            meshes,
+            len(meshDataList),
+            ProgressFunc(on_progress),
+            AtlasFunc(on_atlas),
+            None,
+            ctypes.byref(timings),
+            error,
+            ERROR_SIZE,
+        )
+        if control is not None:
+            control.set_timings(
+                jobIndex,
+                {
+                    field: getattr(timings, field)
+                    for field, fieldType in XabTimings._fields_
+                },
+            )
+        if callbackErrors:
+            raise callbackErrors[0]
+        if not succeeded:
+            raise xatlas_protocol.JobError(error.value.decode("utf-8", "replace"))
+        yield from results
+
+
+# path: XatlasLibrary, or None when it could not be loaded
+_libraries = dict()
+
+
+def load_library(path=None):
+    """The XatlasLibrary at path, the addon's one by default.
+    None when there is none or it can't be loaded, the reason is printed once"""
+    if path is None:
+        path = get_library_path()
+    if path not in _libraries:
+        _libraries[path] = None
+        if os.path.exists(path):
+            try:
+                _libraries[path] = XatlasLibrary(path)
+            except (OSError, AttributeError) as error:
+                print("Could not load the xatlas library %s: %s" % (path, error))
+    return _libraries[path]
@@ -0,0 +1,392 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Binary transport between the addon and xatlas-blender (-binary)
+# Both directions start with MAGIC followed by length-prefixed chunks:
+# a four character tag, the payload size as a uint32 and the payload.
+# The layout of each chunk is documented in xatlas-blender.cpp.
+# The text output (o/vt/f) is read into the same MeshResult.
+# Kept free of bpy/numpy so it can be used outside of Blender.
+
+import struct
+from array import array
+from dataclasses import dataclass
+from typing import List, Optional
+
+MAGIC = b"XAB1"
+
+TAG_MESH = b"MESH"
+TAG_END = b"END "
+TAG_ARGS = b"ARGS"
+TAG_ERROR = b"ERR "
+TAG_CHARTS = b"CHRT"
+TAG_TARGET = b"TRGT"
+TAG_PROGRESS = b"PROG"
+TAG_STATS = b"STAT"
+TAG_TIMINGS = b"TIME"
+TAG_MEMORY = b"MEM "
+TAG_IMAGE = b"IMAG"
+
+MESH_HAS_NORMALS = 1 << 0
+MESH_HAS_UVS = 1 << 1
+MESH_HAS_CHARTS = 1 << 2
+MESH_HAS_FIXED_UVS = 1 << 3
+
+# the texels of an AtlasImage, kImage* of xatlas.h
+IMAGE_CHART_INDEX_MASK = 0x1FFFFFFF
+IMAGE_HAS_CHART_INDEX_BIT = 0x80000000
+IMAGE_IS_BILINEAR_BIT = 0x40000000
+IMAGE_IS_PADDING_BIT = 0x20000000
+
+_U32 = struct.Struct("<I")
+_CHUNK_HEADER = struct.Struct("<4sI")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class JobError(Exception):
+    """xatlas rejected the job, the stream itself is still intact"""
+
+    pass
+
+
+@dataclass
+class AtlasStats:
+    chartCount: int
+    atlasCount: int
+    width: int
+    height: int
+    utilization: List[float]  # 0 to 1, one per atlas
+    # charts placed without bruteForce because packTimeLimit passed
+    timeLimitedCharts: int = 0
+
+
+@dataclass
+class AtlasImage:
+    atlas: int  # place in the atlas layout, -firstAtlas + index
+    width: int
+    height: int
+    texels: array  # uint32, width * height rows from v = 0 up, see IMAGE_*
+
+
+@dataclass
+class MeshResult:
+    name: str
+    uvs: array  # float, 2 per output vertex
+    xrefs: array  # uint32, input vertex of each output vertex
+    indices: array  # uint32, 3 per triangle, local to the mesh
+    # float, 2 per input vertex, the chart layout computed with -incremental
+    charts: Optional[array] = None
+    target: int = 0  # index of the -target it was packed for
+    # the atlas it was packed into, shared by the results of the same atlas
+    stats: Optional[AtlasStats] = None
+    # the chart images of that atlas with -chartImage, shared the same way
+    images: Optional[List[AtlasImage]] = None
+
+
+def _as_bytes(data):
+    # anything exposing the buffer protocol (array.array, numpy arrays, bytes)
+    return memoryview(data).cast("B")
+
+
+def _pack_string(value):
+    encoded = value.encode("utf-8")
+    padding = b"\0" * (-len(encoded) % 4)
+    return _U32.pack(len(encoded)) + encoded + padding
+
+
+def write_chunk(stream, tag, *parts):
+    parts = [_as_bytes(part) for part in parts]
+    stream.write(_CHUNK_HEADER.pack(tag, sum(len(part) for part in parts)))
+    for part in parts:
+        stream.write(part)
+
+
+def write_header(stream):
+    stream.write(MAGIC)
+
+
+def write_end(stream):
+    write_chunk(stream, TAG_END)
+
+
+def write_arguments(stream, arguments):
+    """Command line style options that only apply to this job"""
+    write_chunk(
+        stream,
+        TAG_ARGS,
+        _U32.pack(len(arguments)) + b"".join(_pack_string(a) for a in arguments),
+    )
+
+
+def write_mesh(
+    stream, name, positions, indices, normals=None, uvs=None, charts=None, fixedUvs=None
+):
+    """positions/normals are float32 xyz per vertex, uvs/charts float32 uv per vertex,
+    indices uint32 with 3 per triangle. fixedUvs are float32 uvs of the triangle
+    corners that keep their lightmap uvs"""
+    positions = _as_bytes(positions)
+    indices = _as_bytes(indices)
+    flags = 0
+    parts = [positions]
+    if normals is not None:
+        flags |= MESH_HAS_NORMALS
+        parts.append(normals)
+    if uvs is not None:
+        flags |= MESH_HAS_UVS
+        parts.append(uvs)
+    if charts is not None:
+        flags |= MESH_HAS_CHARTS
+        parts.append(charts)
+    parts.append(indices)
+    if fixedUvs is not None:
+        flags |= MESH_HAS_FIXED_UVS
+        fixedUvs = _as_bytes(fixedUvs)
+        parts += [_U32.pack(len(fixedUvs) // 24), fixedUvs]
+    header = _pack_string(name) + struct.pack(
+        "<III", len(positions) // 12, len(indices) // 4, flags
+    )
+    write_chunk(stream, TAG_MESH, header, *parts)
+
+
+def write_mesh_result(stream, result):
+    """A MeshResult as an output MESH chunk, like xatlas writes it.
+    Results of the text output have no xrefs, they are written as 0"""
+    vertexCount = len(result.uvs) // 2
+    xrefs = result.xrefs
+    if len(xrefs) != vertexCount:
+        xrefs = array("I", bytes(4 * vertexCount))
+    if result.charts is not None:
+        write_chunk(
+            stream,
+            TAG_CHARTS,
+            _pack_string(result.name) + _U32.pack(len(result.charts) // 2),
+            result.charts,
+        )
+    header = _pack_string(result.name) + struct.pack(
+        "<II", vertexCount, len(result.indices)
+    )
+    write_chunk(stream, TAG_MESH, header, result.uvs, xrefs, result.indices)
+
+
+def write_atlas_stats(stream, stats):
+    write_chunk(
+        stream,
+        TAG_STATS,
+        struct.pack(
+            "<IIII", stats.chartCount, stats.atlasCount, stats.width, stats.height
+        ),
+        array("f", stats.utilization),
+        _U32.pack(stats.timeLimitedCharts),
+    )
+
+
+def write_atlas_image(stream, image):
+    write_chunk(
+        stream,
+        TAG_IMAGE,
+        struct.pack("<III", image.atlas, image.width, image.height),
+        image.texels,
+    )
+
+
+def write_mesh_results(stream, results):
+    """A whole output stream, results of later targets after earlier ones"""
+    write_header(stream)
+    target = 0
+    stats = None
+    images = None
+    for result in results:
+        if result.target != target:
+            target = result.target
+            write_chunk(stream, TAG_TARGET, _U32.pack(target))
+        if result.stats is not None and result.stats is not stats:
+            stats = result.stats
+            write_atlas_stats(stream, stats)
+        if result.images is not None and result.images is not images:
+            images = result.images
+            for image in images:
+                write_atlas_image(stream, image)
+        write_mesh_result(stream, result)
+    write_end(stream)
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ProtocolError("Unexpected end of xatlas output")
+    return data
+
+
+def read_header(stream):
+    if _read_exact(stream, len(MAGIC)) != MAGIC:
+        raise ProtocolError("xatlas output is missing the binary header")
+
+
+def read_chunks(stream):
+    """Yield (tag, payload) until the END chunk"""
+    while True:
+        tag, size = _CHUNK_HEADER.unpack(_read_exact(stream, _CHUNK_HEADER.size))
+        if tag == TAG_END:
+            return
+        yield tag, _read_exact(stream, size)
+
+
+class _PayloadReader:
+    def __init__(self, payload):
+        self.payload = memoryview(payload)
+        self.offset = 0
+
+    def u32(self):
+        (value,) = _U32.unpack_from(self.payload, self.offset)
+        self.offset += 4
+        return value
+
+    def string(self):
+        length = self.u32()
+        value = bytes(self.payload[self.offset : self.offset + length])
+        self.offset += length + (-length % 4)
+        return value.decode("utf-8")
+
+    def f64(self):
+        (value,) = struct.unpack_from("<d", self.payload, self.offset)
+        self.offset += 8
+        return value
+
+    def array(self, typecode, count):
+        values = array(typecode)
+        end = self.offset + count * values.itemsize
+        if end > len(self.payload):
+            raise ProtocolError("Truncated chunk in xatlas output")
+        values.frombytes(self.payload[self.offset : end])
+        self.offset = end
+        return values
+
+
+def read_mesh_result(payload):
+    reader = _PayloadReader(payload)
+    name = reader.string()
+    vertexCount = reader.u32()
+    indexCount = reader.u32()
+    uvs = reader.array("f", vertexCount * 2)
+    xrefs = reader.array("I", vertexCount)
+    indices = reader.array("I", indexCount)
+    return MeshResult(name, uvs, xrefs, indices)
+
+
+def read_atlas_stats(payload):
+    reader = _PayloadReader(payload)
+    chartCount, atlasCount, width, height = (reader.u32() for i in range(4))
+    utilization = reader.array("f", atlasCount).tolist()
+    stats = AtlasStats(chartCount, atlasCount, width, height, utilization)
+    # not sent by builds from before packTimeLimit
+    if reader.offset < len(reader.payload):
+        stats.timeLimitedCharts = reader.u32()
+    return stats
+
+
+def read_atlas_image(payload):
+    reader = _PayloadReader(payload)
+    atlas, width, height = (reader.u32() for i in range(3))
+    return AtlasImage(atlas, width, height, reader.array("I", width * height))
+
+
+def read_timings(payload):
+    """{stage: seconds} of a TIME chunk"""
+    reader = _PayloadReader(payload)
+    count = reader.u32()
+    timings = dict()
+    for i in range(count):
+        name = reader.string()
+        timings[name] = reader.f64()
+    return timings
+
+
+def iter_mesh_results(stream, onProgress=None, onTimings=None, onMemory=None):
+    """Yield each MeshResult as soon as its chunk has been read.
+    onProgress(category, progress) gets the PROG chunks of -progress,
+    onTimings(timings) the stage timings and onMemory(bytes) the peak
+    memory of xatlas, both sent after the meshes"""
+    read_header(stream)
+    error = None
+    charts = dict()  # sent before the mesh they belong to
+    target = 0
+    stats = None
+    images = None
+    for tag, payload in read_chunks(stream):
+        if tag == TAG_MESH:
+            result = read_mesh_result(payload)
+            result.charts = charts.pop(result.name, None)
+            result.target = target
+            result.stats = stats
+            result.images = images
+            yield result
+        elif tag == TAG_TARGET:
+            (target,) = _U32.unpack(payload)
+            stats = images = None
+        elif tag == TAG_STATS:
+            stats = read_atlas_stats(payload)
+            images = None
+        elif tag == TAG_IMAGE:
+            if images is None:
+                images = []
+            images.append(read_atlas_image(payload))
+        elif tag == TAG_TIMINGS:
+            if onTimings is not None:
+                onTimings(read_timings(payload))
+        elif tag == TAG_MEMORY:
+            if onMemory is not None:
+                onMemory(*struct.unpack("<Q", payload))
+        elif tag == TAG_CHARTS:
+            reader = _PayloadReader(payload)
+            name = reader.string()
+            charts[name] = reader.array("f", reader.u32() * 2)
+        elif tag == TAG_PROGRESS:
+            if onProgress is not None:
+                onProgress(*struct.unpack("<II", payload))
+        elif tag == TAG_ERROR:
+            error = _PayloadReader(payload).string()
+    # raised after END so a worker stream stays in sync
+    if error is not None:
+        raise JobError(error)
+
+
+def iter_text_results(stream):
+    """Text fallback of iter_mesh_results, reads the o/vt/f output line by line"""
+    result = None
+    firstVertex = 1  # faces are 1 indexed over all objects
+    for line in stream:
+        line_split = line.split()
+        if not line_split:
+            continue
+        line_start = line_split[0]
+        if line_start == b"o":
+            if result is not None:
+                firstVertex += len(result.uvs) // 2
+                yield result
+            result = MeshResult(
+                line_split[1].decode("utf-8"), array("f"), array("I"), array("I")
+            )
+        elif result is None:
+            continue
+        elif line_start == b"vt":
+            result.uvs.append(float(line_split[1]))
+            result.uvs.append(float(line_split[2]))
+        elif line_start == b"f":
+            # vert/uv/normal, only need the uvs
+            for corner in line_split[1:4]:
+                result.indices.append(int(corner.split(b"/")[1]) - firstVertex)
+    if result is not None:
+        yield result
@@ -0,0 +1,467 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Running xatlas-blender
+# stdout only carries mesh data and is parsed while it streams in,
+# the log and progress text on stderr is forwarded to the console.
+# A RunControl follows the progress of the jobs and cancels them,
+# xatlas stops a job on SIGTERM so a worker survives being cancelled.
+# With an xatlas_library the jobs run in this process instead.
+
+import os
+import platform
+import stat
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from queue import Queue
+from threading import Lock, Thread, Timer
+
+from . import xatlas_protocol
+
+
+def get_xatlas_path():
+    file_path = os.path.dirname(os.path.abspath(__file__))
+    if platform.system() == "Windows":
+        return os.path.join(file_path, "xatlas", "xatlas-blender.exe")
+    xatlas_path = os.path.join(file_path, "xatlas", "xatlas-blender")
+    # need to set permissions for the process on linux/osx
+    mode = os.stat(xatlas_path).st_mode
+    if not mode & stat.S_IXUSR:
+        os.chmod(xatlas_path, mode | stat.S_IXUSR)
+    return xatlas_path
+
+
+# XAB_VERSION of xatlas-blender.h the executable has to print for -version
+EXECUTABLE_VERSION = 4
+
+# (path, modification time): version of the executables checked so far
+_executableVersions = dict()
+
+
+def get_executable_version(xatlas_path):
+    """The XAB_VERSION xatlas_path prints for -version, None for a build from
+    before -version, which reads its input instead"""
+    key = (xatlas_path, os.stat(xatlas_path).st_mtime_ns)
+    if key not in _executableVersions:
+        try:
+            process = subprocess.run(
+                [xatlas_path, "-version"],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                timeout=10,
+            )
+            name, version = process.stdout.split()
+            version = int(version) if name == b"xatlas-blender" else None
+        except (OSError, subprocess.TimeoutExpired, ValueError):
+            version = None
+        _executableVersions[key] = version
+    return _executableVersions[key]
+
+
+def check_executable(xatlas_path):
+    """Raise OSError when xatlas_path wasn't built from this version of the
+    addon, its arguments and output would not match"""
+    version = get_executable_version(xatlas_path)
+    if version != EXECUTABLE_VERSION:
+        raise OSError(
+            "%s is %s, expected version %d. The executables in a git checkout "
+            "are not rebuilt with the addon, build xatlas_src (see the readme) "
+            "or install a release zip"
+            % (
+                xatlas_path,
+                "an older build" if version is None else "version %d" % version,
+                EXECUTABLE_VERSION,
+            )
+        )
+
+
+# where the xatlas log goes, the console when None
+logFile = None
+
+
+def print_log(stream):
+    for line in iter(stream.readline, b""):
+        (logFile or sys.stdout).write(line.decode("utf-8", "replace"))
+    stream.close()
+
+
+def start_log_thread(process):
+    logThread = Thread(target=print_log, args=(process.stderr,), daemon=True)
+    logThread.start()
+    return logThread
+
+
+class Cancelled(Exception):
+    pass
+
+
+# part of a job each xatlas::ProgressCategory stands for
+STAGE_PROGRESS = (
+    ("AddMesh", 0.0, 0.1),
+    ("ComputeCharts", 0.1, 0.6),
+    ("ParameterizeCharts", 0.1, 0.6),
+    ("PackCharts", 0.6, 0.95),
+    ("BuildOutputMeshes", 0.95, 1.0),
+)
+
+
+class RunControl:
+    """Progress and cancellation of the jobs of one run_jobs.
+    Updated from the threads reading xatlas, read from anywhere"""
+
+    # xatlas only sees a cancel between meshes and charts, a process that
+    # is still busy after this many seconds is killed (workers restart)
+    killTimeout = 2.0
+
+    def __init__(self):
+        self.cancelled = False
+        self.jobCount = 0
+        self.jobProgress = dict()  # job index: 0 to 1
+        self.jobTimings = dict()  # job index: {stage: seconds} reported by xatlas
+        self.jobPeakMemory = dict()  # job index: bytes, for a worker its peak so far
+        self.stage = ""
+        self._processes = set()
+        self._lock = Lock()
+
+    def attach(self, process):
+        with self._lock:
+            self._processes.add(process)
+            if self.cancelled:
+                process.kill()
+
+    def detach(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def cancel(self):
+        """Stop every running job, run_jobs raises Cancelled once they have"""
+        with self._lock:
+            self.cancelled = True
+            for process in self._processes:
+                # SIGTERM, xatlas gives up at its next progress update.
+                # On Windows this kills the process
+                if process.poll() is None:
+                    process.terminate()
+        timer = Timer(self.killTimeout, self._kill)
+        timer.daemon = True
+        timer.start()
+
+    def _kill(self):
+        with self._lock:
+            for process in self._processes:
+                if process.poll() is None:
+                    process.kill()
+
+    def update(self, jobIndex, category, progress):
+        category = min(category, len(STAGE_PROGRESS) - 1)
+        self.stage, start, end = STAGE_PROGRESS[category]
+        value = start + (end - start) * progress / 100.0
+        # incremental and -target jobs go through the stages more than once
+        self.jobProgress[jobIndex] = max(self.jobProgress.get(jobIndex, 0.0), value)
+
+    def set_timings(self, jobIndex, timings):
+        self.jobTimings[jobIndex] = timings
+
+    def set_peak_memory(self, jobIndex, peakBytes):
+        self.jobPeakMemory[jobIndex] = peakBytes
+
+    def finish_job(self, jobIndex):
+        self.jobProgress[jobIndex] = 1.0
+
+    def progress(self):
+        if self.jobCount == 0:
+            return 0.0
+        return sum(self.jobProgress.values()) / self.jobCount
+
+
+def run_xatlas(xatlas_path, arguments, inputData, binary, control=None, jobIndex=0):
+    """Run xatlas on inputData and yield each MeshResult as it arrives"""
+    xatlas_process = subprocess.Popen(
+        [xatlas_path] + arguments,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    logThread = start_log_thread(xatlas_process)
+    if control is not None:
+        control.attach(xatlas_process)
+
+    try:
+        # xatlas reads all of its input before it writes anything
+        xatlas_process.stdin.write(inputData)
+        xatlas_process.stdin.close()
+
+        if binary:
+            yield from xatlas_protocol.iter_mesh_results(
+                xatlas_process.stdout, *get_callbacks(control, jobIndex)
+            )
+        else:
+            yield from xatlas_protocol.iter_text_results(xatlas_process.stdout)
+    finally:
+        if control is not None:
+            control.detach(xatlas_process)
+        xatlas_process.stdout.close()
+        xatlas_process.wait()
+        logThread.join()
+
+
+def get_callbacks(control, jobIndex):
+    # onProgress, onTimings and onMemory of iter_mesh_results
+    if control is None:
+        return None, None, None
+    return (
+        lambda category, progress: control.update(jobIndex, category, progress),
+        lambda timings: control.set_timings(jobIndex, timings),
+        lambda peakBytes: control.set_peak_memory(jobIndex, peakBytes),
+    )
+
+
+class XatlasWorker:
+    """xatlas-blender -worker kept running between unwraps.
+    Each job is a complete binary input stream with its options in an
+    ARGS chunk, which saves starting a process for every unwrap"""
+
+    def __init__(self, xatlas_path):
+        self.xatlas_path = xatlas_path
+        self.process = None
+        self.logThread = None
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.stop()
+        self.process = subprocess.Popen(
+            [self.xatlas_path, "-worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.logThread = start_log_thread(self.process)
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            # closing stdin ends the job loop
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        self.logThread.join()
+        self.process = None
+        self.logThread = None
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.stop()
+
+    def _run(self, inputData, control, jobIndex):
+        finished = False
+        if control is not None:
+            control.attach(self.process)
+        try:
+            self.process.stdin.write(inputData)
+            self.process.stdin.flush()
+            yield from xatlas_protocol.iter_mesh_results(
+                self.process.stdout, *get_callbacks(control, jobIndex)
+            )
+            finished = True
+        except xatlas_protocol.JobError:
+            # only the job failed, the worker can take the next one
+            finished = True
+            raise
+        finally:
+            if control is not None:
+                control.detach(self.process)
+            # a stream that wasn't read to the end would corrupt the next job
+            if not finished:
+                self.kill()
+
+    def run(self, inputData, control=None, jobIndex=0):
+        """Like run_xatlas, a worker that died since the last job is restarted
+        and the job sent again, as long as nothing was yielded yet.
+        With a control the ARGS chunk of inputData should ask for -progress"""
+        for attempt in range(2):
+            if not self.is_running():
+                self.start()
+            results = self._run(inputData, control, jobIndex)
+            try:
+                first = next(results)
+            except StopIteration:
+                return
+            except (OSError, xatlas_protocol.ProtocolError):
+                # killed by the cancel on Windows
+                if attempt > 0 or (control is not None and control.cancelled):
+                    raise
+                print("xatlas worker stopped, restarting it")
+                continue
+            yield first
+            yield from results
+            return
+
+
+# every worker that was started, and the ones no run has checked out
+_workers = []
+_idleWorkers = []
+_workersLock = Lock()
+
+
+def checkout_workers(xatlas_path, count):
+    """count workers that no other run uses until they are given back with
+    checkin_workers, adding any that are missing"""
+    with _workersLock:
+        for worker in list(_idleWorkers):
+            if worker.xatlas_path != xatlas_path:
+                # left from another xatlas executable
+                worker.stop()
+                _idleWorkers.remove(worker)
+                _workers.remove(worker)
+        workers = _idleWorkers[:count]
+        del _idleWorkers[:count]
+        while len(workers) < count:
+            worker = XatlasWorker(xatlas_path)
+            _workers.append(worker)
+            workers.append(worker)
+        return workers
+
+
+def checkin_workers(workers):
+    with _workersLock:
+        # not the ones stop_workers dropped while they were out
+        _idleWorkers.extend(worker for worker in workers if worker in _workers)
+
+
+def stop_workers():
+    with _workersLock:
+        for worker in _workers:
+            worker.stop()
+        _workers.clear()
+        _idleWorkers.clear()
+
+
+def run_job(
+    xatlas_path, job, binary, worker=None, control=None, jobIndex=0, library=None
+):
+    """The MeshResults of one job, in the library or a worker when there is one.
+    Failures caused by a cancel are raised as Cancelled"""
+    arguments, inputData = job
+    try:
+        if library is not None:
+            yield from library.run(inputData, arguments, control, jobIndex)
+        elif worker is not None:
+            yield from worker.run(inputData, control, jobIndex)
+        else:
+            yield from run_xatlas(
+                xatlas_path, arguments, inputData, binary, control, jobIndex
+            )
+    except (OSError, xatlas_protocol.ProtocolError, xatlas_protocol.JobError):
+        if control is not None and control.cancelled:
+            raise Cancelled()
+        raise
+    if control is not None:
+        # text output just stops when xatlas gives up
+        if control.cancelled:
+            raise Cancelled()
+        control.finish_job(jobIndex)
+
+
+def run_jobs(
+    xatlas_path,
+    jobs,
+    binary,
+    useWorker,
+    jobCount=1,
+    control=None,
+    library=None,
+    firstJob=0,
+):
+    """jobs are (arguments, inputData) pairs, yields the MeshResults of all of them.
+    With jobCount > 1 up to jobCount xatlas processes run at once, and the
+    results of each job are yielded when that job has finished.
+    With a control binary jobs should ask for -progress, see get_xatlas_job.
+    With a library the inputData are MeshData lists and no process is started.
+    firstJob is the index of the first job in control, when one control
+    follows the jobs of several calls. An executable of another version
+    raises OSError before any job runs, see check_executable"""
+    if library is not None:
+        useWorker = False
+    elif jobs:
+        check_executable(xatlas_path)
+    if control is not None:
+        control.jobCount = max(control.jobCount, firstJob + len(jobs))
+    jobCount = max(1, min(jobCount, len(jobs)))
+    workers = checkout_workers(xatlas_path, jobCount) if useWorker else []
+    try:
+        yield from run_pooled_jobs(
+            xatlas_path, jobs, binary, workers, jobCount, control, library, firstJob
+        )
+    finally:
+        checkin_workers(workers)
+
+
+def run_pooled_jobs(
+    xatlas_path, jobs, binary, workers, jobCount, control, library, firstJob
+):
+    # run_jobs with the workers it checked out
+    if jobCount <= 1:
+        worker = workers[0] if workers else None
+        for jobIndex, job in enumerate(jobs, firstJob):
+            yield from run_job(
+                xatlas_path, job, binary, worker, control, jobIndex, library
+            )
+        return
+
+    useWorker = bool(workers)
+    idleWorkers = Queue()
+    for worker in workers:
+        idleWorkers.put(worker)
+
+    # the threads only wait on the processes or the library, which lets go
+    # of the GIL, so they don't fight over it
+    def run_pooled_job(jobIndex):
+        if control is not None and control.cancelled:
+            raise Cancelled()
+        worker = idleWorkers.get() if useWorker else None
+        try:
+            return list(
+                run_job(
+                    xatlas_path,
+                    jobs[jobIndex],
+                    binary,
+                    worker,
+                    control,
+                    firstJob + jobIndex,
+                    library,
+                )
+            )
+        finally:
+            if worker is not None:
+                idleWorkers.put(worker)
+
+    with ThreadPoolExecutor(max_workers=jobCount) as executor:
+        futures = [
+            executor.submit(run_pooled_job, jobIndex) for jobIndex in range(len(jobs))
+        ]
+        try:
+            for future in as_completed(futures):
+                yield from future.result()
+        finally:
+            # stopped early, don't start the jobs that are still queued
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,17 @@
+# The addon's __init__ needs bpy, the modules tested here don't. The package
+# is registered without running it so their relative imports still work.
+
+import os
+import sys
+import types
+
+ADDON_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "addons",
+    "blender_xatlas",
+)
+
+if "blender_xatlas" not in sys.modules:
+    package = types.ModuleType("blender_xatlas")
+    package.__path__ = [ADDON_DIRECTORY]
+    sys.modules["blender_xatlas"] = package
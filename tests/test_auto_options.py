@@ -0,0 +1,20 @@
+from blender_xatlas import auto_options
+
+CALIBRATION = {"machine": {"cpus": 1, "threads": 2}}
+
+
+def test_chart_thread_scale_shares_cpus():
+    # 8 cpus shared by 2 jobs, 4 threads each against the 2 of the table
+    assert auto_options.chart_thread_scale(CALIBRATION, 0, 8, 2) == 0.5
+
+
+def test_chart_thread_scale_threads_per_job():
+    # -threads is already what each job gets
+    assert auto_options.chart_thread_scale(CALIBRATION, 4, 8, 2) == 0.5
+    assert auto_options.chart_thread_scale(CALIBRATION, 1, 8, 4) == 2.0
+
+
+def test_chart_thread_scale_unknown():
+    assert auto_options.chart_thread_scale(CALIBRATION, 0, 0, 1) == 1.0
+    # tables without "threads" were timed on all of their cpus
+    assert auto_options.chart_thread_scale({"machine": {"cpus": 4}}, 0, 8, 1) == 0.5
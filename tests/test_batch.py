@@ -0,0 +1,68 @@
+import json
+import os
+
+from blender_xatlas import batch
+
+
+def write_config(directory, config):
+    path = directory / "config.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return str(path)
+
+
+def test_load_config_defaults(tmp_path):
+    (tmp_path / "scene.blend").write_bytes(b"")
+    config = batch.load_config(write_config(tmp_path, {"files": ["scene.blend"]}))
+    assert config["processes"] == 1
+    assert config["report"] == os.path.join(str(tmp_path), "xatlas_report.json")
+    (job,) = config["jobs"]
+    assert job["path"] == os.path.join(str(tmp_path), "scene.blend")
+    # saved in place without an output directory
+    assert job["output"] == job["path"]
+    assert job["collections"] == []
+    assert job["perCollection"] is False
+
+
+def test_load_config_globs_and_output(tmp_path):
+    for name in ("b.blend", "a.blend", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    config = batch.load_config(
+        write_config(tmp_path, {"files": ["*.blend"], "output": "out"})
+    )
+    assert [os.path.basename(job["path"]) for job in config["jobs"]] == [
+        "a.blend",
+        "b.blend",
+    ]
+    assert config["jobs"][0]["output"] == os.path.join(
+        str(tmp_path), "out", "a.blend"
+    )
+
+
+def test_load_config_file_overrides(tmp_path):
+    config = batch.load_config(
+        write_config(
+            tmp_path,
+            {
+                "pack": {"resolution": 1024, "padding": 2},
+                "collections": ["Props"],
+                "files": [
+                    "missing.blend",
+                    {
+                        "path": "other.blend",
+                        "pack": {"resolution": 2048},
+                        "collections": [],
+                        "timeout": 60,
+                    },
+                ],
+            },
+        )
+    )
+    first, second = config["jobs"]
+    # a path that matches nothing is still a job, Blender reports it missing
+    assert first["path"] == os.path.join(str(tmp_path), "missing.blend")
+    assert first["pack"] == {"resolution": 1024, "padding": 2}
+    assert first["collections"] == ["Props"]
+    # dicts are merged, everything else replaced
+    assert second["pack"] == {"resolution": 2048, "padding": 2}
+    assert second["collections"] == []
+    assert second["timeout"] == 60
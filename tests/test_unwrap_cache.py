@@ -0,0 +1,69 @@
+import os
+from array import array
+from io import BytesIO
+
+from blender_xatlas import unwrap_cache, xatlas_protocol
+
+
+def test_result_arguments():
+    arguments = ["-resolution", "512", "-threads", "4", "-cpus", "0-3", "-binary"]
+    assert unwrap_cache.result_arguments(arguments) == [
+        "-resolution",
+        "512",
+        "-binary",
+    ]
+
+
+def test_result_arguments_keep_values():
+    # only the value after a scheduling option is skipped
+    arguments = ["-threads", "2", "-padding", "-threads"]
+    assert unwrap_cache.result_arguments(arguments) == ["-padding"]
+
+
+def set_time(cache, key, seconds):
+    os.utime(cache._path(key), ns=(seconds * 10**9, seconds * 10**9))
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = unwrap_cache.UnwrapCache(str(tmp_path), 30)
+    for seconds, key in enumerate(("a", "b", "c"), 1):
+        cache.put_bytes(key, b"x" * 10)
+        set_time(cache, key, seconds)
+    # a hit makes "a" the most recently used
+    assert cache.get_bytes("a") == b"x" * 10
+    cache.put_bytes("d", b"x" * 10)
+    assert cache.get_bytes("b") is None
+    assert cache.get_bytes("c") is not None
+    assert cache.get_bytes("a") is not None
+    assert cache.size() <= 30
+
+
+def test_evict_oldest_first(tmp_path):
+    cache = unwrap_cache.UnwrapCache(str(tmp_path), 100)
+    for seconds, key in enumerate(("a", "b", "c", "d"), 1):
+        cache.put_bytes(key, b"x" * 10)
+        set_time(cache, key, seconds)
+    cache.sizeLimit = 20
+    cache.evict()
+    assert [key for key in "abcd" if os.path.exists(cache._path(key))] == ["c", "d"]
+
+
+def test_clear(tmp_path):
+    cache = unwrap_cache.UnwrapCache(str(tmp_path), 100)
+    cache.put_bytes("a", b"x")
+    (tmp_path / "other.txt").write_text("kept")
+    cache.clear()
+    assert cache.size() == 0
+    assert (tmp_path / "other.txt").exists()
+
+
+def test_text_result_round_trip(tmp_path):
+    # the text transport gives results without xrefs
+    text = b"o a\nvt 0.1 0.2\nvt 0.3 0.4\nvt 0.5 0.6\nf 1/1/1 2/2/2 3/3/3\n"
+    (result,) = xatlas_protocol.iter_text_results(BytesIO(text))
+    cache = unwrap_cache.UnwrapCache(str(tmp_path), 1024)
+    cache.put("key", [result])
+    (cached,) = cache.get("key")
+    assert cached.uvs == result.uvs
+    assert cached.indices == array("I", [0, 1, 2])
+    assert len(cached.xrefs) == 3
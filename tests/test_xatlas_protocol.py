@@ -0,0 +1,70 @@
+import struct
+from array import array
+from io import BytesIO
+
+import pytest
+
+from blender_xatlas import xatlas_protocol
+from blender_xatlas.xatlas_protocol import AtlasImage, AtlasStats, MeshResult
+
+
+def make_result(name, target=0, stats=None, images=None, charts=None):
+    return MeshResult(
+        name,
+        array("f", [0.0, 0.0, 1.0, 0.0, 0.5, 1.0]),
+        array("I", [0, 1, 2]),
+        array("I", [0, 1, 2]),
+        charts=charts,
+        target=target,
+        stats=stats,
+        images=images,
+    )
+
+
+def round_trip(results):
+    stream = BytesIO()
+    xatlas_protocol.write_mesh_results(stream, results)
+    stream.seek(0)
+    return list(xatlas_protocol.iter_mesh_results(stream))
+
+
+def test_round_trip():
+    stats = AtlasStats(3, 2, 256, 128, [0.5, 0.25], timeLimitedCharts=1)
+    images = [AtlasImage(0, 2, 1, array("I", [7, 8]))]
+    targetStats = AtlasStats(1, 1, 64, 64, [0.75])
+    results = [
+        make_result("a", stats=stats, images=images, charts=array("f", [1.0] * 6)),
+        make_result("b", stats=stats, images=images),
+        make_result("a", target=1, stats=targetStats),
+    ]
+    read = round_trip(results)
+    assert read == results
+    # the results of one atlas share its stats and images again
+    assert read[0].stats is read[1].stats
+    assert read[0].images is read[1].images
+    assert read[2].images is None
+
+
+def test_stats_without_time_limited_charts():
+    # STAT as builds from before packTimeLimit send it
+    stream = BytesIO()
+    xatlas_protocol.write_header(stream)
+    xatlas_protocol.write_chunk(
+        stream,
+        xatlas_protocol.TAG_STATS,
+        struct.pack("<IIII", 4, 1, 32, 16),
+        array("f", [0.5]),
+    )
+    xatlas_protocol.write_mesh_result(stream, make_result("a"))
+    xatlas_protocol.write_end(stream)
+    stream.seek(0)
+    (result,) = xatlas_protocol.iter_mesh_results(stream)
+    assert result.stats == AtlasStats(4, 1, 32, 16, [0.5], timeLimitedCharts=0)
+
+
+def test_truncated_stream():
+    stream = BytesIO()
+    xatlas_protocol.write_mesh_results(stream, [make_result("a")])
+    stream = BytesIO(stream.getvalue()[:-12])
+    with pytest.raises(xatlas_protocol.ProtocolError):
+        list(xatlas_protocol.iter_mesh_results(stream))
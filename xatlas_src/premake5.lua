@@ -93,6 +93,7 @@ project "xatlas"
 	exceptionhandling "Off"
 	rtti "Off"
 	warnings "Extra"
+	pic "On"
 	files { "xatlas.cpp", "xatlas.h" }
 	sanitizer()
 
@@ -114,6 +115,35 @@ project "xatlas-blender"
 		}
 	filter "system:linux"
 		links { "pthread" }
+	filter "system:windows"
+		links { "psapi" }
+
+-- xatlas-blender in the Blender process, see xatlas-blender.h
+project "xatlas-blender-lib"
+	kind "SharedLib"
+	-- its .lib, .exp and .pdb would overwrite the ones of the executable on Windows
+	targetname "xatlas-blender-lib"
+	language "C++"
+	cppdialect "C++11"
+	exceptionhandling "Off"
+	rtti "Off"
+	warnings "Extra"
+	visibility "Hidden"
+	sanitizer()
+	defines "XATLAS_BLENDER_LIBRARY"
+	files { "xatlas-blender.cpp", "xatlas-blender.h" }
+	includedirs(THIRDPARTY_DIR)
+	links { "tiny_obj_loader", "xatlas" }
+	-- the stream output is only used by the executable
+	filter "toolset:not msc*"
+		disablewarnings "unused-function"
+	filter "action:vs*"
+		disablewarnings "4505"
+		postbuildcommands {
+			'xcopy /y \"$(OutDir)$(TargetName)$(TargetExt)\" \"$(ProjectDir)..\\..\\..\\addons\\blender_xatlas\\xatlas\"'
+		}
+	filter "system:linux"
+		links { "pthread" }
 
 group "thirdparty"
 	
@@ -122,5 +152,6 @@ project "tiny_obj_loader"
 	language "C++"
 	exceptionhandling "Off"
 	rtti "Off"
+	pic "On"
 	sanitizer()
 	files(path.join(THIRDPARTY_DIR, "tiny_obj_loader.*"))
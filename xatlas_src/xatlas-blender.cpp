@@ -22,13 +22,20 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 */
 #include <assert.h>
+#include <signal.h>
 #include <stdarg.h>
 #include <stdio.h>
+#include <stdint.h>
+#include <string.h>
 #include <time.h>
 #include <iostream>
+#include <string>
+#include <vector>
 
 #include <thread>
 #include <chrono>
+#include <mutex>
+#include <atomic>
 
 #include <sstream>
 
@@ -42,6 +49,7 @@ SOFTWARE.
 #endif
 
 #include "./xatlas.h"
+#include "./xatlas-blender.h"
 
 #ifdef _MSC_VER
 #define FOPEN(_file, _filename, _mode) { if (fopen_s(&_file, _filename, _mode) != 0) _file = NULL; }
@@ -52,7 +60,28 @@ SOFTWARE.
 #define STRICMP strcasecmp
 #endif
 
+#ifdef _WIN32
+#include <fcntl.h>
+#include <io.h>
+#define SET_BINARY_MODE(_file) _setmode(_fileno(_file), _O_BINARY)
+#define WIN32_LEAN_AND_MEAN
+#define NOMINMAX
+#include <windows.h>
+#include <psapi.h>
+#else
+#define SET_BINARY_MODE(_file)
+#include <sys/resource.h>
+#endif
+
 static bool s_verbose = false;
+// Log and progress text goes to stderr, stdout only carries the mesh data.
+static FILE *s_log = stderr;
+// Set by SIGTERM, the running job stops at the next progress update. See StreamOutput.
+static volatile sig_atomic_t s_cancel = 0;
+static std::mutex s_outputMutex;
+
+// The values are the atlasLayout of XabAtlasFunc.
+enum class AtlasLayout { overlap, spreadX, udim };
 
 class Stopwatch
 {
@@ -64,12 +93,29 @@ private:
 	clock_t m_start;
 };
 
+// Wall clock time, Stopwatch measures the cpu time of the process.
+class WallTimer
+{
+public:
+	WallTimer() : m_start(std::chrono::steady_clock::now()) {}
+	// Seconds since the last lap.
+	double lap()
+	{
+		const std::chrono::steady_clock::time_point now = std::chrono::steady_clock::now();
+		const double seconds = std::chrono::duration<double>(now - m_start).count();
+		m_start = now;
+		return seconds;
+	}
+private:
+	std::chrono::steady_clock::time_point m_start;
+};
+
 static int Print(const char *format, ...)
 {
 	va_list arg;
 	va_start(arg, format);
-	printf("\r"); // Clear progress text (PrintProgress).
-	const int result = vprintf(format, arg);
+	fprintf(s_log, "\r"); // Clear progress text (PrintProgress).
+	const int result = vfprintf(s_log, format, arg);
 	va_end(arg);
 	return result;
 }
@@ -80,24 +126,52 @@ static void PrintProgress(const char *name, const char *indent1, const char *ind
 		return;
 	if (progress == 0)
 		stopwatch->reset();
-	printf("\r%s%s [", indent1, name);
+	fprintf(s_log, "\r%s%s [", indent1, name);
 	for (int i = 0; i < 10; i++)
-		printf(progress / ((i + 1) * 10) ? "*" : " ");
-	printf("] %d%%", progress);
-	fflush(stdout);
+		fprintf(s_log, progress / ((i + 1) * 10) ? "*" : " ");
+	fprintf(s_log, "] %d%%", progress);
+	fflush(s_log);
 	if (progress == 100)
-		printf("\n%s%.2f seconds (%g ms) elapsed\n", indent2, stopwatch->elapsed() / 1000.0, stopwatch->elapsed());
+		fprintf(s_log, "\n%s%.2f seconds (%g ms) elapsed\n", indent2, stopwatch->elapsed() / 1000.0, stopwatch->elapsed());
 }
 
+// Where a job reports its progress and sends its atlases. The executable writes them to
+// stdout (StreamOutput), the library hands them to the caller (LibraryOutput).
+class JobOutput
+{
+public:
+	virtual ~JobOutput() {}
+	// Called from the xatlas threads, false cancels the job.
+	virtual bool progress(xatlas::ProgressCategory::Enum category, int progress) = 0;
+	virtual bool cancelled() const = 0;
+	// Called once for every target after packing. newCharts are the chart layouts computed by
+	// this job, empty for the meshes that sent theirs, null when there are none.
+	virtual void atlas(uint32_t target, const xatlas::Atlas *atlas, const std::vector<std::vector<float>> *newCharts) = 0;
+};
+
+struct ProgressState
+{
+	Stopwatch stopwatch;
+	JobOutput *output;
+};
+
 static bool ProgressCallback(xatlas::ProgressCategory::Enum category, int progress, void *userData)
 {
-	Stopwatch *stopwatch = (Stopwatch *)userData;
-	PrintProgress(xatlas::StringForEnum(category), "   ", "      ", progress, stopwatch);
-	return true;
+	ProgressState *state = (ProgressState *)userData;
+	PrintProgress(xatlas::StringForEnum(category), "   ", "      ", progress, &state->stopwatch);
+	// Returning false makes xatlas skip the rest of the stage.
+	return state->output->progress(category, progress);
 }
 
-static bool checkArgumentInt(char *argv[], int index, char *comp_arg) {
-	if (STRICMP(argv[index], comp_arg) == 0) {
+#if !defined(_WIN32) && !defined(XATLAS_BLENDER_LIBRARY)
+static void HandleTerminate(int)
+{
+	s_cancel = 1;
+}
+#endif
+
+static bool checkArgumentInt(int argc, char *argv[], int index, const char *comp_arg) {
+	if (STRICMP(argv[index], comp_arg) == 0 && index + 1 < argc) {
 		std::string resolutionAmount = argv[index + 1];
 		std::istringstream iss(resolutionAmount);
 		int val;
@@ -110,8 +184,8 @@ static bool checkArgumentInt(char *argv[], int index, char *comp_arg) {
 	return false;
 }
 
-static bool checkArgumentFloat(char *argv[], int index, char *comp_arg) {
-	if (STRICMP(argv[index], comp_arg) == 0) {
+static bool checkArgumentFloat(int argc, char *argv[], int index, const char *comp_arg) {
+	if (STRICMP(argv[index], comp_arg) == 0 && index + 1 < argc) {
 		std::string resolutionAmount = argv[index + 1];
 		std::istringstream iss(resolutionAmount);
 		float val;
@@ -125,312 +199,1272 @@ static bool checkArgumentFloat(char *argv[], int index, char *comp_arg) {
 	return false;
 }
 
-//static void fakePrintf(std::string printString, ) {
-//	std::string printCode = (std::string)0;
-//	printCode.append(printString);
-//	printf(printCode, );
-//}
+// Binary transport (-binary).
+// Both directions start with kBinaryMagic followed by length-prefixed chunks: a four
+// character tag, the payload size in bytes as a uint32_t and then the payload itself.
+// Everything is little-endian. Strings are a uint32_t length followed by the characters,
+// padded with zeros to a multiple of 4 bytes so the arrays after them stay aligned.
+//
+// Input MESH chunk:  name, vertexCount, indexCount, flags,
+//                    float positions[vertexCount * 3],
+//                    float normals[vertexCount * 3] (kMeshHasNormals),
+//                    float uvs[vertexCount * 2] (kMeshHasUvs),
+//                    float charts[vertexCount * 2] (kMeshHasCharts),
+//                    uint32_t indices[indexCount],
+//                    uint32_t fixedTriangleCount, float fixedUvs[fixedTriangleCount * 6]
+//                    (kMeshHasFixedUvs, lightmap uvs that stay, see XabMesh::fixedUvs)
+// Output MESH chunk: name, vertexCount, indexCount,
+//                    float uvs[vertexCount * 2] (normalized, atlas layout applied),
+//                    uint32_t xrefs[vertexCount],
+//                    uint32_t indices[indexCount] (0-indexed, local to the mesh)
+// ARGS chunk:        uint32_t count, then count strings. Options for this job, parsed
+//                    like the command line and applied on top of it.
+// ERR chunk:         a string describing why the job failed.
+// CHRT chunk:        name, vertexCount, float charts[vertexCount * 2]. Output only, with
+//                    -incremental, sent before the MESH chunk of each mesh that was charted.
+// TRGT chunk:        uint32_t target. Output only, with -target, the MESH chunks that follow
+//                    are packed for that target (0-indexed, in argument order).
+// STAT chunk:        uint32_t chartCount, atlasCount, width, height, float utilization[atlasCount],
+//                    uint32_t timeLimitedChartCount. Output only, the atlas the MESH chunks after
+//                    it were packed into.
+// IMAG chunk:        uint32_t atlas, width, height, uint32_t texels[width * height]. Output
+//                    only, with -chartImage, one after the STAT chunk for each atlas. atlas is
+//                    its place in the layout (-firstAtlas + index), the texels are those of
+//                    xatlas::Atlas::image: the chart index and the kImage bits of xatlas.h.
+// TIME chunk:        uint32_t count, then count times a stage name and the double seconds
+//                    spent in it. Output only, after the meshes of the job.
+// MEM  chunk:        uint64_t peak resident memory of the process in bytes. Output only, after
+//                    the TIME chunk. A worker reports its peak over all jobs so far.
+// PROG chunk:        uint32_t category (xatlas::ProgressCategory), uint32_t progress (0-100).
+//                    Output only, with -progress, can come before any other chunk.
+// Both streams end with an empty END chunk. When a job fails the ERR chunk comes last,
+// after whatever was already written.
+//
+// Worker mode (-worker) keeps reading jobs, each a complete input stream, from stdin
+// until it is closed, and answers each one with a complete output stream.
+//
+// SIGTERM cancels the running job (not on Windows), it ends with ERR "cancelled" and a
+// worker goes on with the next one.
+#define FOURCC(a, b, c, d) ((uint32_t)(a) | ((uint32_t)(b) << 8) | ((uint32_t)(c) << 16) | ((uint32_t)(d) << 24))
+static const uint32_t kBinaryMagic = FOURCC('X', 'A', 'B', '1');
+static const uint32_t kChunkMesh = FOURCC('M', 'E', 'S', 'H');
+static const uint32_t kChunkEnd = FOURCC('E', 'N', 'D', ' ');
+static const uint32_t kChunkArguments = FOURCC('A', 'R', 'G', 'S');
+static const uint32_t kChunkError = FOURCC('E', 'R', 'R', ' ');
+static const uint32_t kChunkCharts = FOURCC('C', 'H', 'R', 'T');
+static const uint32_t kChunkTarget = FOURCC('T', 'R', 'G', 'T');
+static const uint32_t kChunkProgress = FOURCC('P', 'R', 'O', 'G');
+static const uint32_t kChunkStats = FOURCC('S', 'T', 'A', 'T');
+static const uint32_t kChunkTimings = FOURCC('T', 'I', 'M', 'E');
+static const uint32_t kChunkMemory = FOURCC('M', 'E', 'M', ' ');
+static const uint32_t kChunkImage = FOURCC('I', 'M', 'A', 'G');
+static const uint32_t kMeshHasNormals = 1 << 0;
+static const uint32_t kMeshHasUvs = 1 << 1;
+static const uint32_t kMeshHasCharts = 1 << 2;
+static const uint32_t kMeshHasFixedUvs = 1 << 3;
 
-int main(int argc, char *argv[])
+static bool ReadExact(FILE *file, void *data, size_t size)
 {
-	std::string meshInput;
-	std::string line;
+	return size == 0 || fread(data, 1, size, file) == size;
+}
 
-	//read all the mesh input
-	while (std::getline(std::cin, line) && !line.empty()) {
-		meshInput.append(line);
-		meshInput.append("\n");
+static bool ReadChunk(FILE *file, uint32_t *tag, std::vector<uint8_t> &payload)
+{
+	uint32_t size;
+	if (!ReadExact(file, tag, sizeof(uint32_t)) || !ReadExact(file, &size, sizeof(uint32_t)))
+		return false;
+	payload.resize(size);
+	return ReadExact(file, payload.data(), size);
+}
+
+static void WriteChunk(FILE *file, uint32_t tag, const std::vector<uint8_t> &payload)
+{
+	const uint32_t size = (uint32_t)payload.size();
+	fwrite(&tag, sizeof(uint32_t), 1, file);
+	fwrite(&size, sizeof(uint32_t), 1, file);
+	if (size > 0)
+		fwrite(payload.data(), 1, size, file);
+}
+
+class ChunkReader
+{
+public:
+	ChunkReader(const std::vector<uint8_t> &payload) : m_payload(payload), m_offset(0) {}
+
+	bool read(void *data, size_t size)
+	{
+		if (size > m_payload.size() - m_offset)
+			return false;
+		if (size > 0)
+			memcpy(data, &m_payload[m_offset], size);
+		m_offset += size;
+		return true;
 	}
 
-	//printf("Loading '%s'...\n", argv[1]);
-	printf("Loading Mesh from stdin...\n");
-	std::vector<tinyobj::shape_t> shapes;
-	std::vector<tinyobj::material_t> materials;
-	std::vector<tinyobj::MaterialReader> matReader;
-	std::string err;
+	bool readU32(uint32_t *value) { return read(value, sizeof(uint32_t)); }
 
-	if (!tinyobj::LoadObj(
-			shapes,
-			materials,
-			err,
-			meshInput,
-			tinyobj::triangulation
-	)) {
-		printf("Error: %s\n", err.c_str());
-		return EXIT_FAILURE;
+	bool readString(std::string *value)
+	{
+		uint32_t length;
+		if (!readU32(&length) || length > m_payload.size() - m_offset)
+			return false;
+		value->assign((const char *)&m_payload[m_offset], length);
+		m_offset += (length + 3) & ~3u;
+		return m_offset <= m_payload.size();
 	}
 
-	//print the amount of shapes if working
-	//std::cout << (int)shapes.size() << std::endl;
+	template<typename T>
+	bool readArray(std::vector<T> *values, size_t count)
+	{
+		if (count > (m_payload.size() - m_offset) / sizeof(T))
+			return false;
+		values->resize(count);
+		return read(values->data(), count * sizeof(T));
+	}
 
-	//std::cout << "exit" << std::endl;
+private:
+	const std::vector<uint8_t> &m_payload;
+	size_t m_offset;
+};
 
-	if (argc < 1) {
-	    printf("Usage: %s input_file.obj [options]\n", argv[0]);
-		printf("  Options:\n");
-		printf("    -verbose\n");  
-		printf("    -resolution\n");
-	    return 1;
+class ChunkWriter
+{
+public:
+	void write(const void *data, size_t size)
+	{
+		const uint8_t *bytes = (const uint8_t *)data;
+		payload.insert(payload.end(), bytes, bytes + size);
 	}
-	//printf("Running xatlas\n");
-	// compare arg2 with -verbose
-	s_verbose = (argc >= 3 && STRICMP(argv[2], "-verbose") == 0);
 
-	//settings
-	//printf("Settings\n");
-	xatlas::ChartOptions chartOptions;
-	xatlas::PackOptions packOptions;
-	enum class AtlasLayout { overlap, spreadX, udim };
-	AtlasLayout atlasLayout = AtlasLayout::overlap;
-	bool packOnly = false;
+	void writeU32(uint32_t value) { write(&value, sizeof(uint32_t)); }
 
+	void writeString(const std::string &value)
+	{
+		writeU32((uint32_t)value.size());
+		write(value.data(), value.size());
+		payload.resize((payload.size() + 3) & ~(size_t)3, 0);
+	}
 
-	//printf("Before check\n");
-	//check all the arguments
-	if (argc >= 2) {
-		for (int counter = 2; counter < argc; counter++) {
-			//shared options-------------------------------------
-			//atlasLayout
-			if (STRICMP(argv[counter], "-atlasLayout") == 0) {
-				if (STRICMP(argv[counter + 1], "OVERLAP")) {
-					atlasLayout = AtlasLayout::overlap;
-				}
-				if (STRICMP(argv[counter + 1], "SPREADX") == 0) {
-					atlasLayout = AtlasLayout::spreadX;
-				}
-				if (STRICMP(argv[counter + 1], "UDIM") == 0) {
-					atlasLayout = AtlasLayout::udim;
-				}
-			}
-			//pack only
-			if (STRICMP(argv[counter], "-packOnly") == 0) {
-				packOnly = true;
-			}
+	std::vector<uint8_t> payload;
+};
 
-			//pack options-------------------------------------
-			//resolution
-			if (checkArgumentInt(argv, counter, "-resolution")) {
-				packOptions.resolution = atoi(argv[counter + 1]);
-			}
-			//padding
-			if (checkArgumentInt(argv, counter, "-padding")) {
-				packOptions.padding = atoi(argv[counter + 1]);
-			}
-			//brute force
-			if (STRICMP(argv[counter], "-bruteForce") == 0) {
-				packOptions.bruteForce = true;
-			}
-			//bilinear
-			if (STRICMP(argv[counter], "-bilinear") == 0) {
-				packOptions.bilinear = true;
-			}
-			//blockAlign
-			if (STRICMP(argv[counter], "-blockAlign") == 0) {
-				packOptions.blockAlign = true;
-			}
-			//maxChartSize
-			if (checkArgumentInt(argv, counter, "-maxChartSize")) {
-				packOptions.maxChartSize = atoi(argv[counter + 1]);
+// Called from the xatlas threads while the main thread waits on them.
+static void WriteProgressChunk(xatlas::ProgressCategory::Enum category, int progress)
+{
+	ChunkWriter writer;
+	writer.writeU32((uint32_t)category);
+	writer.writeU32((uint32_t)progress);
+	std::lock_guard<std::mutex> lock(s_outputMutex);
+	WriteChunk(stdout, kChunkProgress, writer.payload);
+	fflush(stdout);
+}
+
+// Everything a job is made of. Jobs only look at the meshes, which point into the shapes
+// (read like tinyobj produces them) for the executable and into the caller's arrays for the
+// library.
+struct JobInput
+{
+	std::vector<XabMesh> meshes;
+	std::vector<tinyobj::shape_t> shapes;
+	// Chart layout of each shape, empty when it has to be computed. See ComputeChartLayouts.
+	std::vector<std::vector<float>> charts;
+	// Fixed uvs of each shape, see XabMesh::fixedUvs.
+	std::vector<std::vector<float>> fixedUvs;
+	std::vector<std::string> arguments;
+
+	void clear()
+	{
+		meshes.clear();
+		shapes.clear();
+		charts.clear();
+		fixedUvs.clear();
+		arguments.clear();
+	}
+
+	// Once the shapes are loaded.
+	void setMeshes()
+	{
+		meshes.resize(shapes.size());
+		for (size_t i = 0; i < shapes.size(); i++) {
+			const tinyobj::mesh_t &objMesh = shapes[i].mesh;
+			XabMesh &mesh = meshes[i];
+			mesh.name = shapes[i].name.c_str();
+			mesh.vertexCount = (uint32_t)objMesh.positions.size() / 3;
+			mesh.indexCount = (uint32_t)objMesh.indices.size();
+			mesh.positions = objMesh.positions.data();
+			mesh.normals = objMesh.normals.empty() ? nullptr : objMesh.normals.data();
+			mesh.uvs = objMesh.texcoords.empty() ? nullptr : objMesh.texcoords.data();
+			mesh.charts = i < charts.size() && !charts[i].empty() ? charts[i].data() : nullptr;
+			mesh.indices = objMesh.indices.data();
+			const bool hasFixedUvs = i < fixedUvs.size() && !fixedUvs[i].empty();
+			mesh.fixedTriangleCount = hasFixedUvs ? (uint32_t)fixedUvs[i].size() / 6 : 0;
+			mesh.fixedUvs = hasFixedUvs ? fixedUvs[i].data() : nullptr;
+		}
+	}
+};
+
+static bool LoadBinaryInput(FILE *file, JobInput &input, std::string &err)
+{
+	uint32_t magic;
+	if (!ReadExact(file, &magic, sizeof(uint32_t)) || magic != kBinaryMagic) {
+		err = "missing binary header";
+		return false;
+	}
+	std::vector<uint8_t> payload;
+	for (;;) {
+		uint32_t tag;
+		if (!ReadChunk(file, &tag, payload)) {
+			err = "unexpected end of input";
+			return false;
+		}
+		if (tag == kChunkEnd) {
+			input.setMeshes();
+			return true;
+		}
+		ChunkReader reader(payload);
+		if (tag == kChunkArguments) {
+			uint32_t count;
+			bool ok = reader.readU32(&count);
+			for (uint32_t i = 0; ok && i < count; i++) {
+				input.arguments.push_back(std::string());
+				ok = reader.readString(&input.arguments.back());
 			}
-			//texelsPerUnit
-			if (checkArgumentFloat(argv, counter, "-texelsPerUnit")) {
-				packOptions.texelsPerUnit = std::stof(argv[counter + 1]);
+			if (!ok) {
+				err = "malformed arguments chunk";
+				return false;
 			}
+			continue;
+		}
+		if (tag != kChunkMesh)
+			continue; // Unknown chunk, skip it.
+		tinyobj::shape_t shape;
+		uint32_t vertexCount, indexCount, flags;
+		bool ok = reader.readString(&shape.name) && reader.readU32(&vertexCount) && reader.readU32(&indexCount) && reader.readU32(&flags);
+		ok = ok && reader.readArray(&shape.mesh.positions, vertexCount * 3);
+		if (ok && (flags & kMeshHasNormals))
+			ok = reader.readArray(&shape.mesh.normals, vertexCount * 3);
+		if (ok && (flags & kMeshHasUvs))
+			ok = reader.readArray(&shape.mesh.texcoords, vertexCount * 2);
+		std::vector<float> charts;
+		if (ok && (flags & kMeshHasCharts))
+			ok = reader.readArray(&charts, vertexCount * 2);
+		ok = ok && reader.readArray(&shape.mesh.indices, indexCount);
+		std::vector<float> fixedUvs;
+		uint32_t fixedTriangleCount;
+		if (ok && (flags & kMeshHasFixedUvs))
+			ok = reader.readU32(&fixedTriangleCount) && reader.readArray(&fixedUvs, (size_t)fixedTriangleCount * 6);
+		if (!ok) {
+			err = "malformed mesh chunk";
+			return false;
+		}
+		input.shapes.push_back(shape);
+		input.charts.push_back(charts);
+		input.fixedUvs.push_back(fixedUvs);
+	}
+}
 
-			//chart options-------------------------------------
-			//maxChartArea
-			if (checkArgumentFloat(argv, counter, "-maxChartArea")) {
-				chartOptions.maxChartArea = std::stof(argv[counter + 1]);
-			}
-			//maxBoundaryLength
-			if (checkArgumentFloat(argv, counter, "-maxBoundaryLength")) {
-				chartOptions.maxBoundaryLength = std::stof(argv[counter + 1]);
+// firstAtlas is where atlas 0 goes, so several jobs can share one layout.
+static void AtlasLayoutOffset(AtlasLayout atlasLayout, uint32_t firstAtlas, int32_t atlasIndex, float *xOffset, float *yOffset)
+{
+	*xOffset = 0;
+	*yOffset = 0;
+	atlasIndex = (atlasIndex > 0 ? atlasIndex : 0) + (int32_t)firstAtlas;
+	//spread the uv axis along the x-axis
+	if (atlasIndex > 0 && atlasLayout == AtlasLayout::spreadX) {
+		*xOffset = (float)atlasIndex;
+	}
+	if (atlasIndex > 0 && atlasLayout == AtlasLayout::udim) {
+		int xRowOffset = atlasIndex % 10;
+		*xOffset = (float)xRowOffset;
+		*yOffset = (float)floor(atlasIndex / 10);
+	}
+}
+
+// The atlas (-1 for none) that a point of the layout is in and where it is in that atlas,
+// the inverse of AtlasLayoutOffset. The overlap layout puts everything in atlas 0.
+static int32_t AtlasLayoutIndex(AtlasLayout atlasLayout, uint32_t firstAtlas, float u, float v, float *xOffset, float *yOffset)
+{
+	*xOffset = 0;
+	*yOffset = 0;
+	if (atlasLayout == AtlasLayout::overlap)
+		return 0;
+	const int32_t x = (int32_t)floor(u);
+	const int32_t y = atlasLayout == AtlasLayout::udim ? (int32_t)floor(v) : 0;
+	if (x < 0 || y < 0 || (atlasLayout == AtlasLayout::udim && x >= 10))
+		return -1;
+	*xOffset = (float)x;
+	*yOffset = (float)y;
+	return x + y * 10 - (int32_t)firstAtlas;
+}
+
+// Conservative rasterization of the fixed uvs of the meshes at resolution into
+// xatlas::PackOptions::usedTexels, one resolution * resolution image per atlas.
+static void RasterizeFixedUvs(const std::vector<XabMesh> &meshes, AtlasLayout atlasLayout, uint32_t firstAtlas, uint32_t resolution, std::vector<uint8_t> *texels, uint32_t *atlasCount)
+{
+	texels->clear();
+	*atlasCount = 0;
+	const size_t atlasSize = (size_t)resolution * resolution;
+	for (const XabMesh &mesh : meshes) {
+		for (uint32_t f = 0; f < mesh.fixedTriangleCount; f++) {
+			const float *uv = &mesh.fixedUvs[f * 6];
+			// the atlas of the centroid, the whole triangle is in it
+			float xOffset, yOffset;
+			const int32_t atlas = AtlasLayoutIndex(atlasLayout, firstAtlas, (uv[0] + uv[2] + uv[4]) / 3.0f, (uv[1] + uv[3] + uv[5]) / 3.0f, &xOffset, &yOffset);
+			if (atlas < 0)
+				continue;
+			float p[6];
+			for (int i = 0; i < 3; i++) {
+				p[i * 2 + 0] = (uv[i * 2 + 0] - xOffset) * resolution;
+				p[i * 2 + 1] = (uv[i * 2 + 1] - yOffset) * resolution;
 			}
-			//normalDeviationWeight
-			if (checkArgumentFloat(argv, counter, "-normalDeviationWeight")) {
-				chartOptions.normalDeviationWeight = std::stof(argv[counter + 1]);
+			const float area = (p[2] - p[0]) * (p[5] - p[1]) - (p[3] - p[1]) * (p[4] - p[0]);
+			if (!(area > 0.0f || area < 0.0f))
+				continue; // degenerate or not a number
+			const float sign = area > 0.0f ? 1.0f : -1.0f;
+			const float minX = std::min(p[0], std::min(p[2], p[4])), maxX = std::max(p[0], std::max(p[2], p[4]));
+			const float minY = std::min(p[1], std::min(p[3], p[5])), maxY = std::max(p[1], std::max(p[3], p[5]));
+			if (maxX < 0.0f || maxY < 0.0f || minX >= (float)resolution || minY >= (float)resolution)
+				continue;
+			const int x0 = (int)std::max(0.0f, floorf(minX)), x1 = (int)std::min((float)resolution - 1.0f, floorf(maxX));
+			const int y0 = (int)std::max(0.0f, floorf(minY)), y1 = (int)std::min((float)resolution - 1.0f, floorf(maxY));
+			if ((uint32_t)atlas >= *atlasCount) {
+				*atlasCount = (uint32_t)atlas + 1;
+				texels->resize(*atlasCount * atlasSize, 0);
 			}
-			//roundnessWeight
-			if (checkArgumentFloat(argv, counter, "-roundnessWeight")) {
-				chartOptions.roundnessWeight = std::stof(argv[counter + 1]);
+			uint8_t *image = texels->data() + atlas * atlasSize;
+			for (int y = y0; y <= y1; y++) {
+				for (int x = x0; x <= x1; x++) {
+					// inside every edge moved out by half a texel in its normal direction,
+					// so any texel the triangle touches is taken
+					bool inside = true;
+					for (int i = 0; i < 3 && inside; i++) {
+						const float *a = &p[i * 2];
+						const float *b = &p[((i + 1) % 3) * 2];
+						const float ex = b[0] - a[0], ey = b[1] - a[1];
+						const float edge = sign * (ex * (y + 0.5f - a[1]) - ey * (x + 0.5f - a[0]));
+						inside = edge >= -0.5f * (fabsf(ex) + fabsf(ey));
+					}
+					if (inside)
+						image[x + y * resolution] = 1;
+				}
 			}
-			//straightnessWeight
-			if (checkArgumentFloat(argv, counter, "-straightnessWeight")) {
-				chartOptions.straightnessWeight = std::stof(argv[counter + 1]);
+		}
+	}
+}
+
+static void WriteTextOutput(const xatlas::Atlas *atlas, const std::vector<XabMesh> &meshes, AtlasLayout atlasLayout, uint32_t firstAtlas)
+{
+	printf("STARTOBJ\n");
+	uint32_t firstVertex = 0;
+	for (uint32_t i = 0; i < atlas->meshCount; i++) {
+		const xatlas::Mesh &mesh = atlas->meshes[i];
+		printf("o %s\n", meshes[i].name);
+		//printf("cc %i\n", mesh.chartCount);
+		printf("s off\n");
+		for (uint32_t v = 0; v < mesh.vertexCount; v++) {
+			const xatlas::Vertex &vertex = mesh.vertexArray[v];
+			float xOffset, yOffset;
+			AtlasLayoutOffset(atlasLayout, firstAtlas, vertex.atlasIndex, &xOffset, &yOffset);
+			printf("vt %g %g\n", (vertex.uv[0] / atlas->width) + xOffset, (vertex.uv[1] / atlas->height) + yOffset);
+		}
+		for (uint32_t f = 0; f < mesh.indexCount; f += 3) {
+			printf("f ");
+			for (uint32_t j = 0; j < 3; j++) {
+				const uint32_t index = firstVertex + mesh.indexArray[f + j] + 1; // 1-indexed
+				printf("%d/%d/%d%c", index, index, index, j == 2 ? '\n' : ' ');
 			}
-			//normalSeamWeight
-			if (checkArgumentFloat(argv, counter, "-normalSeamWeight")) {
-				chartOptions.normalSeamWeight = std::stof(argv[counter + 1]);
+		}
+		firstVertex += mesh.vertexCount;
+	}
+}
+
+// The MESH chunks of one packed atlas, the caller writes the header and END chunk.
+// newCharts (optional) are the chart layouts computed by this job, empty for the others.
+static void WriteBinaryMeshes(const xatlas::Atlas *atlas, const std::vector<XabMesh> &meshes, AtlasLayout atlasLayout, uint32_t firstAtlas, const std::vector<std::vector<float>> *newCharts = nullptr)
+{
+	std::vector<float> uvs;
+	std::vector<uint32_t> xrefs;
+	for (uint32_t i = 0; i < atlas->meshCount; i++) {
+		if (newCharts && !(*newCharts)[i].empty()) {
+			const std::vector<float> &charts = (*newCharts)[i];
+			ChunkWriter writer;
+			writer.writeString(meshes[i].name);
+			writer.writeU32((uint32_t)charts.size() / 2);
+			writer.write(charts.data(), charts.size() * sizeof(float));
+			WriteChunk(stdout, kChunkCharts, writer.payload);
+		}
+		const xatlas::Mesh &mesh = atlas->meshes[i];
+		uvs.resize(mesh.vertexCount * 2);
+		xrefs.resize(mesh.vertexCount);
+		for (uint32_t v = 0; v < mesh.vertexCount; v++) {
+			const xatlas::Vertex &vertex = mesh.vertexArray[v];
+			float xOffset, yOffset;
+			AtlasLayoutOffset(atlasLayout, firstAtlas, vertex.atlasIndex, &xOffset, &yOffset);
+			uvs[v * 2 + 0] = (vertex.uv[0] / atlas->width) + xOffset;
+			uvs[v * 2 + 1] = (vertex.uv[1] / atlas->height) + yOffset;
+			xrefs[v] = vertex.xref;
+		}
+		ChunkWriter writer;
+		writer.writeString(meshes[i].name);
+		writer.writeU32(mesh.vertexCount);
+		writer.writeU32(mesh.indexCount);
+		writer.write(uvs.data(), uvs.size() * sizeof(float));
+		writer.write(xrefs.data(), xrefs.size() * sizeof(uint32_t));
+		writer.write(mesh.indexArray, mesh.indexCount * sizeof(uint32_t));
+		WriteChunk(stdout, kChunkMesh, writer.payload);
+	}
+}
+
+static void WriteAtlasStats(const xatlas::Atlas *atlas)
+{
+	ChunkWriter writer;
+	writer.writeU32(atlas->chartCount);
+	writer.writeU32(atlas->atlasCount);
+	writer.writeU32(atlas->width);
+	writer.writeU32(atlas->height);
+	writer.write(atlas->utilization, atlas->atlasCount * sizeof(float));
+	writer.writeU32(atlas->timeLimitedChartCount);
+	WriteChunk(stdout, kChunkStats, writer.payload);
+}
+
+static void WriteAtlasImages(const xatlas::Atlas *atlas, uint32_t firstAtlas)
+{
+	const uint32_t texelCount = atlas->width * atlas->height;
+	for (uint32_t i = 0; i < atlas->atlasCount; i++) {
+		ChunkWriter writer;
+		writer.writeU32(firstAtlas + i);
+		writer.writeU32(atlas->width);
+		writer.writeU32(atlas->height);
+		writer.write(&atlas->image[i * texelCount], texelCount * sizeof(uint32_t));
+		WriteChunk(stdout, kChunkImage, writer.payload);
+	}
+}
+
+// Wall clock seconds of each stage of a job.
+struct JobTimings
+{
+	double read = 0.0;
+	double addMeshes = 0.0;
+	double computeCharts = 0.0;
+	double packCharts = 0.0;
+	double write = 0.0;
+};
+
+static void WriteTimings(const JobTimings &timings)
+{
+	const std::pair<const char *, double> stages[] = {
+		{ "read", timings.read },
+		{ "addMeshes", timings.addMeshes },
+		{ "computeCharts", timings.computeCharts },
+		{ "packCharts", timings.packCharts },
+		{ "write", timings.write }
+	};
+	ChunkWriter writer;
+	writer.writeU32((uint32_t)(sizeof(stages) / sizeof(stages[0])));
+	for (const std::pair<const char *, double> &stage : stages) {
+		writer.writeString(stage.first);
+		writer.write(&stage.second, sizeof(double));
+	}
+	WriteChunk(stdout, kChunkTimings, writer.payload);
+}
+
+static uint64_t PeakMemoryBytes()
+{
+#ifdef _WIN32
+	PROCESS_MEMORY_COUNTERS counters;
+	if (!GetProcessMemoryInfo(GetCurrentProcess(), &counters, sizeof(counters)))
+		return 0;
+	return (uint64_t)counters.PeakWorkingSetSize;
+#else
+	struct rusage usage;
+	if (getrusage(RUSAGE_SELF, &usage) != 0)
+		return 0;
+#ifdef __APPLE__
+	return (uint64_t)usage.ru_maxrss;
+#else
+	return (uint64_t)usage.ru_maxrss * 1024; // kilobytes
+#endif
+#endif
+}
+
+static void WritePeakMemory()
+{
+	ChunkWriter writer;
+	const uint64_t peak = PeakMemoryBytes();
+	writer.write(&peak, sizeof(uint64_t));
+	WriteChunk(stdout, kChunkMemory, writer.payload);
+}
+
+// An extra resolution and padding to pack the same charts at.
+struct Target
+{
+	uint32_t resolution;
+	uint32_t padding;
+};
+
+struct Options
+{
+	xatlas::ChartOptions chartOptions;
+	xatlas::PackOptions packOptions;
+	AtlasLayout atlasLayout = AtlasLayout::overlap;
+	uint32_t firstAtlas = 0; // the spreadX or udim index of atlas 0
+	std::vector<Target> targets;
+	bool packOnly = false;
+	bool chartImage = false; // send xatlas::Atlas::image
+	bool incremental = false;
+	bool binary = false;
+	bool worker = false;
+	bool progress = false;
+	uint32_t threadCount = 0; // xatlas threads, 0 is one per hardware thread
+	std::vector<uint32_t> cpus; // pin the xatlas threads to these, all cpus when empty
+};
+
+// A cpu list like "0,2-5,8", the cpus are appended to cpus. False when it can't be read.
+static bool ParseCpuList(const char *list, std::vector<uint32_t> *cpus)
+{
+	std::istringstream iss(list);
+	std::string range;
+	while (std::getline(iss, range, ',')) {
+		unsigned first, last;
+		char dash;
+		std::istringstream rangeStream(range);
+		if (!(rangeStream >> first))
+			return false;
+		last = first;
+		if (rangeStream >> dash && (dash != '-' || !(rangeStream >> last) || last < first))
+			return false;
+		for (unsigned cpu = first; cpu <= last; cpu++)
+			cpus->push_back(cpu);
+	}
+	return true;
+}
+
+static void ParseOptions(int argc, char *argv[], Options *options)
+{
+	for (int counter = 1; counter < argc; counter++) {
+		//shared options-------------------------------------
+		//atlasLayout
+		if (STRICMP(argv[counter], "-atlasLayout") == 0 && counter + 1 < argc) {
+			if (STRICMP(argv[counter + 1], "OVERLAP")) {
+				options->atlasLayout = AtlasLayout::overlap;
 			}
-			//textureSeamWeight
-			if (checkArgumentFloat(argv, counter, "-textureSeamWeight")) {
-				chartOptions.textureSeamWeight = std::stof(argv[counter + 1]);
+			if (STRICMP(argv[counter + 1], "SPREADX") == 0) {
+				options->atlasLayout = AtlasLayout::spreadX;
 			}
-			//maxCost
-			if (checkArgumentFloat(argv, counter, "-maxCost")) {
-				chartOptions.maxCost = std::stof(argv[counter + 1]);
+			if (STRICMP(argv[counter + 1], "UDIM") == 0) {
+				options->atlasLayout = AtlasLayout::udim;
 			}
-			//maxIterations
-			if (checkArgumentInt(argv, counter, "-maxIterations")) {
-				chartOptions.maxIterations = atoi(argv[counter + 1]);
+		}
+		//first atlas of the layout
+		if (checkArgumentInt(argc, argv, counter, "-firstAtlas")) {
+			options->firstAtlas = (uint32_t)atoi(argv[counter + 1]);
+		}
+		//pack only
+		if (STRICMP(argv[counter], "-packOnly") == 0) {
+			options->packOnly = true;
+		}
+		//chart index image of each atlas
+		if (STRICMP(argv[counter], "-chartImage") == 0) {
+			options->chartImage = true;
+			options->packOptions.createImage = true;
+		}
+		//pack once for each target instead of at resolution/padding
+		if (checkArgumentInt(argc, argv, counter, "-target") && counter + 2 < argc) {
+			Target target;
+			target.resolution = (uint32_t)atoi(argv[counter + 1]);
+			target.padding = (uint32_t)atoi(argv[counter + 2]);
+			options->targets.push_back(target);
+		}
+		//only chart the meshes sent without charts
+		if (STRICMP(argv[counter], "-incremental") == 0) {
+			options->incremental = true;
+		}
+		//binary transport
+		if (STRICMP(argv[counter], "-binary") == 0) {
+			options->binary = true;
+		}
+		//progress chunks on stdout
+		if (STRICMP(argv[counter], "-progress") == 0) {
+			options->progress = true;
+		}
+		//xatlas thread count
+		if (checkArgumentInt(argc, argv, counter, "-threads")) {
+			const int threadCount = atoi(argv[counter + 1]);
+			options->threadCount = threadCount > 0 ? (uint32_t)threadCount : 0;
+		}
+		//pin the xatlas threads to a cpu set
+		if (STRICMP(argv[counter], "-cpus") == 0 && counter + 1 < argc) {
+			options->cpus.clear();
+			if (!ParseCpuList(argv[counter + 1], &options->cpus)) {
+				Print("Ignoring the cpu list '%s'\n", argv[counter + 1]);
+				options->cpus.clear();
 			}
 		}
+		//keep running and read jobs from stdin
+		if (STRICMP(argv[counter], "-worker") == 0) {
+			options->worker = true;
+			options->binary = true;
+		}
+
+		//pack options-------------------------------------
+		//resolution
+		if (checkArgumentInt(argc, argv, counter, "-resolution")) {
+			options->packOptions.resolution = atoi(argv[counter + 1]);
+		}
+		//padding
+		if (checkArgumentInt(argc, argv, counter, "-padding")) {
+			options->packOptions.padding = atoi(argv[counter + 1]);
+		}
+		//brute force
+		if (STRICMP(argv[counter], "-bruteForce") == 0) {
+			options->packOptions.bruteForce = true;
+		}
+		//bilinear
+		if (STRICMP(argv[counter], "-bilinear") == 0) {
+			options->packOptions.bilinear = true;
+		}
+		//blockAlign
+		if (STRICMP(argv[counter], "-blockAlign") == 0) {
+			options->packOptions.blockAlign = true;
+		}
+		//maxChartSize
+		if (checkArgumentInt(argc, argv, counter, "-maxChartSize")) {
+			options->packOptions.maxChartSize = atoi(argv[counter + 1]);
+		}
+		//texelsPerUnit
+		if (checkArgumentFloat(argc, argv, counter, "-texelsPerUnit")) {
+			options->packOptions.texelsPerUnit = std::stof(argv[counter + 1]);
+		}
+		//packTimeLimit
+		if (checkArgumentFloat(argc, argv, counter, "-packTimeLimit")) {
+			options->packOptions.timeLimit = std::stof(argv[counter + 1]);
+		}
+
+		//chart options-------------------------------------
+		//maxChartArea
+		if (checkArgumentFloat(argc, argv, counter, "-maxChartArea")) {
+			options->chartOptions.maxChartArea = std::stof(argv[counter + 1]);
+		}
+		//maxBoundaryLength
+		if (checkArgumentFloat(argc, argv, counter, "-maxBoundaryLength")) {
+			options->chartOptions.maxBoundaryLength = std::stof(argv[counter + 1]);
+		}
+		//normalDeviationWeight
+		if (checkArgumentFloat(argc, argv, counter, "-normalDeviationWeight")) {
+			options->chartOptions.normalDeviationWeight = std::stof(argv[counter + 1]);
+		}
+		//roundnessWeight
+		if (checkArgumentFloat(argc, argv, counter, "-roundnessWeight")) {
+			options->chartOptions.roundnessWeight = std::stof(argv[counter + 1]);
+		}
+		//straightnessWeight
+		if (checkArgumentFloat(argc, argv, counter, "-straightnessWeight")) {
+			options->chartOptions.straightnessWeight = std::stof(argv[counter + 1]);
+		}
+		//normalSeamWeight
+		if (checkArgumentFloat(argc, argv, counter, "-normalSeamWeight")) {
+			options->chartOptions.normalSeamWeight = std::stof(argv[counter + 1]);
+		}
+		//textureSeamWeight
+		if (checkArgumentFloat(argc, argv, counter, "-textureSeamWeight")) {
+			options->chartOptions.textureSeamWeight = std::stof(argv[counter + 1]);
+		}
+		//maxCost
+		if (checkArgumentFloat(argc, argv, counter, "-maxCost")) {
+			options->chartOptions.maxCost = std::stof(argv[counter + 1]);
+		}
+		//maxIterations
+		if (checkArgumentInt(argc, argv, counter, "-maxIterations")) {
+			options->chartOptions.maxIterations = atoi(argv[counter + 1]);
+		}
+	}
+}
+
+// Job options are the command line options plus the ARGS chunk of the job.
+static Options JobOptions(const Options &baseOptions, const std::vector<std::string> &arguments)
+{
+	Options options = baseOptions;
+	std::vector<char *> argv;
+	argv.push_back(const_cast<char *>("")); // Options start at argv[1].
+	for (size_t i = 0; i < arguments.size(); i++)
+		argv.push_back(const_cast<char *>(arguments[i].c_str()));
+	argv.push_back(nullptr);
+	ParseOptions((int)argv.size() - 1, argv.data(), &options);
+	return options;
+}
+
+static void WriteErrorChunk(const std::string &err)
+{
+	ChunkWriter writer;
+	writer.writeString(err);
+	WriteChunk(stdout, kChunkError, writer.payload);
+}
+
+static void WriteBinaryError(const std::string &err)
+{
+	fwrite(&kBinaryMagic, sizeof(uint32_t), 1, stdout);
+	WriteErrorChunk(err);
+	WriteChunk(stdout, kChunkEnd, std::vector<uint8_t>());
+}
+
+static xatlas::Atlas *CreateAtlas(const Options &options)
+{
+	return xatlas::Create(options.threadCount, options.cpus.data(), (uint32_t)options.cpus.size());
+}
+
+static bool JobCancelled(const JobOutput &output, xatlas::Atlas *atlas, std::string *err)
+{
+	if (!output.cancelled())
+		return false;
+	xatlas::Destroy(atlas);
+	*err = "cancelled";
+	return true;
+}
+
+static xatlas::MeshDecl MakeMeshDecl(const XabMesh &mesh)
+{
+	xatlas::MeshDecl meshDecl;
+	meshDecl.vertexCount = mesh.vertexCount;
+	meshDecl.vertexPositionData = mesh.positions;
+	meshDecl.vertexPositionStride = sizeof(float) * 3;
+	if (mesh.normals) {
+		meshDecl.vertexNormalData = mesh.normals;
+		meshDecl.vertexNormalStride = sizeof(float) * 3;
+	}
+	if (mesh.uvs) {
+		meshDecl.vertexUvData = mesh.uvs;
+		meshDecl.vertexUvStride = sizeof(float) * 2;
+	}
+	meshDecl.indexCount = mesh.indexCount;
+	meshDecl.indexData = mesh.indices;
+	meshDecl.indexFormat = xatlas::IndexFormat::UInt32;
+	return meshDecl;
+}
+
+// Incremental unwrap: a chart layout is the parameterization of every chart of a mesh in
+// world units, laid out so no two charts share uvs. Packing the layouts as uv meshes gives
+// the same texel density as unwrapping the meshes, so meshes that haven't changed send
+// their layout from the last unwrap and only the others are charted here. When none has a
+// layout the job is a normal unwrap and the layouts are read from its atlas instead.
+
+// The chart layouts of the meshes of a packed atlas, from texels back to world units. Extra
+// atlases are moved aside so they don't overlap.
+static void ReadChartLayouts(const xatlas::Atlas *atlas, const std::vector<XabMesh> &meshes, const std::vector<uint32_t> &shapes, std::vector<std::vector<float>> *charts)
+{
+	const float scale = 1.0f / atlas->texelsPerUnit;
+	for (uint32_t m = 0; m < atlas->meshCount; m++) {
+		const xatlas::Mesh &mesh = atlas->meshes[m];
+		std::vector<float> &layout = (*charts)[shapes[m]];
+		layout.assign(meshes[shapes[m]].vertexCount * 2, 0.0f);
+		for (uint32_t v = 0; v < mesh.vertexCount; v++) {
+			const xatlas::Vertex &vertex = mesh.vertexArray[v];
+			// -1 when the vertex wasn't packed, kept in the first atlas like AtlasLayoutOffset does
+			const int32_t atlasIndex = vertex.atlasIndex > 0 ? vertex.atlasIndex : 0;
+			layout[vertex.xref * 2 + 0] = (vertex.uv[0] + (float)(atlasIndex * (int32_t)(atlas->width + 1))) * scale;
+			layout[vertex.xref * 2 + 1] = vertex.uv[1] * scale;
+		}
 	}
+}
 
-	
+// Chart the meshes without a layout and pack them with the options of the job, so their
+// charts are padded and scaled like in a normal unwrap, then read their layouts.
+static bool ComputeChartLayouts(const Options &options, const xatlas::PackOptions &packOptions, const JobInput &input, JobOutput &output, std::vector<std::vector<float>> *charts, std::string *err)
+{
+	const std::vector<XabMesh> &meshes = input.meshes;
+	charts->assign(meshes.size(), std::vector<float>());
+	std::vector<uint32_t> chartedShapes;
+	for (uint32_t i = 0; i < (uint32_t)meshes.size(); i++) {
+		if (meshes[i].charts)
+			(*charts)[i].assign(meshes[i].charts, meshes[i].charts + meshes[i].vertexCount * 2);
+		else
+			chartedShapes.push_back(i);
+	}
+	Print("   Charting %u of %u meshes\n", (uint32_t)chartedShapes.size(), (uint32_t)meshes.size());
+	if (chartedShapes.empty())
+		return true;
+	xatlas::Atlas *atlas = CreateAtlas(options);
+	ProgressState progressState;
+	progressState.output = &output;
+	xatlas::SetProgressCallback(atlas, ProgressCallback, &progressState);
+	for (uint32_t i = 0; i < (uint32_t)chartedShapes.size(); i++) {
+		const XabMesh &mesh = meshes[chartedShapes[i]];
+		xatlas::AddMeshError::Enum error = xatlas::AddMesh(atlas, MakeMeshDecl(mesh), (uint32_t)chartedShapes.size());
+		if (error != xatlas::AddMeshError::Success) {
+			xatlas::Destroy(atlas);
+			*err = std::string("adding mesh '") + mesh.name + "': " + xatlas::StringForEnum(error);
+			return false;
+		}
+	}
+	xatlas::ComputeCharts(atlas, options.chartOptions);
+	if (JobCancelled(output, atlas, err))
+		return false;
+	// where the charts end up doesn't matter, only their size
+	xatlas::PackOptions layoutOptions = packOptions;
+	layoutOptions.bruteForce = false;
+	layoutOptions.createImage = false;
+	layoutOptions.usedTexels = nullptr;
+	layoutOptions.usedAtlasCount = 0;
+	xatlas::PackCharts(atlas, layoutOptions);
+	if (JobCancelled(output, atlas, err))
+		return false;
+	ReadChartLayouts(atlas, meshes, chartedShapes, charts);
+	xatlas::Destroy(atlas);
+	return true;
+}
 
+// In binary mode the caller writes the header before and the END chunk after the job.
+static bool RunJob(const Options &options, const JobInput &input, JobOutput &output, JobTimings *timings, std::string *err)
+{
+	const std::vector<XabMesh> &meshes = input.meshes;
 	// Load object file.
-	if (shapes.size() == 0) {
-		printf("Error: no shapes in obj file\n");
-		return EXIT_FAILURE;
+	if (meshes.size() == 0) {
+		*err = "no shapes in obj file";
+		return false;
 	}
-	printf("   %d shapes\n", (int)shapes.size());
-	// Create empty atlas.
+	if (options.incremental && !options.binary) {
+		*err = "-incremental needs -binary";
+		return false;
+	}
+	if (!options.targets.empty() && !options.binary) {
+		*err = "-target needs -binary";
+		return false;
+	}
+	if (options.progress && !options.binary) {
+		*err = "-progress needs -binary";
+		return false;
+	}
+	Print("   %d shapes\n", (int)meshes.size());
 	xatlas::SetPrint(Print, s_verbose);
-	xatlas::Atlas *atlas = xatlas::Create();
-	//atlas.height = packOptions.resolution;
-	//atlas.width = packOptions.resolution;
+	std::vector<Target> targets = options.targets;
+	if (targets.empty()) {
+		Target target;
+		target.resolution = options.packOptions.resolution;
+		target.padding = options.packOptions.padding;
+		targets.push_back(target);
+	}
+	// Only pack chart layouts when some were sent, else unwrap and read them afterwards.
+	bool packLayouts = false;
+	for (const XabMesh &mesh : meshes)
+		packLayouts = packLayouts || (options.incremental && mesh.charts);
+	WallTimer timer;
+	std::vector<std::vector<float>> charts;
+	if (packLayouts) {
+		xatlas::PackOptions layoutOptions = options.packOptions;
+		layoutOptions.resolution = targets[0].resolution;
+		layoutOptions.padding = targets[0].padding;
+		if (!ComputeChartLayouts(options, layoutOptions, input, output, &charts, err))
+			return false;
+	}
+	timings->computeCharts += timer.lap();
+	// Create empty atlas.
+	xatlas::Atlas *atlas = CreateAtlas(options);
+	//atlas.height = options.packOptions.resolution;
+	//atlas.width = options.packOptions.resolution;
 	// Set progress callback.
-	Stopwatch globalStopwatch, stopwatch;
-	xatlas::SetProgressCallback(atlas, ProgressCallback, &stopwatch);
+	Stopwatch globalStopwatch;
+	ProgressState progressState;
+	progressState.output = &output;
+	xatlas::SetProgressCallback(atlas, ProgressCallback, &progressState);
 	// Add meshes to atlas.
 	uint32_t totalVertices = 0, totalFaces = 0;
-	if (packOnly) {
-		for (int i = 0; i < (int)shapes.size(); i++) {
-			const tinyobj::mesh_t &objMesh = shapes[i].mesh;
+	if (options.packOnly || packLayouts) {
+		for (int i = 0; i < (int)meshes.size(); i++) {
+			const XabMesh &mesh = meshes[i];
+			// incremental packs the chart layouts instead of the mesh uvs
+			const float *texcoords = packLayouts ? charts[i].data() : mesh.uvs;
+			if (!texcoords || (packLayouts && charts[i].empty())) {
+				xatlas::Destroy(atlas);
+				*err = std::string("mesh '") + mesh.name + "' has no uvs to pack";
+				return false;
+			}
 			//xatlas::MeshDecl meshDecl;
 			xatlas::UvMeshDecl meshDecl;
-			meshDecl.vertexCount = (uint32_t)objMesh.positions.size() / 3;
-			meshDecl.vertexPositionData = objMesh.positions.data();
+			meshDecl.vertexCount = mesh.vertexCount;
+			meshDecl.vertexPositionData = mesh.positions;
 			meshDecl.vertexPositionStride = sizeof(float) * 3;
 			// don't provide normal data i
-			/*if (!objMesh.normals.empty()) {
-				meshDecl.vertexNormalData = objMesh.normals.data();
+			/*if (mesh.normals) {
+				meshDecl.vertexNormalData = mesh.normals;
 				meshDecl.vertexNormalStride = sizeof(float) * 3;
 			}*/
-			if (!objMesh.texcoords.empty()) {
-				meshDecl.vertexUvData = objMesh.texcoords.data();
-				meshDecl.vertexUvStride = sizeof(float) * 2;
-			}
-			meshDecl.indexCount = (uint32_t)objMesh.indices.size();
-			meshDecl.indexData = objMesh.indices.data();
+			meshDecl.vertexUvData = texcoords;
+			meshDecl.vertexUvStride = sizeof(float) * 2;
+			meshDecl.indexCount = mesh.indexCount;
+			meshDecl.indexData = mesh.indices;
 			meshDecl.indexFormat = xatlas::IndexFormat::UInt32;
-			//xatlas::AddMeshError::Enum error = xatlas::AddMesh(atlas, meshDecl, (uint32_t)shapes.size());
+			//xatlas::AddMeshError::Enum error = xatlas::AddMesh(atlas, meshDecl, (uint32_t)meshes.size());
 			xatlas::AddMeshError::Enum error = xatlas::AddUvMesh(atlas, meshDecl);
 			if (error != xatlas::AddMeshError::Success) {
 				xatlas::Destroy(atlas);
-				printf("\rError adding mesh %d '%s': %s\n", i, shapes[i].name.c_str(), xatlas::StringForEnum(error));
-				return EXIT_FAILURE;
+				*err = std::string("adding mesh '") + mesh.name + "': " + xatlas::StringForEnum(error);
+				return false;
 			}
 			totalVertices += meshDecl.vertexCount;
 			totalFaces += meshDecl.indexCount / 3;
 		}
 	}
 	else {
-		for (int i = 0; i < (int)shapes.size(); i++) {
-			const tinyobj::mesh_t &objMesh = shapes[i].mesh;
-			xatlas::MeshDecl meshDecl;
-			//xatlas::UvMeshDecl meshDecl;
-			meshDecl.vertexCount = (uint32_t)objMesh.positions.size() / 3;
-			meshDecl.vertexPositionData = objMesh.positions.data();
-			meshDecl.vertexPositionStride = sizeof(float) * 3;
-			// don't provide normal data i
-			if (!objMesh.normals.empty()) {
-				meshDecl.vertexNormalData = objMesh.normals.data();
-				meshDecl.vertexNormalStride = sizeof(float) * 3;
-			}
-			if (!objMesh.texcoords.empty()) {
-				meshDecl.vertexUvData = objMesh.texcoords.data();
-				meshDecl.vertexUvStride = sizeof(float) * 2;
-			}
-			meshDecl.indexCount = (uint32_t)objMesh.indices.size();
-			meshDecl.indexData = objMesh.indices.data();
-			meshDecl.indexFormat = xatlas::IndexFormat::UInt32;
-			xatlas::AddMeshError::Enum error = xatlas::AddMesh(atlas, meshDecl, (uint32_t)shapes.size());
+		for (int i = 0; i < (int)meshes.size(); i++) {
+			const xatlas::MeshDecl meshDecl = MakeMeshDecl(meshes[i]);
+			xatlas::AddMeshError::Enum error = xatlas::AddMesh(atlas, meshDecl, (uint32_t)meshes.size());
 			//xatlas::AddMeshError::Enum error = xatlas::AddUvMesh(atlas, meshDecl);
 			if (error != xatlas::AddMeshError::Success) {
 				xatlas::Destroy(atlas);
-				printf("\rError adding mesh %d '%s': %s\n", i, shapes[i].name.c_str(), xatlas::StringForEnum(error));
-				return EXIT_FAILURE;
+				*err = std::string("adding mesh '") + meshes[i].name + "': " + xatlas::StringForEnum(error);
+				return false;
 			}
 			totalVertices += meshDecl.vertexCount;
 			totalFaces += meshDecl.indexCount / 3;
 		}
 	}
 	xatlas::AddMeshJoin(atlas); // Not necessary. Only called here so geometry totals are printed after the AddMesh progress indicator.
-	printf("   %u total vertices\n", totalVertices);
-	printf("   %u total triangles\n", totalFaces);
+	timings->addMeshes += timer.lap();
+	Print("   %u total vertices\n", totalVertices);
+	Print("   %u total triangles\n", totalFaces);
 	// Generate atlas.
-	printf("Generating atlas\n");
-
-	
-	xatlas::Generate(atlas, chartOptions, packOptions);
-	printf("   %i pack res\n", packOptions.resolution);
-
-	printf("   %d charts\n", atlas->chartCount);
-	printf("   %d atlases\n", atlas->atlasCount);
-	for (uint32_t i = 0; i < atlas->atlasCount; i++)
-		printf("      %d: %0.2f%% utilization\n", i, atlas->utilization[i] * 100.0f);
-	printf("   %ux%u resolution\n", atlas->width, atlas->height);
-	totalVertices = totalFaces = 0;
-	for (uint32_t i = 0; i < atlas->meshCount; i++) {
-		const xatlas::Mesh &mesh = atlas->meshes[i];
-		totalVertices += mesh.vertexCount;
-		totalFaces += mesh.indexCount / 3;
+	Print("Generating atlas\n");
+	// Charts are computed once, every target packs them again.
+	xatlas::ComputeCharts(atlas, options.chartOptions);
+	if (JobCancelled(output, atlas, err))
+		return false;
+	timings->computeCharts += timer.lap();
+	if (options.binary) {
+		// send back the layouts that were computed so they can be reused
+		for (size_t i = 0; i < charts.size(); i++) {
+			if (meshes[i].charts)
+				charts[i].clear();
+		}
 	}
-	printf("   %u total vertices\n", totalVertices);
-	printf("   %u total triangles\n", totalFaces);
-	printf("%.2f seconds (%g ms) elapsed total\n", globalStopwatch.elapsed() / 1000.0, globalStopwatch.elapsed());
+	bool hasFixedUvs = false;
+	for (const XabMesh &mesh : meshes)
+		hasFixedUvs = hasFixedUvs || mesh.fixedTriangleCount > 0;
+	std::vector<uint8_t> usedTexels;
+	for (uint32_t t = 0; t < (uint32_t)targets.size(); t++) {
+		xatlas::PackOptions packOptions = options.packOptions;
+		packOptions.resolution = targets[t].resolution;
+		packOptions.padding = targets[t].padding;
+		if (hasFixedUvs) {
+			if (packOptions.resolution == 0 || packOptions.texelsPerUnit <= 0.0f) {
+				xatlas::Destroy(atlas);
+				*err = "packing around fixed uvs needs -resolution and -texelsPerUnit";
+				return false;
+			}
+			RasterizeFixedUvs(meshes, options.atlasLayout, options.firstAtlas, packOptions.resolution, &usedTexels, &packOptions.usedAtlasCount);
+			packOptions.usedTexels = usedTexels.data();
+			Print("   Packing around %u atlases of fixed uvs\n", packOptions.usedAtlasCount);
+		}
+		xatlas::PackCharts(atlas, packOptions);
+		if (JobCancelled(output, atlas, err))
+			return false;
+		timings->packCharts += timer.lap();
+		Print("   %i pack res\n", packOptions.resolution);
 
-	// Write meshes.
-	printf("STARTOBJ\n");
-	uint32_t firstVertex = 0;
-	for (uint32_t i = 0; i < atlas->meshCount; i++) {
-		const xatlas::Mesh &mesh = atlas->meshes[i];
-		printf("o %s\n", shapes[i].name.c_str());
-		//printf("cc %i\n", mesh.chartCount);
-		printf("s off\n");
-		for (uint32_t v = 0; v < mesh.vertexCount; v++) {
-			const xatlas::Vertex &vertex = mesh.vertexArray[v];
+		Print("   %d charts\n", atlas->chartCount);
+		Print("   %d atlases\n", atlas->atlasCount);
+		for (uint32_t i = 0; i < atlas->atlasCount; i++)
+			Print("      %d: %0.2f%% utilization\n", i, atlas->utilization[i] * 100.0f);
+		Print("   %ux%u resolution\n", atlas->width, atlas->height);
+		totalVertices = totalFaces = 0;
+		for (uint32_t i = 0; i < atlas->meshCount; i++) {
+			const xatlas::Mesh &mesh = atlas->meshes[i];
+			totalVertices += mesh.vertexCount;
+			totalFaces += mesh.indexCount / 3;
+		}
+		Print("   %u total vertices\n", totalVertices);
+		Print("   %u total triangles\n", totalFaces);
 
-			float xOffset = 0;
-			float yOffset = 0;
-			//spread the uv axis along the x-axis
-			if (vertex.atlasIndex > 0 && atlasLayout == AtlasLayout::spreadX) {
-				xOffset = (float)vertex.atlasIndex;
-			}
-			if (vertex.atlasIndex > 0 && atlasLayout == AtlasLayout::udim) {
-				int xRowOffset = vertex.atlasIndex % 10;
-				xOffset = (float)xRowOffset;
-				yOffset = (float)floor(vertex.atlasIndex / 10);
-			}
+		if (options.incremental && !packLayouts && t == 0) {
+			// every mesh was unwrapped, their layouts come from the first target
+			std::vector<uint32_t> shapes(meshes.size());
+			for (uint32_t i = 0; i < (uint32_t)meshes.size(); i++)
+				shapes[i] = i;
+			charts.assign(meshes.size(), std::vector<float>());
+			ReadChartLayouts(atlas, meshes, shapes, &charts);
+		}
+		// Write meshes.
+		output.atlas(t, atlas, options.incremental && t == 0 ? &charts : nullptr);
+		timings->write += timer.lap();
+	}
+	Print("%.2f seconds (%g ms) elapsed total\n", globalStopwatch.elapsed() / 1000.0, globalStopwatch.elapsed());
 
-			const float *pos = &shapes[i].mesh.positions[vertex.xref * 3];
-			//printf("v %g %g %g\n", pos[0], pos[1], pos[2]);
-			if (!shapes[i].mesh.normals.empty()) {
-				const float *normal = &shapes[i].mesh.normals[vertex.xref * 3];
-				//printf("vn %g %g %g\n", normal[0], normal[1], normal[2]);
-			}
-			printf("vt %g %g\n", (vertex.uv[0] / atlas->width) + xOffset, (vertex.uv[1] / atlas->height) + yOffset);
+	// Cleanup.
+	xatlas::Destroy(atlas);
+	Print("Done\n");
+	return true;
+}
+
+#ifdef XATLAS_BLENDER_LIBRARY
+// Output of the library, everything goes to the callbacks of xabRunJob.
+class LibraryOutput : public JobOutput
+{
+public:
+	LibraryOutput(const Options &options, XabProgressFunc progressFunc, XabAtlasFunc atlasFunc, void *userData) : m_options(options), m_progressFunc(progressFunc), m_atlasFunc(atlasFunc), m_userData(userData), m_cancelled(false) {}
+
+	bool progress(xatlas::ProgressCategory::Enum category, int progress) override
+	{
+		if (m_progressFunc && !m_progressFunc((uint32_t)category, (uint32_t)progress, m_userData))
+			m_cancelled = true;
+		return !m_cancelled;
+	}
+
+	bool cancelled() const override { return m_cancelled; }
+
+	void atlas(uint32_t target, const xatlas::Atlas *atlas, const std::vector<std::vector<float>> *newCharts) override
+	{
+		std::vector<const float *> charts(atlas->meshCount, nullptr);
+		for (uint32_t i = 0; newCharts && i < atlas->meshCount; i++) {
+			if (!(*newCharts)[i].empty())
+				charts[i] = (*newCharts)[i].data();
 		}
-			
-		for (uint32_t f = 0; f < mesh.indexCount; f += 3) {
-			printf("f ");
-			for (uint32_t j = 0; j < 3; j++) {
-				const uint32_t index = firstVertex + mesh.indexArray[f + j] + 1; // 1-indexed
-				printf("%d/%d/%d%c", index, index, index, j == 2 ? '\n' : ' ');
+		m_atlasFunc(target, (uint32_t)m_options.atlasLayout, m_options.firstAtlas, atlas, charts.data(), m_userData);
+	}
+
+private:
+	const Options &m_options;
+	XabProgressFunc m_progressFunc;
+	XabAtlasFunc m_atlasFunc;
+	void *m_userData;
+	// set from the xatlas threads
+	std::atomic<bool> m_cancelled;
+};
+
+XAB_API uint32_t xabVersion()
+{
+	return XAB_VERSION;
+}
+
+XAB_API bool xabSetLog(const char *path)
+{
+	FILE *log = stderr;
+	if (path) {
+		FOPEN(log, path, "a");
+		if (!log)
+			return false;
+	}
+	if (s_log != stderr)
+		fclose(s_log);
+	s_log = log;
+	return true;
+}
+
+XAB_API bool xabRunJob(const char *const *arguments, uint32_t argumentCount, const XabMesh *meshes, uint32_t meshCount, XabProgressFunc progressFunc, XabAtlasFunc atlasFunc, void *userData, XabTimings *timings, char *error, uint32_t errorSize)
+{
+	JobTimings jobTimings;
+	WallTimer timer;
+	JobInput input;
+	input.meshes.assign(meshes, meshes + meshCount);
+	input.arguments.assign(arguments, arguments + argumentCount);
+	Options options = JobOptions(Options(), input.arguments);
+	// the atlases go back as they are, everything -binary allows is allowed
+	options.binary = true;
+	jobTimings.read = timer.lap();
+	LibraryOutput output(options, progressFunc, atlasFunc, userData);
+	std::string err;
+	const bool succeeded = RunJob(options, input, output, &jobTimings, &err);
+	if (timings) {
+		timings->read = jobTimings.read;
+		timings->addMeshes = jobTimings.addMeshes;
+		timings->computeCharts = jobTimings.computeCharts;
+		timings->packCharts = jobTimings.packCharts;
+		timings->write = jobTimings.write;
+	}
+	if (!succeeded) {
+		Print("Error: %s\n", err.c_str());
+		if (error && errorSize > 0)
+			snprintf(error, errorSize, "%s", err.c_str());
+	}
+	return succeeded;
+}
+#else
+// Output of the executable: chunks with -binary, OBJ text without.
+class StreamOutput : public JobOutput
+{
+public:
+	StreamOutput(const Options &options, const JobInput &input) : m_options(options), m_input(input) {}
+
+	bool progress(xatlas::ProgressCategory::Enum category, int progress) override
+	{
+		if (m_options.progress)
+			WriteProgressChunk(category, progress);
+		return !s_cancel;
+	}
+
+	bool cancelled() const override { return s_cancel != 0; }
+
+	void atlas(uint32_t target, const xatlas::Atlas *atlas, const std::vector<std::vector<float>> *newCharts) override
+	{
+		if (!m_options.binary) {
+			WriteTextOutput(atlas, m_input.meshes, m_options.atlasLayout, m_options.firstAtlas);
+			return;
+		}
+		if (!m_options.targets.empty()) {
+			ChunkWriter writer;
+			writer.writeU32(target);
+			WriteChunk(stdout, kChunkTarget, writer.payload);
+		}
+		WriteAtlasStats(atlas);
+		if (m_options.chartImage && atlas->image)
+			WriteAtlasImages(atlas, m_options.firstAtlas);
+		WriteBinaryMeshes(atlas, m_input.meshes, m_options.atlasLayout, m_options.firstAtlas, newCharts);
+	}
+
+private:
+	const Options &m_options;
+	const JobInput &m_input;
+};
+
+static bool RunStreamJob(const Options &options, const JobInput &input, JobTimings *timings, std::string *err)
+{
+	StreamOutput output(options, input);
+	// The main thread runs tasks too, in the library it is the caller's and stays as it is.
+	if (!options.cpus.empty() && !xatlas::SetThreadAffinity(options.cpus.data(), (uint32_t)options.cpus.size()))
+		Print("Could not pin to the cpu set\n");
+	const bool succeeded = RunJob(options, input, output, timings, err);
+	fflush(stdout);
+	return succeeded;
+}
+
+int main(int argc, char *argv[])
+{
+	if (argc < 1) {
+	    printf("Usage: %s [options] < input\n", argv[0]);
+		printf("  Options:\n");
+		printf("    -verbose\n");  
+		printf("    -resolution\n");
+		printf("    -binary\n");
+		printf("    -worker\n");
+		printf("    -incremental\n");
+		printf("    -chartImage\n");
+		printf("    -target resolution padding\n");
+		printf("    -progress\n");
+		printf("    -threads count\n");
+		printf("    -cpus 0,2-5\n");
+		printf("    -firstAtlas index\n");
+		printf("    -packTimeLimit seconds\n");
+		printf("    -version\n");
+	    return 1;
+	}
+	// the addon checks this before it sends anything, so an older build fails with an error
+	for (int i = 1; i < argc; i++) {
+		if (STRICMP(argv[i], "-version") == 0) {
+			printf("xatlas-blender %d\n", XAB_VERSION);
+			return EXIT_SUCCESS;
+		}
+	}
+	//printf("Running xatlas\n");
+	// compare arg2 with -verbose
+	s_verbose = (argc >= 3 && STRICMP(argv[2], "-verbose") == 0);
+
+	//settings
+	//check all the arguments
+	Options options;
+	ParseOptions(argc, argv, &options);
+
+	JobInput input;
+	std::vector<tinyobj::material_t> materials;
+	std::string err;
+
+	if (options.binary) {
+		SET_BINARY_MODE(stdin);
+		SET_BINARY_MODE(stdout);
+	}
+
+#ifndef _WIN32
+	// SIGTERM cancels the running job instead of ending the process.
+	struct sigaction action;
+	memset(&action, 0, sizeof(action));
+	action.sa_handler = HandleTerminate;
+	action.sa_flags = SA_RESTART;
+	sigaction(SIGTERM, &action, nullptr);
+#endif
+
+	if (options.worker) {
+		Print("Worker waiting for jobs on stdin...\n");
+		for (;;) {
+			// stdin closed, nothing left to do
+			const int c = fgetc(stdin);
+			if (c == EOF)
+				break;
+			ungetc(c, stdin);
+			input.clear();
+			err.clear();
+			JobTimings timings;
+			WallTimer timer;
+			if (!LoadBinaryInput(stdin, input, err)) {
+				// the stream can't be trusted anymore
+				Print("Error: %s\n", err.c_str());
+				WriteBinaryError(err);
+				return EXIT_FAILURE;
 			}
+			// a cancel that came while waiting for or reading this job was meant for the last one
+			s_cancel = 0;
+			timings.read = timer.lap();
+			fwrite(&kBinaryMagic, sizeof(uint32_t), 1, stdout);
+			const bool succeeded = RunStreamJob(JobOptions(options, input.arguments), input, &timings, &err);
+			WriteTimings(timings);
+			WritePeakMemory();
+			if (!succeeded) {
+				Print("Error: %s\n", err.c_str());
+				WriteErrorChunk(err);
+			}
+			WriteChunk(stdout, kChunkEnd, std::vector<uint8_t>());
+			fflush(stdout);
 		}
-		firstVertex += mesh.vertexCount;
+		return EXIT_SUCCESS;
+	}
+
+	JobTimings timings;
+	WallTimer timer;
+	if (options.binary) {
+		Print("Loading Mesh from stdin (binary)...\n");
+		if (!LoadBinaryInput(stdin, input, err)) {
+			Print("Error: %s\n", err.c_str());
+			return EXIT_FAILURE;
+		}
+		options = JobOptions(options, input.arguments);
 	}
+	else {
+		std::string meshInput;
+		std::string line;
 
+		//read all the mesh input
+		while (std::getline(std::cin, line) && !line.empty()) {
+			meshInput.append(line);
+			meshInput.append("\n");
+		}
 
-	// Cleanup.
-	xatlas::Destroy(atlas);
-	printf("Done\n");
+		//printf("Loading '%s'...\n", argv[1]);
+		Print("Loading Mesh from stdin...\n");
+		if (!tinyobj::LoadObj(
+				input.shapes,
+				materials,
+				err,
+				meshInput,
+				tinyobj::triangulation
+		)) {
+			Print("Error: %s\n", err.c_str());
+			return EXIT_FAILURE;
+		}
+		input.setMeshes();
+	}
 
-	//flush the output
-	std::cout.flush();
+	//print the amount of shapes if working
+	//std::cout << (int)shapes.size() << std::endl;
 
-	return EXIT_SUCCESS;
+	timings.read = timer.lap();
+	if (options.binary)
+		fwrite(&kBinaryMagic, sizeof(uint32_t), 1, stdout);
+	const bool succeeded = RunStreamJob(options, input, &timings, &err);
+	if (!succeeded)
+		Print("Error: %s\n", err.c_str());
+	if (options.binary) {
+		WriteTimings(timings);
+		WritePeakMemory();
+		if (!succeeded)
+			WriteErrorChunk(err);
+		WriteChunk(stdout, kChunkEnd, std::vector<uint8_t>());
+		fflush(stdout);
+	}
+	return succeeded ? EXIT_SUCCESS : EXIT_FAILURE;
 }
+#endif
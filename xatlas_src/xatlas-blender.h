@@ -0,0 +1,77 @@
+/*
+C interface of xatlas-blender built as a shared library (XATLAS_BLENDER_LIBRARY).
+
+The addon loads it with ctypes to run jobs inside Blender instead of starting the
+executable. A job is the same as one of the executable, the options are parsed like its
+command line, but the meshes are read straight from the caller's arrays and every packed
+atlas is handed back as xatlas made it.
+*/
+#pragma once
+#ifndef XATLAS_BLENDER_H
+#define XATLAS_BLENDER_H
+#include <stdint.h>
+
+namespace xatlas {
+struct Atlas;
+}
+
+#ifdef _WIN32
+#define XAB_API extern "C" __declspec(dllexport)
+#else
+#define XAB_API extern "C" __attribute__((visibility("default")))
+#endif
+
+// Changes whenever anything below does.
+#define XAB_VERSION 4
+
+// One input mesh, the same as a MESH chunk. Nothing is copied, the arrays have to stay
+// alive until xabRunJob returns.
+struct XabMesh
+{
+	const char *name;
+	uint32_t vertexCount;
+	uint32_t indexCount;
+	const float *positions; // vertexCount * 3
+	const float *normals; // vertexCount * 3, or null
+	const float *uvs; // vertexCount * 2, or null
+	const float *charts; // vertexCount * 2 chart layout from an earlier -incremental job, or null
+	const uint32_t *indices; // indexCount
+	// Triangles that keep their lightmap uvs, laid out like the output: the atlases are not
+	// packed into the texels they cover. fixedTriangleCount * 3 * 2, or null.
+	uint32_t fixedTriangleCount;
+	const float *fixedUvs;
+};
+
+// Seconds spent in each stage of a job, the TIME chunk.
+struct XabTimings
+{
+	double read;
+	double addMeshes;
+	double computeCharts;
+	double packCharts;
+	double write;
+};
+
+// Called from the xatlas threads, category is a xatlas::ProgressCategory.
+// Returning false cancels the job.
+typedef bool (*XabProgressFunc)(uint32_t category, uint32_t progress, void *userData);
+
+// Called once for every target (0 without -target) with the packed atlas, which is only
+// valid during the call. atlasLayout is 0 overlap, 1 spreadX, 2 udim, with atlas 0 at
+// firstAtlas (-firstAtlas) of the spreadX and udim layouts. charts[i] is the chart
+// layout computed for mesh i with -incremental (vertexCount * 2), null for the meshes that
+// sent theirs and when there are none.
+typedef void (*XabAtlasFunc)(uint32_t target, uint32_t atlasLayout, uint32_t firstAtlas, const xatlas::Atlas *atlas, const float *const *charts, void *userData);
+
+XAB_API uint32_t xabVersion();
+
+// Appends the log and progress text to the file at path instead of stderr, back to stderr
+// when path is null. Returns false when the file can't be opened.
+XAB_API bool xabSetLog(const char *path);
+
+// Runs one job. Returns false when it failed, with the reason in error (cut to errorSize and
+// nul terminated), "cancelled" when progressFunc stopped it. Jobs can run on several threads
+// at once. progressFunc can be null.
+XAB_API bool xabRunJob(const char *const *arguments, uint32_t argumentCount, const XabMesh *meshes, uint32_t meshCount, XabProgressFunc progressFunc, XabAtlasFunc atlasFunc, void *userData, XabTimings *timings, char *error, uint32_t errorSize);
+
+#endif // XATLAS_BLENDER_H
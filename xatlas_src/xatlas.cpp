@@ -34,6 +34,7 @@ MIT License
 Copyright (c) 2012 Brandon Pelfrey
 */
 #include <atomic>
+#include <chrono>
 #include <condition_variable>
 #include <mutex>
 #include <thread>
@@ -66,6 +67,20 @@ Copyright (c) 2012 Brandon Pelfrey
 #define XA_MULTITHREADED 1
 #endif
 
+#if XA_MULTITHREADED
+#ifdef _WIN32
+#ifndef NOMINMAX
+#define NOMINMAX
+#endif
+#ifndef WIN32_LEAN_AND_MEAN
+#define WIN32_LEAN_AND_MEAN
+#endif
+#include <windows.h> // SetThreadAffinityMask
+#elif defined(__linux__)
+#include <sched.h> // sched_setaffinity
+#endif
+#endif
+
 #define XA_STR(x) #x
 #define XA_XSTR(x) XA_STR(x)
 
@@ -3802,21 +3817,55 @@ namespace xatlas {
 		};
 
 #if XA_MULTITHREADED
+		// Pins the calling thread to the cpus. Cpus the system doesn't have are left out, false when none are left
+		// or the platform can't pin threads.
+		static bool setThreadAffinity(const uint32_t *cpus, uint32_t cpuCount)
+		{
+#if defined(_WIN32)
+			DWORD_PTR mask = 0;
+			for (uint32_t i = 0; i < cpuCount; i++) {
+				if (cpus[i] < sizeof(DWORD_PTR) * 8)
+					mask |= (DWORD_PTR)1 << cpus[i];
+			}
+			return mask != 0 && SetThreadAffinityMask(GetCurrentThread(), mask) != 0;
+#elif defined(__linux__)
+			cpu_set_t set;
+			CPU_ZERO(&set);
+			for (uint32_t i = 0; i < cpuCount; i++) {
+				if (cpus[i] < CPU_SETSIZE)
+					CPU_SET(cpus[i], &set);
+			}
+			return CPU_COUNT(&set) != 0 && sched_setaffinity(0, sizeof(set), &set) == 0;
+#else
+			XA_UNUSED(cpus);
+			XA_UNUSED(cpuCount);
+			return false;
+#endif
+		}
+
 		class TaskScheduler
 		{
 		public:
-			TaskScheduler() : m_shutdown(false)
+			// threadCount includes the thread that waits on the task groups, 0 is one per hardware thread.
+			// The worker threads are pinned to the cpus, when there are any.
+			TaskScheduler(uint32_t threadCount, const uint32_t *cpus, uint32_t cpuCount) : m_shutdown(false)
 			{
 				m_threadIndex = 0;
+				if (threadCount == 0)
+					threadCount = max(1u, std::thread::hardware_concurrency());
+				m_threadCount = threadCount;
+				for (uint32_t i = 0; i < cpuCount; i++)
+					m_cpus.push_back(cpus[i]);
 				// Max with current task scheduler usage is 1 per thread + 1 deep nesting, but allow for some slop.
-				m_maxGroups = std::thread::hardware_concurrency() * 4;
+				m_maxGroups = m_threadCount * 4;
 				m_groups = XA_ALLOC_ARRAY(MemTag::Default, TaskGroup, m_maxGroups);
 				for (uint32_t i = 0; i < m_maxGroups; i++) {
 					new (&m_groups[i]) TaskGroup();
 					m_groups[i].free = true;
 					m_groups[i].ref = 0;
 				}
-				m_workers.resize(std::thread::hardware_concurrency() <= 1 ? 1 : std::thread::hardware_concurrency() - 1);
+				// With a single thread there are no workers, wait runs every task.
+				m_workers.resize(m_threadCount - 1);
 				for (uint32_t i = 0; i < m_workers.size(); i++) {
 					new (&m_workers[i]) Worker();
 					m_workers[i].wakeup = false;
@@ -3845,7 +3894,7 @@ namespace xatlas {
 
 			uint32_t threadCount() const
 			{
-				return max(1u, std::thread::hardware_concurrency()); // Including the main thread.
+				return m_threadCount; // Including the main thread.
 			}
 
 			TaskGroupHandle createTaskGroup(uint32_t reserveSize = 0)
@@ -3934,13 +3983,17 @@ namespace xatlas {
 
 			TaskGroup *m_groups;
 			Array<Worker> m_workers;
+			Array<uint32_t> m_cpus;
 			std::atomic<bool> m_shutdown;
 			uint32_t m_maxGroups;
+			uint32_t m_threadCount;
 			static thread_local uint32_t m_threadIndex;
 
 			static void workerThread(TaskScheduler *scheduler, Worker *worker, uint32_t threadIndex)
 			{
 				m_threadIndex = threadIndex;
+				if (!scheduler->m_cpus.isEmpty() && !setThreadAffinity(scheduler->m_cpus.data(), scheduler->m_cpus.size()))
+					XA_PRINT_WARNING("Worker thread %u could not be pinned to the cpu set\n", threadIndex);
 				std::unique_lock<std::mutex> lock(worker->mutex);
 				for (;;) {
 					worker->cv.wait(lock, [=] { return worker->wakeup.load(); });
@@ -3974,9 +4027,23 @@ namespace xatlas {
 
 		thread_local uint32_t TaskScheduler::m_threadIndex;
 #else
+		static bool setThreadAffinity(const uint32_t *cpus, uint32_t cpuCount)
+		{
+			XA_UNUSED(cpus);
+			XA_UNUSED(cpuCount);
+			return false;
+		}
+
 		class TaskScheduler
 		{
 		public:
+			TaskScheduler(uint32_t threadCount, const uint32_t *cpus, uint32_t cpuCount)
+			{
+				XA_UNUSED(threadCount);
+				XA_UNUSED(cpus);
+				XA_UNUSED(cpuCount);
+			}
+
 			~TaskScheduler()
 			{
 				for (uint32_t i = 0; i < m_groups.size(); i++)
@@ -4088,41 +4155,34 @@ namespace xatlas {
 		}
 #endif
 
+		// One T for each thread of the task scheduler.
 		template<typename T>
 		class ThreadLocal
 		{
 		public:
-			ThreadLocal()
+			ThreadLocal(const TaskScheduler *taskScheduler) : m_count(taskScheduler->threadCount())
 			{
-#if XA_MULTITHREADED
-				const uint32_t n = std::thread::hardware_concurrency();
-#else
-				const uint32_t n = 1;
-#endif
-				m_array = XA_ALLOC_ARRAY(MemTag::Default, T, n);
-				for (uint32_t i = 0; i < n; i++)
+				m_array = XA_ALLOC_ARRAY(MemTag::Default, T, m_count);
+				for (uint32_t i = 0; i < m_count; i++)
 					new (&m_array[i]) T;
 			}
 
 			~ThreadLocal()
 			{
-#if XA_MULTITHREADED
-				const uint32_t n = std::thread::hardware_concurrency();
-#else
-				const uint32_t n = 1;
-#endif
-				for (uint32_t i = 0; i < n; i++)
+				for (uint32_t i = 0; i < m_count; i++)
 					m_array[i].~T();
 				XA_FREE(m_array);
 			}
 
 			T &get() const
 			{
+				XA_DEBUG_ASSERT(TaskScheduler::currentThreadIndex() < m_count);
 				return m_array[TaskScheduler::currentThreadIndex()];
 			}
 
 		private:
 			T *m_array;
+			uint32_t m_count;
 		};
 
 		class UniformGrid2
@@ -8449,7 +8509,7 @@ namespace xatlas {
 					// One task per mesh.
 					const uint32_t meshCount = m_meshes.size();
 					Progress progress(ProgressCategory::ComputeCharts, progressFunc, progressUserData, meshCount);
-					ThreadLocal<segment::Atlas> atlas;
+					ThreadLocal<segment::Atlas> atlas(taskScheduler);
 					Array<MeshComputeChartFacesTaskArgs> taskArgs;
 					taskArgs.resize(meshCount);
 					for (uint32_t i = 0; i < meshCount; i++) {
@@ -8491,10 +8551,10 @@ namespace xatlas {
 					for (uint32_t i = 0; i < m_meshChartGroups.size(); i++)
 						chartGroupCount += m_meshChartGroups[i].size();
 					Progress progress(ProgressCategory::ParameterizeCharts, progressFunc, progressUserData, chartGroupCount);
-					ThreadLocal<UniformGrid2> boundaryGrid; // For Quality boundary intersection.
-					ThreadLocal<ChartCtorBuffers> chartBuffers;
+					ThreadLocal<UniformGrid2> boundaryGrid(taskScheduler); // For Quality boundary intersection.
+					ThreadLocal<ChartCtorBuffers> chartBuffers(taskScheduler);
 #if XA_RECOMPUTE_CHARTS
-					ThreadLocal<PiecewiseParam> piecewiseParam;
+					ThreadLocal<PiecewiseParam> piecewiseParam(taskScheduler);
 #endif
 					Array<ParameterizeChartsTaskArgs> taskArgs;
 					taskArgs.resize(chartGroupCount);
@@ -8748,6 +8808,7 @@ namespace xatlas {
 				float getTexelsPerUnit() const { return m_texelsPerUnit; }
 				const Chart *getChart(uint32_t index) const { return m_charts[index]; }
 				uint32_t getChartCount() const { return m_charts.size(); }
+				uint32_t getTimeLimitedChartCount() const { return m_timeLimitedChartCount; }
 				const Array<AtlasImage *> &getImages() const { return m_atlasImages; }
 				float getUtilization(uint32_t atlas) const { return m_utilization[atlas]; }
 
@@ -8769,7 +8830,7 @@ namespace xatlas {
 					taskArgs.resize(chartCount);
 					TaskGroupHandle taskGroup = taskScheduler->createTaskGroup(chartCount);
 					uint32_t chartIndex = 0;
-					ThreadLocal<BoundingBox2D> boundingBox;
+					ThreadLocal<BoundingBox2D> boundingBox(taskScheduler);
 					for (uint32_t i = 0; i < paramAtlas->meshCount(); i++) {
 						const uint32_t chartGroupsCount = paramAtlas->chartGroupCount(i);
 						for (uint32_t j = 0; j < chartGroupsCount; j++) {
@@ -8808,15 +8869,17 @@ namespace xatlas {
 						chart->vertexCount = uvChart->vertices.size();
 						chart->allowRotate = mesh->rotateCharts;
 						chart->boundaryEdges = nullptr;
+						// Packing transforms the texcoords in place, restore them so PackCharts can be called again (like param::Chart::restoreTexcoords).
+						for (uint32_t v = 0; v < chart->vertexCount; v++)
+							chart->vertices[v] = mesh->mesh->mesh->texcoord(uvChart->vertices[v]);
 						// Compute parametric and surface areas.
 						chart->parametricArea = 0.0f;
 						for (uint32_t f = 0; f < chart->indexCount / 3; f++) {
 							const Vector2 &v1 = chart->vertices[chart->indices[f * 3 + 0]];
 							const Vector2 &v2 = chart->vertices[chart->indices[f * 3 + 1]];
 							const Vector2 &v3 = chart->vertices[chart->indices[f * 3 + 2]];
-							chart->parametricArea += fabsf(triangleArea(v1, v2, v3));
+							chart->parametricArea += fabsf(triangleArea(v1, v2, v3)); // Already halved.
 						}
-						chart->parametricArea *= 0.5f;
 						if (chart->parametricArea < kAreaEpsilon) {
 							// When the parametric area is too small we use a rough approximation to prevent divisions by very small numbers.
 							Vector2 minCorner(FLT_MAX, FLT_MAX);
@@ -8864,7 +8927,7 @@ namespace xatlas {
 					// Estimate resolution and/or texels per unit if not specified.
 					m_texelsPerUnit = options.texelsPerUnit;
 
-					printf("%i\n", options.resolution);
+					XA_PRINT("   Packing at %u resolution\n", options.resolution);
 
 					uint32_t resolution = options.resolution > 0 ? options.resolution + options.padding * 2 : 0;
 					const uint32_t maxResolution = m_texelsPerUnit > 0.0f ? resolution : 0;
@@ -9004,8 +9067,20 @@ namespace xatlas {
 					Array<Vector2i> atlasSizes;
 					atlasSizes.push_back(Vector2i(0, 0));
 					int progress = 0;
+					// Brute force placement until options.timeLimit passes, random placement for the remaining charts.
+					const std::chrono::steady_clock::time_point packStart = std::chrono::steady_clock::now();
+					bool bruteForce = options.bruteForce;
+					m_timeLimitedChartCount = 0;
 					for (uint32_t i = 0; i < chartCount; i++) {
 						uint32_t c = ranks[chartCount - i - 1]; // largest chart first
+						if (bruteForce && options.timeLimit > 0.0f) {
+							const std::chrono::duration<float> elapsed = std::chrono::steady_clock::now() - packStart;
+							if (elapsed.count() > options.timeLimit) {
+								XA_PRINT("   Pack time limit of %g seconds passed, placing the remaining %u charts without brute force\n", options.timeLimit, chartCount - i);
+								bruteForce = false;
+								m_timeLimitedChartCount = chartCount - i;
+							}
+						}
 						Chart *chart = m_charts[c];
 						// @@ Add special cases for dot and line charts. @@ Lightmap rasterizer also needs to handle these special cases.
 						// @@ We could also have a special case for chart quads. If the quad surface <= 4 texels, align vertices with texel centers and do not add padding. May be very useful for foliage.
@@ -9064,7 +9139,7 @@ namespace xatlas {
 						}
 						XA_PROFILE_END(packChartsRasterize)
 							// Update brute force bucketing.
-							if (options.bruteForce) {
+							if (bruteForce) {
 								if (chartOrderArray[c] > minChartPerimeter && chartOrderArray[c] <= maxChartPerimeter - (chartPerimeterBucketSize * (currentChartBucket + 1))) {
 									// Moved to a smaller bucket, reset start location.
 									for (uint32_t j = 0; j < chartStartPositions.size(); j++)
@@ -9100,13 +9175,15 @@ namespace xatlas {
 								m_bitImages.push_back(bi);
 								atlasSizes.push_back(Vector2i(0, 0));
 								firstChartInBitImage = true;
+								if (maxResolution > 0 && options.usedTexels && currentAtlas < options.usedAtlasCount && addUsedTexels(options, currentAtlas, bi, &atlasSizes[currentAtlas]))
+									firstChartInBitImage = false;
 								if (createImage)
 									m_atlasImages.push_back(XA_NEW_ARGS(MemTag::Default, AtlasImage, resolution, resolution));
 								// Start positions are per-atlas, so create a new one of those too.
 								chartStartPositions.push_back(Vector2i(0, 0));
 							}
 							XA_PROFILE_START(packChartsFindLocation)
-								const bool foundLocation = findChartLocation(chartStartPositions[currentAtlas], options.bruteForce, m_bitImages[currentAtlas], chartImageToPack, chartImageToPackRotated, atlasSizes[currentAtlas].x, atlasSizes[currentAtlas].y, &best_x, &best_y, &best_cw, &best_ch, &best_r, options.blockAlign, maxResolution, chart->allowRotate);
+								const bool foundLocation = findChartLocation(chartStartPositions[currentAtlas], bruteForce, m_bitImages[currentAtlas], chartImageToPack, chartImageToPackRotated, atlasSizes[currentAtlas].x, atlasSizes[currentAtlas].y, &best_x, &best_y, &best_cw, &best_ch, &best_r, options.blockAlign, maxResolution, chart->allowRotate);
 							XA_PROFILE_END(packChartsFindLocation)
 								XA_DEBUG_ASSERT(!(firstChartInBitImage && !foundLocation)); // Chart doesn't fit in an empty, newly allocated bitImage. Shouldn't happen, since charts are resized if they are too big to fit in the atlas.
 							if (maxResolution == 0) {
@@ -9119,7 +9196,7 @@ namespace xatlas {
 							currentAtlas++;
 						}
 						// Update brute force start location.
-						if (options.bruteForce) {
+						if (bruteForce) {
 							// Reset start location if the chart expanded the atlas.
 							if (best_x + best_cw > atlasSizes[currentAtlas].x || best_y + best_ch > atlasSizes[currentAtlas].y) {
 								for (uint32_t j = 0; j < chartStartPositions.size(); j++)
@@ -9240,6 +9317,30 @@ namespace xatlas {
 				// is occupied at this point. At the end we have many small charts and a large atlas with sparse holes. Finding those holes randomly is slow. A better approach would be to
 				// start stacking large charts as if they were tetris pieces. Once charts get small try to place them randomly. It may be interesting to try a intermediate strategy, first try
 				// along one axis and then try exhaustively along that axis.
+				// Sets the texels of atlasIndex that PackOptions::usedTexels has as taken, dilated by the padding like the charts are, and
+				// grows extents to cover them. Returns false when there are none.
+				bool addUsedTexels(const PackOptions &options, uint32_t atlasIndex, BitImage *bitImage, Vector2i *extents)
+				{
+					const uint32_t resolution = options.resolution;
+					const uint8_t *texels = options.usedTexels + (size_t)atlasIndex * resolution * resolution;
+					int maxX = -1, maxY = -1;
+					for (uint32_t y = 0; y < resolution; y++) {
+						for (uint32_t x = 0; x < resolution; x++) {
+							if (!texels[x + y * resolution])
+								continue;
+							bitImage->set(x + options.padding, y + options.padding);
+							maxX = max(maxX, (int)x);
+							maxY = max(maxY, (int)y);
+						}
+					}
+					if (maxX < 0)
+						return false;
+					bitImage->dilate(options.padding);
+					extents->x = min((int)bitImage->width(), maxX + 1 + (int)options.padding * 2);
+					extents->y = min((int)bitImage->height(), maxY + 1 + (int)options.padding * 2);
+					return true;
+				}
+
 				bool findChartLocation(const Vector2i &startPosition, bool bruteForce, const BitImage *atlasBitImage, const BitImage *chartBitImage, const BitImage *chartBitImageRotated, int w, int h, int *best_x, int *best_y, int *best_w, int *best_h, int *best_r, bool blockAligned, uint32_t maxResolution, bool allowRotate)
 				{
 					const int attempts = 4096;
@@ -9453,6 +9554,7 @@ namespace xatlas {
 				uint32_t m_width = 0;
 				uint32_t m_height = 0;
 				float m_texelsPerUnit = 0.0f;
+				uint32_t m_timeLimitedChartCount = 0;
 				KISSRng m_rand;
 			};
 
@@ -9475,13 +9577,23 @@ namespace xatlas {
 	};
 
 	Atlas *Create()
+	{
+		return Create(0);
+	}
+
+	Atlas *Create(uint32_t threadCount, const uint32_t *cpus, uint32_t cpuCount)
 	{
 		Context *ctx = XA_NEW(internal::MemTag::Default, Context);
 		memset(&ctx->atlas, 0, sizeof(Atlas));
-		ctx->taskScheduler = XA_NEW(internal::MemTag::Default, internal::TaskScheduler);
+		ctx->taskScheduler = XA_NEW_ARGS(internal::MemTag::Default, internal::TaskScheduler, threadCount, cpus, cpuCount);
 		return &ctx->atlas;
 	}
 
+	bool SetThreadAffinity(const uint32_t *cpus, uint32_t cpuCount)
+	{
+		return internal::setThreadAffinity(cpus, cpuCount);
+	}
+
 	static void DestroyOutputMeshes(Context *ctx)
 	{
 		if (!ctx->atlas.meshes)
@@ -10167,6 +10279,10 @@ namespace xatlas {
 			XA_PRINT_WARNING("PackCharts: PackOptions::texelsPerUnit is negative.\n");
 			packOptions.texelsPerUnit = 0.0f;
 		}
+		if (packOptions.timeLimit < 0.0f) {
+			XA_PRINT_WARNING("PackCharts: PackOptions::timeLimit is negative.\n");
+			packOptions.timeLimit = 0.0f;
+		}
 		// Cleanup atlas.
 		DestroyOutputMeshes(ctx);
 		if (atlas->utilization) {
@@ -10178,6 +10294,7 @@ namespace xatlas {
 			atlas->image = nullptr;
 		}
 		atlas->meshCount = 0;
+		atlas->timeLimitedChartCount = 0;
 		// Pack charts.
 		XA_PROFILE_START(packChartsAddCharts)
 			internal::pack::Atlas packAtlas;
@@ -10198,6 +10315,7 @@ namespace xatlas {
 		atlas->width = packAtlas.getWidth();
 		atlas->height = packAtlas.getHeight();
 		atlas->texelsPerUnit = packAtlas.getTexelsPerUnit();
+		atlas->timeLimitedChartCount = packAtlas.getTimeLimitedChartCount();
 		if (atlas->atlasCount > 0) {
 			atlas->utilization = XA_ALLOC_ARRAY(internal::MemTag::Default, float, atlas->atlasCount);
 			for (uint32_t i = 0; i < atlas->atlasCount; i++)
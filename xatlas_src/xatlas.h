@@ -94,11 +94,19 @@ namespace xatlas {
 		uint32_t meshCount; // Number of output meshes. Equal to the number of times AddMesh was called.
 		float *utilization; // Normalized atlas texel utilization array. E.g. a value of 0.8 means 20% empty space. atlasCount in length.
 		float texelsPerUnit; // Equal to PackOptions texelsPerUnit if texelsPerUnit > 0, otherwise an estimated value to match PackOptions resolution.
+		uint32_t timeLimitedChartCount; // Number of charts placed without brute force because PackOptions timeLimit passed.
 	};
 
 	// Create an empty atlas.
 	Atlas *Create();
 
+	// Create an empty atlas that runs on threadCount threads, counting the one calling into xatlas. 0 is one per
+	// hardware thread. The worker threads are pinned to the cpuCount cpus in cpus, the calling thread is left as it is.
+	Atlas *Create(uint32_t threadCount, const uint32_t *cpus = nullptr, uint32_t cpuCount = 0);
+
+	// Pin the calling thread to the cpus. False when none of them exist or the platform can't pin threads.
+	bool SetThreadAffinity(const uint32_t *cpus, uint32_t cpuCount);
+
 	void Destroy(Atlas *atlas);
 
 	struct IndexFormat
@@ -223,6 +231,16 @@ namespace xatlas {
 		// If not 0, and texelsPerUnit is not 0, generate one or more atlases with that exact resolution.
 		// If not 0, and texelsPerUnit is 0, texelsPerUnit is estimated to approximately match the resolution.
 		uint32_t resolution = 0;
+
+		// Seconds the brute force placement may take. Once they pass, the remaining charts use the random chart placement.
+		// 0 means no limit.
+		float timeLimit = 0.0f;
+
+		// Texels that are taken already, like by charts packed before, the charts are packed around them.
+		// usedAtlasCount atlases of resolution * resolution bytes each, rows from y = 0, non-zero is taken.
+		// Only used when resolution and texelsPerUnit are both set.
+		const uint8_t *usedTexels = nullptr;
+		uint32_t usedAtlasCount = 0;
 	};
 
 	// Call after ComputeCharts. Can be called multiple times to re-pack charts with different options.